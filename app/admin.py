@@ -1,10 +1,20 @@
 from django.contrib import admin
+from django.contrib.contenttypes.prefetch import GenericPrefetch
+from django.utils import timezone
 from .models import (
     Disaster, Category, Need, Organization, Resource, 
-    Field, Photo, Comment, Report, ChangeLog, Problem, Service
+    Field, Photo, Comment, Report, ChangeLog, Problem, Service, ProfilingConfig, Task
 )
 
 
+def with_content_objects(queryset):
+    """Prefetch the content_object shown in the list, and what its __str__ follows."""
+    return queryset.prefetch_related(GenericPrefetch('content_object', [
+        Need.objects.select_related('category'),
+        Resource.objects.select_related('need__category', 'provider_user', 'provider_organization'),
+    ]))
+
+
 @admin.register(Disaster)
 class DisasterAdmin(admin.ModelAdmin):
     list_display = ['name', 'severity', 'start_date', 'end_date', 'created_by', 'created_at']
@@ -39,13 +49,14 @@ class CategoryAdmin(admin.ModelAdmin):
 @admin.register(Need)
 class NeedAdmin(admin.ModelAdmin):
     list_display = ['title', 'disaster', 'category', 'entry_type', 'status', 'priority', 'is_verified', 'created_at']
-    list_filter = ['status', 'priority', 'category__category_type', 'category', 'is_verified', 'is_flagged', 'created_at']
+    list_select_related = ['disaster', 'category']
+    list_filter = ['status', 'priority', 'category_type', 'category', 'is_verified', 'is_flagged', 'geocoded', 'created_at']
     search_fields = ['title', 'description', 'location']
     raw_id_fields = ['reported_by', 'assigned_to', 'verified_by']
-    readonly_fields = ['flag_count']
+    readonly_fields = ['flag_count', 'geocoded']
     
     def entry_type(self, obj):
-        return obj.entry_type.title() if obj.category else 'Unknown'
+        return obj.category_type.title() or 'Unknown'
     entry_type.short_description = 'Type'
 
 
@@ -60,6 +71,7 @@ class OrganizationAdmin(admin.ModelAdmin):
 @admin.register(Resource)
 class ResourceAdmin(admin.ModelAdmin):
     list_display = ['need', 'provider_name', 'status', 'is_verified', 'created_at']
+    list_select_related = ['need__category', 'provider_user', 'provider_organization']
     list_filter = ['status', 'is_verified', 'is_flagged']
     search_fields = ['description']
     raw_id_fields = ['provider_user', 'provider_organization', 'verified_by']
@@ -69,6 +81,7 @@ class ResourceAdmin(admin.ModelAdmin):
 @admin.register(Field)
 class FieldAdmin(admin.ModelAdmin):
     list_display = ['need', 'key', 'value', 'field_type']
+    list_select_related = ['need__category']
     list_filter = ['field_type']
     search_fields = ['key', 'value']
 
@@ -76,6 +89,7 @@ class FieldAdmin(admin.ModelAdmin):
 @admin.register(Photo)
 class PhotoAdmin(admin.ModelAdmin):
     list_display = ['need', 'caption', 'uploaded_by', 'uploaded_at']
+    list_select_related = ['need__category', 'uploaded_by']
     list_filter = ['uploaded_at']
     raw_id_fields = ['uploaded_by']
 
@@ -83,6 +97,7 @@ class PhotoAdmin(admin.ModelAdmin):
 @admin.register(Comment)
 class CommentAdmin(admin.ModelAdmin):
     list_display = ['need', 'user', 'is_status_update', 'created_at']
+    list_select_related = ['need__category', 'user']
     list_filter = ['is_status_update', 'created_at']
     search_fields = ['text']
     raw_id_fields = ['user']
@@ -91,22 +106,31 @@ class CommentAdmin(admin.ModelAdmin):
 @admin.register(Report)
 class ReportAdmin(admin.ModelAdmin):
     list_display = ['content_object', 'report_type', 'status', 'reported_by', 'created_at']
+    list_select_related = ['reported_by']
     list_filter = ['report_type', 'status', 'created_at']
     search_fields = ['description']
     raw_id_fields = ['reported_by', 'reviewed_by']
+    
+    def get_queryset(self, request):
+        return with_content_objects(super().get_queryset(request))
 
 
 @admin.register(ChangeLog)
 class ChangeLogAdmin(admin.ModelAdmin):
     list_display = ['content_object', 'action', 'user', 'timestamp']
+    list_select_related = ['user']
     list_filter = ['action', 'timestamp']
     raw_id_fields = ['user']
     readonly_fields = ['content_type', 'object_id', 'field_changes']
+    
+    def get_queryset(self, request):
+        return with_content_objects(super().get_queryset(request))
 
 
 @admin.register(Problem)
 class ProblemAdmin(admin.ModelAdmin):
     list_display = ['need', 'severity', 'affected_population', 'infrastructure_type']
+    list_select_related = ['need__category']
     list_filter = ['severity', 'infrastructure_type']
     search_fields = ['need__title', 'infrastructure_type', 'blocks_access_to']
     raw_id_fields = ['need']
@@ -116,6 +140,7 @@ class ProblemAdmin(admin.ModelAdmin):
 @admin.register(Service)
 class ServiceAdmin(admin.ModelAdmin):
     list_display = ['need', 'service_type', 'capacity', 'current_occupancy', 'availability_percentage', 'provider_organization']
+    list_select_related = ['need__category', 'provider_organization']
     list_filter = ['service_type', 'provider_organization']
     search_fields = ['need__title', 'eligibility_criteria', 'requirements']
     raw_id_fields = ['need', 'provider_organization']
@@ -127,3 +152,36 @@ class ServiceAdmin(admin.ModelAdmin):
             return 'N/A'
         return f'{percentage:.1f}%'
     availability_percentage.short_description = 'Capacity Used'
+
+
+@admin.register(ProfilingConfig)
+class ProfilingConfigAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'routes', 'sample_every', 'slow_query_ms', 'until', 'updated_at']
+    readonly_fields = ['updated_at']
+    
+    def has_add_permission(self, request):
+        # app.profiling reads the one row
+        return super().has_add_permission(request) and not ProfilingConfig.objects.exists()
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ['name', 'status', 'priority', 'attempts', 'run_after', 'finished_at', 'created_at']
+    list_filter = ['status', 'name']
+    search_fields = ['name', 'last_error']
+    readonly_fields = [
+        'name', 'kwargs', 'status', 'attempts', 'max_attempts', 'locked_by',
+        'started_at', 'finished_at', 'last_error', 'created_at',
+    ]
+    actions = ['retry']
+    
+    def has_add_permission(self, request):
+        # Tasks are queued by the code, see app.tasks
+        return False
+    
+    @admin.action(description='Retry selected tasks now')
+    def retry(self, request, queryset):
+        count = queryset.filter(status=Task.FAILED).update(
+            status=Task.QUEUED, attempts=0, run_after=timezone.now(), finished_at=None,
+        )
+        self.message_user(request, f'{count} failed tasks queued again.')
@@ -0,0 +1,190 @@
+"""Repeatable latency benchmarks for the public views and APIs.
+
+Every route in ``app.urls`` has at least one scenario: a request made
+through the Django test client with representative parameters. For each
+dataset size the benchmark database is grown to that many needs with
+``app.loadgen``, analyzed, and every scenario is requested ``warmup`` times
+and then timed ``repeat`` times. Each scenario records:
+
+- latency percentiles
+- the number of queries one request makes
+- the response size
+
+The cache is cleared before every request, so pages are measured as they
+are built rather than as they come out of the page cache.
+
+Results are plain JSON keyed by size and scenario. ``compare()`` checks a
+run against a saved baseline and lists the scenarios that got slower by
+more than a threshold, or that now make more queries.
+"""
+import datetime
+import math
+import statistics
+import time
+from typing import NamedTuple
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+
+from . import urls
+from .models import Disaster, Need, Resource
+
+WARMUP = 2
+REPEAT = 20
+# Relative slowdown of the median that compare() reports
+THRESHOLD = 0.25
+# Slowdowns smaller than this are noise whatever their ratio
+NOISE_MS = 2.0
+
+
+class Fixture(NamedTuple):
+    """Objects the scenarios' URLs point at."""
+    need_id: int
+    resource_id: int
+    disaster_id: int
+    disaster_slug: str
+    since: str
+
+
+class Scenario(NamedTuple):
+    name: str
+    url_name: str
+    # Callables of the Fixture, or None
+    kwargs: object = None
+    query: object = None
+
+    def url(self, fixture):
+        kwargs = self.kwargs(fixture) if self.kwargs else {}
+        return reverse(f'app:{self.url_name}', kwargs=kwargs)
+
+    def params(self, fixture):
+        return self.query(fixture) if self.query else {}
+
+
+# Sindh at country zoom, and central Jacobabad at street zoom
+SINDH_BBOX = '66.5,23.5,71.5,29.0'
+JACOBABAD_BBOX = '68.40,28.25,68.48,28.31'
+
+SCENARIOS = [
+    Scenario('home', 'home'),
+    Scenario('needs_list', 'needs_list'),
+    Scenario('needs_list_filtered', 'needs_list',
+             query=lambda f: {'type': 'problem', 'disaster': f.disaster_id}),
+    Scenario('needs_list_search', 'needs_list', query=lambda f: {'search': 'water jacobabad'}),
+    Scenario('need_detail', 'need_detail', kwargs=lambda f: {'need_id': f.need_id}),
+    Scenario('problems_list', 'problems_list', query=lambda f: {'priority': 'urgent'}),
+    Scenario('services_list', 'services_list'),
+    Scenario('map_view', 'map_view'),
+    Scenario('map_data_clusters', 'map_data_api', query=lambda f: {'bbox': SINDH_BBOX, 'zoom': 7}),
+    Scenario('map_data_street', 'map_data_api', query=lambda f: {'bbox': JACOBABAD_BBOX, 'zoom': 15}),
+    Scenario('map_data_page', 'map_data_api', query=lambda f: {'limit': 100}),
+    Scenario('map_tile_clusters', 'map_tile_api', kwargs=lambda f: {'z': 6, 'x': 44, 'y': 27}),
+    Scenario('map_tile_street', 'map_tile_api', kwargs=lambda f: {'z': 13, 'x': 5653, 'y': 3424}),
+    Scenario('nearby', 'nearby_api', query=lambda f: {'lat': 28.28, 'lng': 68.44, 'radius': 10}),
+    Scenario('export_ndjson', 'export_needs',
+             query=lambda f: {'format': 'ndjson', 'type': 'information', 'disaster': f.disaster_id}),
+    Scenario('sync_first', 'sync_api', query=lambda f: {'limit': 500}),
+    Scenario('sync_delta', 'sync_api', query=lambda f: {'since': f.since}),
+    Scenario('live_catch_up', 'live_map_events'),
+    Scenario('resources_list', 'resources_list'),
+    Scenario('resource_detail', 'resource_detail', kwargs=lambda f: {'resource_id': f.resource_id}),
+    Scenario('disasters_list', 'disasters_list'),
+    Scenario('disaster_detail', 'disaster_detail', kwargs=lambda f: {'disaster_slug': f.disaster_slug}),
+]
+
+
+def uncovered_routes():
+    """Names of the routes in app.urls without a scenario."""
+    names = {pattern.name for pattern in urls.urlpatterns if isinstance(pattern, URLPattern)}
+    return names - {scenario.url_name for scenario in SCENARIOS}
+
+
+def make_fixture():
+    need = Need.objects.geolocated().filter(status='open').order_by('-created_at', '-id').first()
+    if need is None:
+        need = Need.objects.order_by('-id').first()
+    resource = Resource.objects.order_by('-id').first()
+    disaster = need.disaster if need else Disaster.objects.order_by('id').first()
+    return Fixture(
+        need_id=need.id if need else 0,
+        resource_id=resource.id if resource else 0,
+        disaster_id=disaster.id if disaster else 0,
+        disaster_slug=disaster.slug if disaster else 'none',
+        since=(timezone.now() - datetime.timedelta(days=1)).isoformat(),
+    )
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+def measure(scenario, fixture, warmup=WARMUP, repeat=REPEAT, client=None):
+    """Latency, queries and size of ``scenario`` as a JSON-ready dict."""
+    client = client or Client()
+    url = scenario.url(fixture)
+    params = scenario.params(fixture)
+
+    def request():
+        cache.clear()
+        started = time.perf_counter()
+        response = client.get(url, params)
+        body = b''.join(response) if response.streaming else response.content
+        return response, body, (time.perf_counter() - started) * 1000
+
+    for _ in range(warmup):
+        request()
+    timings = []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as queries:
+            response, body, elapsed = request()
+        timings.append(elapsed)
+    return {
+        'status': response.status_code,
+        'p50_ms': round(statistics.median(timings), 3),
+        'p90_ms': round(percentile(timings, 0.9), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+        'max_ms': round(max(timings), 3),
+        'queries': len(queries),
+        'bytes': len(body),
+    }
+
+
+def run(scenarios=SCENARIOS, warmup=WARMUP, repeat=REPEAT, progress=None):
+    """Measure every scenario against the data currently in the database."""
+    fixture = make_fixture()
+    client = Client()
+    results = {}
+    for scenario in scenarios:
+        results[scenario.name] = measure(scenario, fixture, warmup, repeat, client)
+        if progress:
+            progress(scenario, results[scenario.name])
+    return results
+
+
+def compare(baseline, current, threshold=THRESHOLD, noise_ms=NOISE_MS):
+    """Regressions of ``current`` against ``baseline``, as readable lines.
+
+    Both are ``{size: {scenario: result}}``; only scenarios in both are compared.
+    """
+    regressions = []
+    for size, results in current.items():
+        for name, result in results.items():
+            before = baseline.get(size, {}).get(name)
+            if before is None:
+                continue
+            slower = result['p50_ms'] - before['p50_ms']
+            if slower > noise_ms and result['p50_ms'] > before['p50_ms'] * (1 + threshold):
+                regressions.append(
+                    f'{name} @ {size}: median {before["p50_ms"]:.1f}ms -> {result["p50_ms"]:.1f}ms'
+                )
+            if result['queries'] > before['queries']:
+                regressions.append(
+                    f'{name} @ {size}: {before["queries"]} -> {result["queries"]} queries'
+                )
+    return regressions
@@ -0,0 +1,144 @@
+"""Per-view query budgets, to stop N+1 queries from creeping in.
+
+BUDGETS caps the number of queries, and the total time spent in SQL, that
+one request to a route may use. ``QueryBudgetMiddleware`` (``app.middleware``)
+records the queries of every request in development and logs a report when a
+route goes over its budget; the test suite requests every route and fails on
+the same report.
+
+Budgets are for anonymous requests. A signed-in request also loads its
+session and user, so it is allowed AUTH_QUERIES more.
+
+A report lists the queries with the template line, or failing that the line
+of app code, that ran them. Queries that differ only in their parameters are
+grouped, so an N+1 shows up as one statement run many times from one line.
+"""
+import os
+import sys
+import time
+from collections import Counter
+from typing import NamedTuple
+
+from django.template.base import Node
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+# Frames in these files are part of the recording, not the cause of a query
+_SKIPPED = {os.path.join(APP_DIR, name) for name in ('budgets.py', 'metrics.py', 'middleware.py', 'profiling.py')}
+
+
+# Session and user lookups of a signed-in request
+AUTH_QUERIES = 2
+
+
+class Budget(NamedTuple):
+    queries: int
+    sql_ms: float = 200.0
+
+    def max_queries(self, signed_in=False):
+        return self.queries + (AUTH_QUERIES if signed_in else 0)
+
+
+# View name -> budget. Counts are for a cold page cache; a cached page makes
+# one query for its ETag and nothing else. Searching needs takes up
+# to three of them: its full-text hit count, then the fuzzy candidates and keys.
+BUDGETS = {
+    'app:home': Budget(7),
+    'app:needs_list': Budget(8),
+    'app:need_detail': Budget(6),
+    'app:problems_list': Budget(7),
+    'app:services_list': Budget(7),
+    'app:map_view': Budget(3),
+    'app:map_data_api': Budget(3),
+    'app:map_tile_api': Budget(3),
+    'app:nearby_api': Budget(3),
+    'app:export_needs': Budget(2, sql_ms=None),
+    'app:sync_api': Budget(5, sql_ms=500.0),
+    'app:live_map_events': Budget(3),
+    'app:resources_list': Budget(5),
+    'app:resource_detail': Budget(3),
+    'app:disasters_list': Budget(3),
+    'app:disaster_detail': Budget(5),
+}
+# Admin changelists, always signed in: counts and filter choices, then the page
+BUDGETS.update({
+    f'admin:app_{model}_changelist': Budget(6)
+    for model in (
+        'disaster', 'category', 'need', 'organization', 'resource', 'field',
+        'photo', 'comment', 'report', 'changelog', 'problem', 'service', 'profilingconfig', 'task',
+    )
+})
+# The change log loads the objects it lists, one query per model
+BUDGETS['admin:app_changelog_changelist'] = Budget(8)
+
+
+class Query(NamedTuple):
+    sql: str
+    ms: float
+    origin: str
+
+
+def query_origin():
+    """Where the current query comes from: the innermost app code frame and
+    the template line being rendered, whichever are on the stack."""
+    code = template = None
+    frame = sys._getframe(1)
+    while frame is not None and template is None:
+        node = frame.f_locals.get('self')
+        # type(), not isinstance(): that would evaluate lazy objects like request.user
+        if issubclass(type(node), Node) and getattr(node, 'token', None) and getattr(node, 'origin', None):
+            template = f'{node.origin.template_name}:{node.token.lineno}'
+        filename = frame.f_code.co_filename
+        if code is None and filename.startswith(APP_DIR) and filename not in _SKIPPED:
+            code = f'{os.path.relpath(filename, os.path.dirname(APP_DIR))}:{frame.f_lineno}'
+        frame = frame.f_back
+    return ' in '.join(part for part in (code, template) if part) or 'unknown'
+
+
+class QueryRecorder:
+    """Database execute wrapper recording each query, its time and origin.
+
+    Install with ``connection.execute_wrapper(recorder)``.
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append(Query(sql, (time.perf_counter() - started) * 1000, query_origin()))
+
+    @property
+    def sql_ms(self):
+        return sum(query.ms for query in self.queries)
+
+
+def check(view_name, recorder, signed_in=False):
+    """A report of how ``view_name`` went over its budget, or None."""
+    budget = BUDGETS.get(view_name)
+    if budget is None:
+        return None
+    over_count = len(recorder.queries) > budget.max_queries(signed_in)
+    over_time = budget.sql_ms is not None and recorder.sql_ms > budget.sql_ms
+    if not over_count and not over_time:
+        return None
+    return report(view_name, budget, recorder, signed_in)
+
+
+def report(view_name, budget, recorder, signed_in=False):
+    lines = [
+        f'{view_name} made {len(recorder.queries)} queries '
+        f'(budget {budget.max_queries(signed_in)}{" signed in" if signed_in else ""}) '
+        f'taking {recorder.sql_ms:.1f}ms'
+        + (f' (budget {budget.sql_ms:.0f}ms)' if budget.sql_ms is not None else '') + ':'
+    ]
+    groups = Counter((query.sql, query.origin) for query in recorder.queries)
+    times = Counter()
+    for query in recorder.queries:
+        times[query.sql, query.origin] += query.ms
+    for (sql, origin), count in groups.most_common():
+        repeat = f'{count}x ' if count > 1 else ''
+        lines.append(f'  {repeat}{times[sql, origin]:.1f}ms at {origin}: {sql}')
+    return '\n'.join(lines)
@@ -0,0 +1,214 @@
+"""Response caching for the public, read-only views.
+
+Cached pages are keyed by path, normalized query string and a global data
+version. The signal handlers in ``app.signals`` bump the version whenever a
+Need, Resource, Disaster or Category changes, which orphans every cached page
+at once; the orphans then simply expire. Only anonymous GET/HEAD requests are
+served from or stored in the cache.
+
+The same views answer conditional GETs (``If-None-Match`` and
+``If-Modified-Since``) with 304 Not Modified. A cheap watermark is computed
+before the view runs, so the response body is never built. Watermarks are
+read from the database, not the cache, so writes made by other processes
+move them too; pages behind one are cached under it as well.
+"""
+import datetime
+import functools
+import hashlib
+from urllib.parse import urlencode
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import condition
+
+from .models import ChangeLog, Disaster, Need, Resource
+
+DATA_VERSION_KEY = 'app:data-version'
+
+
+def data_version():
+    """Current data version; changes on every relevant model write."""
+    version = cache.get(DATA_VERSION_KEY)
+    if version is None:
+        cache.add(DATA_VERSION_KEY, 1, None)
+        version = cache.get(DATA_VERSION_KEY, 1)
+    return version
+
+
+def bump_data_version():
+    try:
+        cache.incr(DATA_VERSION_KEY)
+    except ValueError:
+        # The key was evicted or never set
+        cache.set(DATA_VERSION_KEY, 1, None)
+
+
+def _as_datetime(value):
+    # SQLite hands back the text it stored, in UTC
+    if isinstance(value, str):
+        value = parse_datetime(value)
+        if timezone.is_naive(value):
+            value = timezone.make_aware(value, datetime.timezone.utc)
+    return value
+
+
+def newest(*sources):
+    """The newest value of ``field`` for each (queryset, field) source, None
+    when the queryset is empty.
+
+    Read in a single query of one index seek per source, given an index on
+    ``field``.
+    """
+    parts, params = [], []
+    for queryset, field in sources:
+        sql, source_params = queryset.order_by(f'-{field}').values_list(field)[:1].query.sql_with_params()
+        parts.append(f'({sql})')
+        params.extend(source_params)
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT {", ".join(parts)}', params)
+        return [_as_datetime(value) for value in cursor.fetchone()]
+
+
+def untracked_sources():
+    """newest() sources for the changes not reflected in any Need.updated_at:
+    a deleted need, or a Disaster or Category written, whose name appears in
+    need payloads. ``app.signals`` logs them all to the ChangeLog."""
+    return [(ChangeLog.objects.filter(action=action), 'timestamp') for action in ('created', 'updated', 'deleted')]
+
+
+def watermark_etag(prefix, times):
+    return '-'.join([prefix] + [str(time.timestamp() if time else 0) for time in times])
+
+
+def normalized_query_string(query_dict):
+    """Query string with keys and values sorted and empty values dropped, so
+    equivalent URLs (``?a=1&b=`` and ``?a=1``) share one cache entry."""
+    items = sorted(
+        (key, value)
+        for key, values in query_dict.lists()
+        for value in values
+        if value != ''
+    )
+    return urlencode(items)
+
+
+def page_cache_key(request):
+    query = hashlib.md5(normalized_query_string(request.GET).encode()).hexdigest()
+    # A write from another process leaves this process' data version alone
+    # but moves the watermark conditional_page() computed
+    watermark = getattr(request, '_watermark', None)
+    if watermark:
+        query = f'{hashlib.md5(watermark[0].encode()).hexdigest()}:{query}'
+    return f'app:page:{data_version()}:{request.path}:{query}'
+
+
+async def _auser(request):
+    """``await request.auser()``, also set as ``request.user``.
+
+    The two load the user separately; templates and the worker threads of
+    async views read ``request.user``, so resolve it once for both.
+    """
+    user = await request.auser()
+    request.user = user
+    return user
+
+
+def cache_public_page(view_func):
+    """Serve anonymous GET requests for ``view_func`` from the cache.
+
+    Works on sync and async views alike.
+    """
+    def store(key, response):
+        if response.status_code == 200 and not response.streaming:
+            cache.set(key, response, settings.PAGE_CACHE_TIMEOUT)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    if iscoroutinefunction(view_func):
+        @functools.wraps(view_func)
+        async def async_wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or (await _auser(request)).is_authenticated:
+                return await view_func(request, *args, **kwargs)
+
+            key = await sync_to_async(page_cache_key)(request)
+            response = await cache.aget(key)
+            if response is not None:
+                response['X-Cache'] = 'HIT'
+                return response
+
+            response = await view_func(request, *args, **kwargs)
+            return await sync_to_async(store)(key, response)
+        return async_wrapper
+
+    @functools.wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+            return view_func(request, *args, **kwargs)
+
+        key = page_cache_key(request)
+        response = cache.get(key)
+        if response is not None:
+            response['X-Cache'] = 'HIT'
+            return response
+
+        return store(key, view_func(request, *args, **kwargs))
+    return wrapper
+
+
+def data_watermark(request, *args, **kwargs):
+    """(ETag, Last-Modified) of pages that change with any model write.
+
+    The newest write to each model the pages show, in one query.
+    """
+    times = newest(
+        (Need.objects.all(), 'updated_at'),
+        (Resource.objects.all(), 'updated_at'),
+        (Disaster.objects.all(), 'updated_at'),
+        *untracked_sources(),
+    )
+    return watermark_etag('data', times), max(filter(None, times), default=None)
+
+
+def conditional_page(watermark):
+    """Answer anonymous conditional GETs with 304 from ``watermark``.
+
+    ``watermark(request, *args, **kwargs)`` returns an (ETag, last modified)
+    pair and must be much cheaper than the view. Apply it above
+    cache_public_page so a 304 skips the cache lookup as well. On async
+    views the watermark is computed in a worker thread, so it may query the
+    database.
+    """
+    def request_watermark(request, *args, **kwargs):
+        # condition() asks for the ETag and Last-Modified separately
+        if not hasattr(request, '_watermark'):
+            request._watermark = None
+            if request.method in ('GET', 'HEAD') and not request.user.is_authenticated:
+                request._watermark = watermark(request, *args, **kwargs)
+        return request._watermark
+
+    def etag(request, *args, **kwargs):
+        mark = request_watermark(request, *args, **kwargs)
+        return mark[0] if mark else None
+
+    def last_modified(request, *args, **kwargs):
+        mark = request_watermark(request, *args, **kwargs)
+        return mark[1] if mark else None
+
+    def decorator(view_func):
+        conditional_view = condition(etag_func=etag, last_modified_func=last_modified)(view_func)
+        if not iscoroutinefunction(view_func):
+            return conditional_view
+
+        @functools.wraps(view_func)
+        async def async_wrapper(request, *args, **kwargs):
+            # condition() calls etag() and last_modified() on the event loop,
+            # so have them find the watermark already computed
+            await _auser(request)
+            await sync_to_async(request_watermark)(request, *args, **kwargs)
+            return await conditional_view(request, *args, **kwargs)
+        return async_wrapper
+    return decorator
@@ -0,0 +1,76 @@
+"""Server-side grid clustering of needs for zoomed-out map views."""
+from django.db.models import Avg, Case, Count, FloatField, IntegerField, Max, Value, When
+from django.db.models.functions import Cast, Floor
+
+from . import geo
+
+PRIORITY_RANKS = {'low': 1, 'medium': 2, 'high': 3, 'urgent': 4}
+
+
+def cluster_needs(needs, zoom):
+    """Aggregate needs into grid cells sized for ``zoom``.
+
+    The grouping runs in the database, so the cost of the response depends on
+    the number of occupied cells rather than the number of needs. Returns a
+    list of GeoJSON Features, one per occupied cell, carrying the total count,
+    a per-category_type breakdown and the highest priority within the cell.
+    """
+    size = geo.cluster_cell_size(zoom)
+    priority_rank = Case(
+        *[When(priority=priority, then=Value(rank)) for priority, rank in PRIORITY_RANKS.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+    rows = (
+        needs.order_by()
+        .annotate(
+            cell_x=Floor(Cast('longitude', FloatField()) / Value(size)),
+            cell_y=Floor(Cast('latitude', FloatField()) / Value(size)),
+        )
+        .values('cell_x', 'cell_y', 'category_type')
+        .annotate(
+            count=Count('id'),
+            max_priority_rank=Max(priority_rank),
+            latitude=Avg(Cast('latitude', FloatField())),
+            longitude=Avg(Cast('longitude', FloatField())),
+        )
+    )
+
+    cells = {}
+    for row in rows:
+        key = (int(row['cell_x']), int(row['cell_y']))
+        cell = cells.setdefault(key, {
+            'count': 0, 'counts': {}, 'rank': 0, 'lat_sum': 0.0, 'lng_sum': 0.0,
+        })
+        count = row['count']
+        cell['count'] += count
+        category_type = row['category_type'] or 'unknown'
+        cell['counts'][category_type] = cell['counts'].get(category_type, 0) + count
+        cell['rank'] = max(cell['rank'], row['max_priority_rank'] or 0)
+        # Weight each group's centroid by its size to get the cell centroid
+        cell['lat_sum'] += row['latitude'] * count
+        cell['lng_sum'] += row['longitude'] * count
+
+    priorities = {rank: priority for priority, rank in PRIORITY_RANKS.items()}
+    return [
+        _cluster_feature(x, y, size, cell, priorities.get(cell['rank']))
+        for (x, y), cell in cells.items()
+    ]
+
+
+def _cluster_feature(x, y, size, cell, max_priority):
+    return {
+        'type': 'Feature',
+        'geometry': {
+            'type': 'Point',
+            'coordinates': [cell['lng_sum'] / cell['count'], cell['lat_sum'] / cell['count']]
+        },
+        'properties': {
+            'cluster': True,
+            'count': cell['count'],
+            'counts': cell['counts'],
+            'max_priority': max_priority,
+            # Cell extent so the client can zoom straight into it
+            'bounds': [x * size, y * size, (x + 1) * size, (y + 1) * size],
+        }
+    }
@@ -0,0 +1,66 @@
+"""Dashboard counters computed with one grouped query and cached.
+
+Every page that shows totals reads them from here instead of issuing its own
+COUNT(*). The cached rows are dropped by the signal handlers in
+``app.signals`` whenever a Need, Resource or Category changes, and rebuilt on
+the next read.
+"""
+from django.core.cache import cache
+from django.db.models import BooleanField, Case, Count, Value, When
+
+from .models import Need, Resource
+
+NEED_COUNTS_KEY = 'app:counters:needs'
+RESOURCE_COUNTS_KEY = 'app:counters:resources'
+# Safety net in case an invalidation is missed (e.g. a queryset .update())
+CACHE_TIMEOUT = 300
+
+
+class NeedCounts:
+    """Need totals grouped by disaster, category type, status and geolocation."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def count(self, category_type=None, status=None, disaster_id=None, geolocated=None):
+        """Sum of the groups matching every given criterion."""
+        return sum(
+            row['count'] for row in self.rows
+            if (category_type is None or row['category_type'] == category_type)
+            and (status is None or row['status'] == status)
+            and (disaster_id is None or row['disaster_id'] == disaster_id)
+            and (geolocated is None or row['geolocated'] == geolocated)
+        )
+
+
+def need_counts():
+    """Cached NeedCounts, rebuilt with a single GROUP BY when missing."""
+    rows = cache.get(NEED_COUNTS_KEY)
+    if rows is None:
+        rows = list(
+            Need.objects.order_by()
+            .annotate(geolocated=Case(
+                When(geohash__gt='', then=Value(True)),
+                default=Value(False),
+                output_field=BooleanField(),
+            ))
+            .values('disaster_id', 'status', 'geolocated', 'category_type')
+            .annotate(count=Count('id'))
+        )
+        cache.set(NEED_COUNTS_KEY, rows, CACHE_TIMEOUT)
+    return NeedCounts(rows)
+
+
+def resource_counts():
+    """Resource totals keyed by status."""
+    counts = cache.get(RESOURCE_COUNTS_KEY)
+    if counts is None:
+        counts = dict(
+            Resource.objects.order_by().values_list('status').annotate(count=Count('id'))
+        )
+        cache.set(RESOURCE_COUNTS_KEY, counts, CACHE_TIMEOUT)
+    return counts
+
+
+def invalidate():
+    cache.delete_many([NEED_COUNTS_KEY, RESOURCE_COUNTS_KEY])
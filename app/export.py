@@ -0,0 +1,120 @@
+"""Bulk export of needs as GeoJSON, newline-delimited GeoJSON or CSV.
+
+Exports are iterators of text chunks. Rows are read with ``.iterator()``, or
+``.aiterator()`` under ASGI, and written a batch at a time as they arrive, so
+memory use does not grow with the number of needs and the first bytes go out
+before the last row is read. The same formats back the export view and the
+``export_needs`` management command.
+"""
+import csv
+import io
+import itertools
+import json
+from typing import Callable, NamedTuple
+
+from .models import Need
+from .serializers import need_feature
+
+# Rows fetched from the database per round trip
+CHUNK_SIZE = 2000
+
+CSV_COLUMNS = [
+    'id', 'title', 'description', 'category', 'category_type', 'disaster',
+    'status', 'priority', 'is_verified', 'location', 'city', 'latitude',
+    'longitude', 'contact_person', 'contact_phone', 'created_at', 'updated_at',
+]
+
+
+def export_needs(entry_type=None, disaster_id=None, status=None):
+    """Needs to export, oldest first, optionally filtered."""
+    needs = Need.objects.select_related('category', 'disaster').order_by('id')
+    if entry_type:
+        needs = needs.filter(category_type=entry_type)
+    if disaster_id:
+        needs = needs.filter(disaster_id=disaster_id)
+    if status:
+        needs = needs.filter(status=status)
+    return needs
+
+
+def _geojson_batch(needs, first):
+    features = ','.join(json.dumps(need_feature(need, truncate=False), separators=(',', ':')) for need in needs)
+    return features if first else ',' + features
+
+
+def _ndjson_batch(needs, first):
+    return ''.join(json.dumps(need_feature(need, truncate=False), separators=(',', ':')) + '\n' for need in needs)
+
+
+def _csv_row(need):
+    return [
+        need.id, need.title, need.description,
+        need.category.name if need.category else '', need.category_type,
+        need.disaster.name, need.status, need.priority, need.is_verified,
+        need.location, need.city,
+        '' if need.latitude is None else need.latitude,
+        '' if need.longitude is None else need.longitude,
+        need.contact_person, need.contact_phone,
+        need.created_at.isoformat(), need.updated_at.isoformat(),
+    ]
+
+
+def _csv_text(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+def _csv_batch(needs, first):
+    return _csv_text(_csv_row(need) for need in needs)
+
+
+class Format(NamedTuple):
+    content_type: str
+    extension: str
+    head: str
+    # (needs, is first batch) -> their text
+    encode_batch: Callable
+    tail: str
+
+
+FORMATS = {
+    # A single FeatureCollection
+    'geojson': Format('application/geo+json', 'geojson', '{"type":"FeatureCollection","features":[', _geojson_batch, ']}\n'),
+    # One GeoJSON Feature per line
+    'ndjson': Format('application/x-ndjson', 'ndjson', '', _ndjson_batch, ''),
+    'csv': Format('text/csv; charset=utf-8', 'csv', _csv_text([CSV_COLUMNS]), _csv_batch, ''),
+}
+
+
+def chunks(fmt, needs):
+    """Text chunks of ``needs`` exported in ``fmt``, a CHUNK_SIZE batch of rows each."""
+    yield fmt.head
+    rows = needs.iterator(chunk_size=CHUNK_SIZE)
+    first = True
+    # itertools.batched() needs Python 3.12
+    while batch := list(itertools.islice(rows, CHUNK_SIZE)):
+        yield fmt.encode_batch(batch, first)
+        first = False
+    yield fmt.tail
+
+
+async def achunks(fmt, needs):
+    """chunks() as an async iterator, for responses served under ASGI.
+
+    Django buffers a whole synchronous iterator before an ASGI response
+    sends anything, so rows are fetched with ``aiterator()`` instead, a
+    batch per trip to the database thread.
+    """
+    yield fmt.head
+    batch = []
+    first = True
+    async for need in needs.aiterator(chunk_size=CHUNK_SIZE):
+        batch.append(need)
+        if len(batch) == CHUNK_SIZE:
+            yield fmt.encode_batch(batch, first)
+            batch = []
+            first = False
+    if batch:
+        yield fmt.encode_batch(batch, first)
+    yield fmt.tail
@@ -0,0 +1,198 @@
+"""Geographic helpers for map queries: bounding boxes and slippy-map tiles."""
+import math
+from typing import NamedTuple
+
+MAX_ZOOM = 22
+
+# Below this zoom level the map receives clusters instead of individual needs.
+CLUSTER_MAX_ZOOM = 11
+# Clustering grid resolution: cells per 256px tile edge (i.e. ~64px cells).
+CLUSTER_CELLS_PER_TILE = 4
+
+
+class BBox(NamedTuple):
+    """A WGS84 bounding box in Leaflet's ``toBBoxString()`` order."""
+    west: float
+    south: float
+    east: float
+    north: float
+
+
+def parse_bbox(value):
+    """Parse a ``west,south,east,north`` string into a BBox.
+
+    Raises ValueError when the string is malformed or out of range.
+    """
+    parts = value.split(',')
+    if len(parts) != 4:
+        raise ValueError("bbox must be 'west,south,east,north'")
+    west, south, east, north = (float(part) for part in parts)
+    if not all(math.isfinite(v) for v in (west, south, east, north)):
+        raise ValueError("bbox values must be finite numbers")
+    if south > north:
+        raise ValueError("bbox south edge is above its north edge")
+    # Leaflet reports longitudes outside [-180, 180] once the map is panned
+    # round the world. Wrap them back, rather than clamp: a view entirely past
+    # the antimeridian is the same view of the other side. The result has its
+    # west edge greater than its east edge when it crosses the antimeridian.
+    if east - west >= 360:
+        west, east = -180.0, 180.0
+    else:
+        west = (west + 180) % 360 - 180
+        # East edges wrap into (-180, 180], so a box ending at 180 keeps its edge
+        east = 180 - (180 - east) % 360
+    south = max(south, -90.0)
+    north = min(north, 90.0)
+    return BBox(west, south, east, north)
+
+
+def parse_zoom(value, default=None):
+    """Parse a zoom level, clamped to the range Leaflet supports."""
+    if value in (None, ''):
+        return default
+    return max(0, min(int(value), MAX_ZOOM))
+
+
+def cluster_cell_size(zoom):
+    """Edge length, in degrees, of the clustering grid cell at ``zoom``."""
+    return 360.0 / (2 ** zoom) / CLUSTER_CELLS_PER_TILE
+
+
+def tile_bbox(z, x, y):
+    """Return the bounding box covered by slippy-map tile ``z/x/y``.
+
+    Raises ValueError for tile coordinates that do not exist at zoom ``z``.
+    """
+    if not 0 <= z <= MAX_ZOOM:
+        raise ValueError("zoom out of range")
+    n = 2 ** z
+    if not (0 <= x < n and 0 <= y < n):
+        raise ValueError("tile out of range for zoom level")
+    return BBox(
+        west=x / n * 360.0 - 180.0,
+        south=_tile_row_latitude(y + 1, n),
+        east=(x + 1) / n * 360.0 - 180.0,
+        north=_tile_row_latitude(y, n),
+    )
+
+
+def _tile_row_latitude(y, n):
+    return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+
+
+# Geohash
+#
+# Needs store the geohash of their coordinates in an indexed column. Every
+# geohash cell is a contiguous range of that column, so a bounding box becomes a
+# handful of index range scans instead of a scan over every geolocated row.
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9  # ~4.8m x 4.8m cells, finer than what reporters type in
+# Upper bound on the number of geohash cells used to cover a bounding box.
+GEOHASH_MAX_COVER_CELLS = 16
+# Sorts after every geohash character, closing a prefix range: [prefix, prefix~)
+GEOHASH_RANGE_END = '~'
+EARTH_RADIUS_KM = 6371.0088
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Encode a coordinate as a geohash string of ``precision`` characters."""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    latitude, longitude = float(latitude), float(longitude)
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        target, bounds = (longitude, lng_range) if even else (latitude, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        value <<= 1
+        if target >= mid:
+            value |= 1
+            bounds[0] = mid
+        else:
+            bounds[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def _geohash_cell_size(precision):
+    """(height, width) in degrees of a geohash cell of ``precision`` characters."""
+    total_bits = precision * 5
+    lat_bits = total_bits // 2
+    lng_bits = total_bits - lat_bits
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def geohash_cover(bbox, max_cells=GEOHASH_MAX_COVER_CELLS):
+    """Return geohash prefixes whose cells together cover ``bbox``.
+
+    Uses the longest prefixes for which the cover stays within ``max_cells``,
+    so the ranges are as tight as possible without exploding the query. The
+    cover is a superset of the box; callers refine with exact coordinates.
+    """
+    if bbox.west > bbox.east:
+        raise ValueError("split boxes crossing the antimeridian before covering them")
+    best = ['']
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        height, width = _geohash_cell_size(precision)
+        rows = range(int((bbox.south + 90) // height), int((min(bbox.north, 89.999999) + 90) // height) + 1)
+        cols = range(int((bbox.west + 180) // width), int((min(bbox.east, 179.999999) + 180) // width) + 1)
+        if len(rows) * len(cols) > max_cells:
+            break
+        best = [
+            encode_geohash((row + 0.5) * height - 90, (col + 0.5) * width - 180, precision)
+            for row in rows for col in cols
+        ]
+    return best
+
+
+def split_antimeridian(bbox):
+    """``bbox`` as boxes that do not cross the antimeridian: itself, or its
+    two halves when its west edge is greater than its east edge. A box whose
+    halves would still be inverted (edges outside [-180, 180]) covers
+    nothing, so gives no boxes."""
+    if bbox.west <= bbox.east:
+        return [bbox]
+    if bbox.west > 180 or bbox.east < -180:
+        return []
+    return [
+        BBox(bbox.west, bbox.south, 180.0, bbox.north),
+        BBox(-180.0, bbox.south, bbox.east, bbox.north),
+    ]
+
+
+def radius_bbox(latitude, longitude, radius_km):
+    """Smallest BBox containing the circle of ``radius_km`` around a point.
+
+    The box's west edge is greater than its east edge when it wraps around
+    the antimeridian.
+    """
+    latitude, longitude = float(latitude), float(longitude)
+    angular = radius_km / EARTH_RADIUS_KM
+    south = latitude - math.degrees(angular)
+    north = latitude + math.degrees(angular)
+    if south <= -90 or north >= 90:
+        # The circle contains a pole, so it spans every longitude
+        return BBox(-180.0, max(south, -90.0), 180.0, min(north, 90.0))
+    dlng = math.degrees(math.asin(math.sin(angular) / math.cos(math.radians(latitude))))
+    west, east = longitude - dlng, longitude + dlng
+    if west < -180:
+        west += 360
+    if east > 180:
+        east -= 360
+    return BBox(west, south, east, north)
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance in kilometres between two coordinates."""
+    lat1, lng1, lat2, lng2 = (math.radians(float(v)) for v in (lat1, lng1, lat2, lng2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
@@ -0,0 +1,292 @@
+"""Offline geocoding of free-text locations against a bundled gazetteer.
+
+Many needs are reported with a ``location`` and ``city`` but no
+coordinates, so they never reach the map. ``locate`` resolves such text to a
+place in ``data/gazetteer.csv`` (Pakistan's provinces, districts and the
+main tehsils and towns, at their headquarters), plus any files listed in
+GAZETTEER_FILES with the same columns, e.g. union councils and villages
+from a fuller gazetteer. Nothing goes over the network.
+
+Names and alternate names (spellings, Urdu) are reduced to the keys of
+``app.textnorm`` and held in memory in three indexes: exact keys, sorted
+keys for prefix lookups ("Muzaffarg") and trigrams for misspellings. Each
+comma-separated part of the text is matched longest phrase first. Among the
+places found, one whose district or province is also named wins, then the
+most specific kind, then the closest spelling. When that still leaves two
+places far apart, or only a province, the text is left unresolved rather
+than pinned somewhere wrong. Past resolutions are kept in an LRU cache.
+
+``Need.save`` geocodes needs without coordinates and marks them
+``geocoded``; ``manage.py geocode_needs`` does the same for stored needs.
+"""
+import bisect
+import csv
+import functools
+import re
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import geo, textnorm
+
+BUNDLED_GAZETTEER = Path(__file__).resolve().parent / 'data' / 'gazetteer.csv'
+
+# Higher is more specific. Provinces are only context: a pin in the middle
+# of Balochistan helps nobody.
+KIND_RANK = {'province': 0, 'district': 1, 'tehsil': 2, 'town': 3, 'union_council': 4, 'village': 5}
+MIN_SCORE = 0.8
+# Longest place name, in key words, tried as one phrase
+MAX_PHRASE_WORDS = 4
+# Keys shorter than this ("dd" for Dadu) must also match by folded spelling
+SHORT_KEY = 4
+# Shortest key looked up by prefix or trigrams
+FUZZY_MIN_LENGTH = 4
+TRIGRAM_CANDIDATES = 20
+# Equally good matches further apart than this make the text ambiguous
+AMBIGUOUS_KM = 25
+# Place names that are also everyday words; they need their district or
+# province named too, unless they are the whole part of the text
+COMMON_WORDS = {'tank', 'hub', 'bag', 'kalam', 'tangi', 'bahrain'}
+CACHE_SIZE = 4096
+BATCH_SIZE = 500
+
+_SEPARATORS = re.compile(r'[,;/|()\n]+')
+
+
+class Place(NamedTuple):
+    name: str
+    kind: str
+    district: str
+    province: str
+    latitude: float
+    longitude: float
+
+
+class Match(NamedTuple):
+    place: Place
+    score: float
+    # Index of the phrase matched, and whether it was all of its part
+    phrase: int
+    whole_part: bool
+
+
+class Gazetteer:
+    def __init__(self, places):
+        self.places = []
+        # key -> [(place index, folded spelling)]
+        self.by_key = defaultdict(list)
+        self.trigrams = defaultdict(set)
+        for place, names in places:
+            index = len(self.places)
+            self.places.append(place)
+            for name in names:
+                pairs = textnorm.key_words(name)
+                if not pairs:
+                    continue
+                key = ' '.join(key for key, _ in pairs)
+                entry = (index, ' '.join(folded for _, folded in pairs))
+                if entry not in self.by_key[key]:
+                    self.by_key[key].append(entry)
+                for trigram in textnorm.trigrams(key):
+                    self.trigrams[trigram].add(key)
+        self.keys = sorted(self.by_key)
+
+    @classmethod
+    def load(cls, paths):
+        places = []
+        for path in paths:
+            with open(path, newline='', encoding='utf-8') as f:
+                for row in csv.DictReader(f):
+                    place = Place(
+                        row['name'].strip(), row['kind'].strip(), row['district'].strip(),
+                        row['province'].strip(), float(row['latitude']), float(row['longitude']),
+                    )
+                    if place.kind not in KIND_RANK:
+                        raise ValueError(f'{path}: unknown kind {place.kind!r} for {place.name}')
+                    alt_names = [name for name in row.get('alt_names', '').split('|') if name.strip()]
+                    places.append((place, [place.name, *alt_names]))
+        return cls(places)
+
+    def _candidate_keys(self, key):
+        """key -> score of the indexed keys that ``key`` may be."""
+        scores = {}
+        if key in self.by_key:
+            scores[key] = 1.0
+        length = len(key.replace(' ', ''))
+        if length < FUZZY_MIN_LENGTH:
+            return scores
+        start = bisect.bisect_left(self.keys, key)
+        for candidate in self.keys[start:]:
+            if not candidate.startswith(key):
+                break
+            scores.setdefault(candidate, len(key) / len(candidate))
+        shared = Counter()
+        for trigram in textnorm.trigrams(key):
+            shared.update(self.trigrams.get(trigram, ()))
+        for candidate, _ in shared.most_common(TRIGRAM_CANDIDATES):
+            if candidate not in scores:
+                distance = textnorm.edit_distance(key, candidate)
+                scores[candidate] = 1 - distance / max(len(key), len(candidate))
+        return scores
+
+    def lookup(self, pairs):
+        """place index -> score of the places the key words ``pairs`` name."""
+        key = ' '.join(key for key, _ in pairs)
+        folded = ' '.join(folded for _, folded in pairs)
+        found = {}
+        for candidate, score in self._candidate_keys(key).items():
+            if score < MIN_SCORE:
+                continue
+            for index, candidate_folded in self.by_key[candidate]:
+                if len(candidate.replace(' ', '')) < SHORT_KEY and textnorm.edit_distance(folded, candidate_folded) > 1:
+                    continue
+                found[index] = max(score, found.get(index, 0.0))
+        return found
+
+    def matches(self, *texts):
+        """Every Match in ``texts``, each split into comma-separated parts."""
+        matches = []
+        phrase = 0
+        for text in texts:
+            for part in _SEPARATORS.split(text or ''):
+                pairs = textnorm.key_words(part)
+                used = [False] * len(pairs)
+                for size in range(min(MAX_PHRASE_WORDS, len(pairs)), 0, -1):
+                    for start in range(len(pairs) - size + 1):
+                        if any(used[start:start + size]):
+                            continue
+                        found = self.lookup(pairs[start:start + size])
+                        if not found:
+                            continue
+                        used[start:start + size] = [True] * size
+                        whole_part = size == len(pairs)
+                        matches.extend(
+                            Match(self.places[index], score, phrase, whole_part)
+                            for index, score in found.items()
+                        )
+                        phrase += 1
+        return matches
+
+    def resolve(self, *texts):
+        """The best Match for ``texts``, or None."""
+        matches = self.matches(*texts)
+
+        def supported(match):
+            # Its district or province is named elsewhere in the text
+            return any(
+                other.phrase != match.phrase and (
+                    (other.place.kind == 'district' and other.place.name == match.place.district)
+                    or (other.place.kind == 'province' and other.place.name == match.place.province)
+                )
+                for other in matches
+            )
+
+        ranked = []
+        for match in matches:
+            if match.place.kind == 'province':
+                continue
+            is_supported = supported(match)
+            if not is_supported and not match.whole_part and _is_common_word(match.place.name):
+                continue
+            ranked.append(((is_supported, KIND_RANK[match.place.kind], match.score), match))
+        if not ranked:
+            return None
+        ranked.sort(key=lambda item: item[0], reverse=True)
+        (best_rank, best), *others = ranked
+        for rank, other in others:
+            if rank[:2] != best_rank[:2] or best_rank[2] - rank[2] > 0.05:
+                break
+            if geo.haversine_km(best.place.latitude, best.place.longitude,
+                                other.place.latitude, other.place.longitude) > AMBIGUOUS_KM:
+                return None
+        return best
+
+
+def _is_common_word(name):
+    return textnorm.fold(name) in _COMMON_FOLDED
+
+
+_COMMON_FOLDED = {textnorm.fold(word) for word in COMMON_WORDS}
+
+
+@functools.cache
+def get_gazetteer():
+    """The gazetteer, loaded on first use."""
+    return Gazetteer.load([BUNDLED_GAZETTEER, *settings.GAZETTEER_FILES])
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def locate(location, city=''):
+    """The Place that ``location`` and ``city`` name, or None."""
+    match = get_gazetteer().resolve(location, city)
+    return match.place if match is not None else None
+
+
+def reset():
+    """Forget the loaded gazetteer and past resolutions, e.g. after
+    GAZETTEER_FILES changes."""
+    get_gazetteer.cache_clear()
+    locate.cache_clear()
+
+
+class Backfill:
+    """Counts of a geocode_needs run."""
+
+    def __init__(self):
+        self.checked = 0
+        self.geocoded = 0
+        self.cleared = 0
+        # Location text -> needs it failed to place
+        self.unresolved = Counter()
+
+
+def geocode_needs(redo=False, batch_size=BATCH_SIZE, dry_run=False):
+    """Geocode stored needs without coordinates, and with ``redo`` those
+    geocoded before, e.g. after the gazetteer grew. Returns a Backfill."""
+    from . import cache, counters, live
+    from .models import Need
+
+    needs = Need.objects.filter(latitude__isnull=True)
+    if redo:
+        needs = needs | Need.objects.filter(geocoded=True)
+    needs = needs.only('id', 'location', 'city', 'latitude', 'longitude', 'geocoded', 'geohash').order_by('id')
+
+    result = Backfill()
+    changed = []
+
+    def write():
+        if not dry_run and changed:
+            now = timezone.now()
+            for need in changed:
+                need.updated_at = now
+            with transaction.atomic():
+                Need.objects.bulk_update(changed, ['latitude', 'longitude', 'geocoded', 'geohash', 'updated_at'])
+        changed.clear()
+
+    for need in needs.iterator(chunk_size=batch_size):
+        result.checked += 1
+        before = (need.latitude, need.longitude)
+        need.refresh_location(redo=True)
+        if need.latitude is None:
+            text = ', '.join(filter(None, [need.location, need.city]))
+            if text:
+                result.unresolved[text] += 1
+            if before[0] is not None:
+                result.cleared += 1
+        elif (need.latitude, need.longitude) != before:
+            result.geocoded += 1
+        if (need.latitude, need.longitude) != before:
+            changed.append(need)
+            if len(changed) >= batch_size:
+                write()
+    write()
+    if not dry_run and (result.geocoded or result.cleared):
+        # bulk_update() sends no signals
+        counters.invalidate()
+        cache.bump_data_version()
+        live.broker.notify()
+    return result
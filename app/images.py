@@ -0,0 +1,118 @@
+"""Resizing and recompression of uploaded photos.
+
+Phone photos arrive at 3-8 MB. A new upload is stored as it is and the
+``process_photo`` task (app.tasks) is queued, so the upload request does
+not wait for it. ``process_photo`` replaces the file with a copy at most
+MAX_DIMENSION pixels on its longest side, re-encoded as WebP (JPEG where
+Pillow was built without WebP), and stores next to it a smaller copy for
+each of THUMBNAIL_WIDTHS that is narrower than the photo, then deletes the
+raw upload. EXIF orientation is applied to the pixels and every piece of
+metadata is dropped, including the GPS position. Until then ``width`` is
+None and pages show the upload itself.
+
+Copies are named after the stored image, e.g. ``needs/2025/08/boat.webp``
+has ``needs/2025/08/boat.320w.webp``. ``Photo.thumbnails`` maps each width to
+its name, so templates and APIs can pick the smallest copy that will do.
+Photos stored before uploads were processed, or whose task failed, are
+processed by ``manage.py process_photos``.
+"""
+import os
+from io import BytesIO
+from typing import NamedTuple
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, features
+
+MAX_DIMENSION = 2048
+THUMBNAIL_WIDTHS = (320, 640, 1280)
+WEBP_QUALITY = 80
+# Encoder effort, 0-6: 2 is about three times faster than libwebp's default 4
+# for files a few percent larger
+WEBP_METHOD = 2
+JPEG_QUALITY = 82
+
+
+class ProcessedImage(NamedTuple):
+    content: bytes
+    width: int
+    height: int
+    extension: str
+    # Width -> encoded copy
+    thumbnails: dict
+
+
+def output_format():
+    return 'WEBP' if features.check('webp') else 'JPEG'
+
+
+def _flatten(image, keep_alpha):
+    """``image`` in RGB, or RGBA if it has transparency to keep."""
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+    if not has_alpha:
+        return image.convert('RGB')
+    image = image.convert('RGBA')
+    if keep_alpha:
+        return image
+    background = Image.new('RGB', image.size, 'white')
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+
+
+def _encode(image, fmt):
+    # No exif or icc_profile is passed, so none is written
+    buffer = BytesIO()
+    if fmt == 'WEBP':
+        image.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=WEBP_METHOD)
+    else:
+        image.save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def process(file, fmt=None):
+    """Bounded, metadata-free copies of the image in ``file``.
+
+    Raises PIL.UnidentifiedImageError when ``file`` is not an image, and
+    PIL.Image.DecompressionBombError when it has more pixels than Pillow
+    will decode (Image.MAX_IMAGE_PIXELS).
+    """
+    fmt = fmt or output_format()
+    file.seek(0)
+    with Image.open(file) as original:
+        # JPEG decoders can scale down by powers of two while decoding,
+        # which makes large phone photos several times cheaper to open
+        original.draft('RGB', (MAX_DIMENSION, MAX_DIMENSION))
+        image = ImageOps.exif_transpose(original)
+        image = _flatten(image, keep_alpha=fmt == 'WEBP')
+    image.thumbnail((MAX_DIMENSION, MAX_DIMENSION), Image.Resampling.LANCZOS)
+
+    thumbnails = {}
+    for width in THUMBNAIL_WIDTHS:
+        if width >= image.width:
+            break
+        height = max(round(image.height * width / image.width), 1)
+        thumbnails[width] = _encode(image.resize((width, height), Image.Resampling.LANCZOS), fmt)
+    return ProcessedImage(_encode(image, fmt), image.width, image.height, fmt.lower().replace('jpeg', 'jpg'), thumbnails)
+
+
+def _store(photo, result, name):
+    stem = os.path.splitext(os.path.basename(name))[0]
+    photo.image.save(f'{stem}.{result.extension}', ContentFile(result.content), save=False)
+    stored_stem, extension = os.path.splitext(photo.image.name)
+    storage = photo.image.storage
+    photo.width, photo.height = result.width, result.height
+    photo.thumbnails = {
+        str(width): storage.save(f'{stored_stem}.{width}w{extension}', ContentFile(content))
+        for width, content in result.thumbnails.items()
+    }
+
+
+def process_photo(photo):
+    """Replace ``photo``'s stored image with the processed copies, save the
+    row and delete the original file."""
+    old_name = photo.image.name
+    with photo.image.open('rb') as f:
+        result = process(f)
+    _store(photo, result, old_name)
+    photo.save(update_fields=['image', 'width', 'height', 'thumbnails'])
+    if photo.image.name != old_name:
+        photo.image.storage.delete(old_name)
@@ -0,0 +1,260 @@
+"""Bulk import of needs from spreadsheets and survey exports.
+
+Rows are read one at a time from CSV files (with any of the delimiters
+KoBoToolbox and spreadsheet programs write) or ``.xlsx`` workbooks. Each
+column is mapped onto a Need field by its header once per file. Rows are then
+validated and written with ``bulk_create``, ``batch_size`` at a time and one
+transaction per batch. Categories and disasters are looked up in dictionaries
+loaded up front, so a row costs no queries of its own. Columns that are not
+Need fields are kept as Field rows.
+
+``bulk_create`` bypasses ``save()`` and the handlers in ``app.signals``, so
+the importer does their work itself: denormalized columns per row, search
+indexes per batch, and counters and the page cache once at the end.
+"""
+import csv
+import decimal
+import re
+
+from django.db import transaction
+
+from . import cache, counters, live, search
+from .models import Category, Disaster, Field, Need
+
+BATCH_SIZE = 1000
+
+# Normalized header -> Need field
+COLUMN_ALIASES = {
+    'title': 'title', 'name': 'title', 'need': 'title',
+    'description': 'description', 'details': 'description',
+    'category': 'category',
+    'disaster': 'disaster',
+    'location': 'location', 'address': 'location',
+    'city': 'city', 'district': 'city',
+    'latitude': 'latitude', 'lat': 'latitude',
+    'longitude': 'longitude', 'lon': 'longitude', 'lng': 'longitude', 'long': 'longitude',
+    'contact_person': 'contact_person', 'contact_name': 'contact_person',
+    'contact_phone': 'contact_phone', 'phone': 'contact_phone', 'mobile': 'contact_phone',
+    'status': 'status',
+    'priority': 'priority',
+}
+# Columns holding a whole point: "lat lon [alt accuracy]" or "[lat, lon]"
+GEOPOINT_COLUMNS = {'_geolocation', 'geopoint', 'gps', 'coordinates'}
+# KoBoToolbox bookkeeping, not worth keeping as Fields; so is any "_" column
+KOBO_METADATA = {'start', 'end', 'today', 'deviceid', 'instanceid'}
+LENGTH_CHECKED = ['title', 'location', 'city', 'contact_person', 'contact_phone']
+
+_GEOPOINT_RE = re.compile(r'[\s,;\[\]]+')
+
+
+class RowError(ValueError):
+    """A row that cannot be imported; the message says why."""
+
+
+def read_csv(f):
+    """Rows of a CSV file opened in text mode, header first."""
+    sample = f.read(64 * 1024)
+    f.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    return csv.reader(f, dialect)
+
+
+def read_xlsx(path):
+    """Rows of the first sheet of an .xlsx workbook, header first.
+
+    Needs openpyxl, which is only imported here.
+    """
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        for row in workbook.worksheets[0].iter_rows(values_only=True):
+            yield ['' if value is None else str(value) for value in row]
+    finally:
+        workbook.close()
+
+
+def normalize_header(header):
+    # KoBo prefixes questions with their group path: "household/phone"
+    return header.strip().rsplit('/', 1)[-1].strip().lower().replace(' ', '_')
+
+
+def map_columns(header):
+    """(kind, key) per column: kind is 'need', 'geopoint', 'field' or None."""
+    columns = []
+    seen = set()
+    for name in map(normalize_header, header):
+        if name in COLUMN_ALIASES:
+            column = ('need', COLUMN_ALIASES[name])
+        elif name in GEOPOINT_COLUMNS:
+            column = ('geopoint', None)
+        elif not name or name.startswith('_') or name in KOBO_METADATA:
+            column = (None, None)
+        else:
+            column = ('field', name[:Field._meta.get_field('key').max_length])
+        # Fields are unique per need, and the first of two same-named columns wins
+        if column[0] in ('need', 'field') and column in seen:
+            column = (None, None)
+        seen.add(column)
+        columns.append(column)
+    return columns
+
+
+def parse_coordinate(value, limit):
+    try:
+        number = decimal.Decimal(value)
+    except decimal.InvalidOperation:
+        raise RowError(f'{value!r} is not a coordinate')
+    if not number.is_finite() or abs(number) > limit:
+        raise RowError(f'coordinate {value} is out of range')
+    return round(number, 6)
+
+
+class Importer:
+    """Validates rows into needs and writes them ``batch_size`` at a time."""
+
+    def __init__(self, default_disaster=None, batch_size=BATCH_SIZE, dry_run=False):
+        self.default_disaster = default_disaster
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.imported = 0
+        self.rejected = 0
+        # Needs without coordinates placed from their location text
+        self.geocoded = 0
+        self.categories = {category.name.casefold(): category for category in Category.objects.all()}
+        self.disasters = {}
+        for disaster in Disaster.objects.all():
+            for key in (str(disaster.id), disaster.slug, disaster.name):
+                self.disasters.setdefault(key.casefold(), disaster)
+        self.choices = {
+            name: {
+                text.casefold(): value
+                for value, label in Need._meta.get_field(name).choices
+                for text in (value, str(label))
+            }
+            for name in ('status', 'priority')
+        }
+        self.max_lengths = {name: Need._meta.get_field(name).max_length for name in LENGTH_CHECKED}
+
+    def run(self, rows, reject=None, progress=None):
+        """Import ``rows``, header first.
+
+        ``reject(line, values, reason)`` is called for every row that is
+        skipped, and ``progress(importer)`` after every batch written.
+        """
+        rows = iter(rows)
+        columns = map_columns(next(rows, []))
+        if not any(column == ('need', 'title') for column in columns):
+            raise RowError('no title column')
+
+        batch = []
+        for line, values in enumerate(rows, start=2):
+            if not any(values):
+                continue
+            try:
+                batch.append(self.build(columns, values))
+            except RowError as e:
+                self.rejected += 1
+                if reject:
+                    reject(line, values, str(e))
+                continue
+            if len(batch) >= self.batch_size:
+                self.write(batch)
+                batch = []
+                if progress:
+                    progress(self)
+        if batch:
+            self.write(batch)
+            if progress:
+                progress(self)
+        if self.imported and not self.dry_run:
+            counters.invalidate()
+            cache.bump_data_version()
+            live.broker.notify()
+
+    def build(self, columns, values):
+        """(unsaved Need, {key: value} of its Fields) for one row."""
+        data = {}
+        fields = {}
+        for (kind, key), value in zip(columns, values):
+            value = value.strip()
+            if not value or kind is None:
+                continue
+            if kind == 'need':
+                data[key] = value
+            elif kind == 'geopoint':
+                parts = [part for part in _GEOPOINT_RE.split(value) if part]
+                if len(parts) < 2:
+                    raise RowError(f'{value!r} is not a point')
+                data.setdefault('latitude', parts[0])
+                data.setdefault('longitude', parts[1])
+            else:
+                fields[key] = value
+
+        if 'title' not in data:
+            raise RowError('title is required')
+        for name, max_length in self.max_lengths.items():
+            if len(data.get(name, '')) > max_length:
+                raise RowError(f'{name} is longer than {max_length} characters')
+
+        if 'disaster' in data:
+            disaster = self.disasters.get(data['disaster'].casefold())
+            if disaster is None:
+                raise RowError(f'unknown disaster {data["disaster"]!r}')
+        elif self.default_disaster is not None:
+            disaster = self.default_disaster
+        else:
+            raise RowError('no disaster given')
+
+        category = None
+        if 'category' in data:
+            category = self.categories.get(data['category'].casefold())
+            if category is None:
+                raise RowError(f'unknown category {data["category"]!r}')
+
+        choices = {}
+        for name, allowed in self.choices.items():
+            if name in data:
+                choices[name] = allowed.get(data[name].casefold())
+                if choices[name] is None:
+                    raise RowError(f'unknown {name} {data[name]!r}')
+
+        latitude = longitude = None
+        if ('latitude' in data) != ('longitude' in data):
+            raise RowError('latitude and longitude must be given together')
+        if 'latitude' in data:
+            latitude = parse_coordinate(data['latitude'], 90)
+            longitude = parse_coordinate(data['longitude'], 180)
+
+        need = Need(
+            disaster=disaster,
+            category=category,
+            title=data['title'],
+            description=data.get('description', ''),
+            location=data.get('location', ''),
+            city=data.get('city', ''),
+            latitude=latitude,
+            longitude=longitude,
+            contact_person=data.get('contact_person', ''),
+            contact_phone=data.get('contact_phone', ''),
+            **choices,
+        )
+        need.refresh_denormalized_fields()
+        return need, fields
+
+    def write(self, batch):
+        if not self.dry_run:
+            with transaction.atomic():
+                needs = Need.objects.bulk_create([need for need, _ in batch])
+                Field.objects.bulk_create([
+                    Field(need=need, key=key, value=value)
+                    for need, fields in batch
+                    for key, value in fields.items()
+                ])
+                search.get_backend().index_new_needs(needs)
+                search.index_new_fuzzy(needs)
+        self.imported += len(batch)
+        self.geocoded += sum(need.geocoded for need, _ in batch)
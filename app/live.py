@@ -0,0 +1,248 @@
+"""Live need updates for the map, pushed as Server-Sent Events.
+
+Each process runs one poller while at least one browser is subscribed. The
+poller asks the database for needs written past its position (an index
+seek on ``(updated_at, id)``), plus deletion tombstones, and fans the changes
+out to the subscribers whose disaster and type filters match. Polling the
+database instead of only listening to signals means writes made by other
+worker processes, management commands and the admin are pushed too. The
+``post_save`` handler in ``app.signals`` wakes the poller early, so changes
+made in the same process go out at once.
+
+The positions move past the last row read, so a burst sharing one
+``updated_at`` is worked through POLL_LIMIT rows at a time. A row can
+commit with an ``updated_at`` already behind them, so each poll also rereads
+a page of the OVERLAP window behind the positions, a different page each
+time, and drops what was sent already.
+
+Streams end after STREAM_SECONDS and the browser's EventSource reconnects,
+resuming from the ``Last-Event-ID`` it was given. Under WSGI, where a
+response cannot stay open cheaply, a stream sends what changed since that
+id and closes immediately, which degrades to long polling every
+RETRY_SECONDS.
+"""
+import asyncio
+import datetime
+import json
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
+
+from .models import ChangeLog, Need
+from .serializers import need_feature
+from .sync import after, parse_since
+
+POLL_SECONDS = 5
+STREAM_SECONDS = 300
+KEEPALIVE_SECONDS = 20
+RETRY_SECONDS = 5
+# Changes read per poll; anything beyond is picked up by the next poll
+POLL_LIMIT = 500
+# Events buffered per subscriber before it is told to reload instead
+QUEUE_SIZE = 200
+# Rows committed late can carry an updated_at behind the watermark
+OVERLAP = datetime.timedelta(seconds=30)
+
+
+def _sources():
+    """Event name -> (queryset, change time field) of each kind of change."""
+    return {
+        'need': (Need.objects.geolocated().select_related('category', 'disaster'), 'updated_at'),
+        'delete': (
+            ChangeLog.objects.filter(action='deleted', content_type=ContentType.objects.get_for_model(Need))
+            .only('id', 'object_id', 'timestamp'),
+            'timestamp',
+        ),
+    }
+
+
+def _event(kind, row):
+    if kind == 'need':
+        return row.disaster_id, row.category_type, 'need', (row.id, row.updated_at, need_feature(row))
+    return None, None, 'delete', (row.object_id, row.timestamp, {'id': row.object_id})
+
+
+def start_positions(since):
+    """Positions reading every change at or after ``since``."""
+    return {kind: (since, None) for kind in ('need', 'delete')}
+
+
+def fetch_changes(positions, until=None):
+    """(events, positions) for need writes and deletions at or after
+    ``positions``, and before ``until`` when given; both hold a (time, id)
+    position per event name (see start_positions()).
+
+    Up to POLL_LIMIT rows of each kind are read, oldest first. The positions
+    returned are past the last row read of each kind. Events are
+    (disaster_id, category_type, event, payload).
+    """
+    events = []
+    positions = dict(positions)
+    for kind, (queryset, field) in _sources().items():
+        queryset = queryset.filter(after(field, positions[kind]))
+        if until is not None:
+            queryset = queryset.exclude(after(field, until[kind]))
+        rows = list(queryset.order_by(field, 'id')[:POLL_LIMIT])
+        if rows:
+            positions[kind] = (getattr(rows[-1], field), rows[-1].id)
+        events += [_event(kind, row) for row in rows]
+    return events, positions
+
+
+class Subscription:
+    def __init__(self, disaster_id=None, entry_type=None):
+        self.disaster_id = disaster_id
+        self.entry_type = entry_type
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+
+    def wants(self, disaster_id, category_type):
+        # Deletions carry no filter values and go to everyone
+        if disaster_id is None:
+            return True
+        return ((self.disaster_id is None or self.disaster_id == disaster_id)
+                and (self.entry_type is None or self.entry_type == category_type))
+
+    def put(self, event, data):
+        try:
+            self.queue.put_nowait((event, data))
+        except asyncio.QueueFull:
+            # Too far behind: drop the backlog, the client reloads its viewport
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(('reload', {}))
+
+
+class Broker:
+    """Per-process fan-out of need changes to live map subscribers."""
+
+    def __init__(self):
+        self.subscriptions = set()
+        self.loop = None
+        self.wakeup = None
+        self.task = None
+        # Per event name, the (time, id) of the last row read and where the
+        # next reread of the OVERLAP window behind it starts
+        self.positions = None
+        self.rescan = {}
+        # (id, updated_at) already sent, to skip rows re-read in OVERLAP
+        self.sent = {}
+
+    @property
+    def watermark(self):
+        """The time everything before has been read."""
+        return min(changed_at for changed_at, _ in self.positions.values())
+
+    def subscribe(self, subscription):
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop:
+            self.loop = loop
+            self.wakeup = asyncio.Event()
+            self.task = None
+        self.subscriptions.add(subscription)
+        if self.task is None or self.task.done():
+            self.positions = start_positions(timezone.now())
+            self.rescan = {}
+            self.sent = {}
+            self.task = loop.create_task(self.run())
+
+    def unsubscribe(self, subscription):
+        self.subscriptions.discard(subscription)
+
+    def notify(self):
+        """Wake the poller now; safe to call from any thread, or with no poller."""
+        if self.loop is not None and self.subscriptions and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    async def run(self):
+        while self.subscriptions:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            self.publish(await sync_to_async(self.poll)())
+            horizon = self.watermark - OVERLAP
+            self.sent = {key: at for key, at in self.sent.items() if at >= horizon}
+
+    def poll(self):
+        """Read the next changes, and a page of the OVERLAP window behind them."""
+        events, self.positions = fetch_changes(self.positions)
+        # Start the reread over once it falls out of the window or runs out
+        starts = {}
+        for kind, (changed_at, _) in self.positions.items():
+            start = self.rescan.get(kind)
+            if start is None or start[0] < changed_at - OVERLAP:
+                start = (changed_at - OVERLAP, None)
+            starts[kind] = start
+        late, reached = fetch_changes(starts, until=self.positions)
+        read = Counter(event for _, _, event, _ in late)
+        self.rescan = {kind: reached[kind] for kind in starts if read[kind] >= POLL_LIMIT}
+        return events + late
+
+    def publish(self, events):
+        for disaster_id, category_type, event, (object_id, changed_at, data) in events:
+            key = (event, object_id, changed_at)
+            if key in self.sent:
+                continue
+            self.sent[key] = changed_at
+            for subscription in list(self.subscriptions):
+                if subscription.wants(disaster_id, category_type):
+                    subscription.put(event, data)
+
+
+broker = Broker()
+
+
+def format_event(event=None, data=None, event_id=None, retry=None):
+    lines = []
+    if retry is not None:
+        lines.append(f'retry: {retry}')
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    if event is not None:
+        lines.append(f'event: {event}')
+    if data is not None:
+        lines.append(f'data: {json.dumps(data, separators=(",", ":"))}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def opening_messages(subscription, last_event_id=None):
+    """The messages a stream starts with: the reconnect settings, then what
+    changed since ``last_event_id`` while the client was reconnecting."""
+    messages = [format_event(event_id=timezone.now().isoformat(), retry=RETRY_SECONDS * 1000)]
+    try:
+        since = parse_since(last_event_id) if last_event_id else None
+    except ValueError:
+        since = None
+    if since is not None:
+        events, _ = fetch_changes(start_positions(since))
+        messages += [
+            format_event(event, data)
+            for disaster_id, category_type, event, (_, _, data) in events
+            if subscription.wants(disaster_id, category_type)
+        ]
+    return messages
+
+
+async def event_stream(subscription, last_event_id=None):
+    """Yield SSE messages for ``subscription`` for up to STREAM_SECONDS."""
+    for message in await sync_to_async(opening_messages)(subscription, last_event_id):
+        yield message
+
+    broker.subscribe(subscription)
+    try:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + STREAM_SECONDS
+        while (remaining := deadline - loop.time()) > 0:
+            try:
+                event, data = await asyncio.wait_for(
+                    subscription.queue.get(), min(KEEPALIVE_SECONDS, remaining),
+                )
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            yield format_event(event, data, event_id=broker.watermark.isoformat())
+    finally:
+        broker.unsubscribe(subscription)
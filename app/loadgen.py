@@ -0,0 +1,314 @@
+"""Synthetic needs at production volume, for load tests and benchmarks.
+
+Volumes and shapes follow what the 2022 floods produced: reports cluster
+around the affected districts of Sindh, southern Punjab and KP rather than
+spreading evenly over the map, a few categories and the "medium" priority
+dominate, most needs are still open, and reports arrive mostly in the first
+weeks of a disaster. Each need gets a skewed number of fields, comments,
+resources, photos, reports and change log entries.
+
+Everything is drawn from one ``random.Random(seed)``. The same seed and
+batch size on the same starting database give the same rows, with dates
+relative to the day it runs. Rows are written with ``bulk_create`` a batch at a time and, like
+``app.importer``, indexed for search per batch. Photo rows point at image
+names that do not exist on disk.
+"""
+import contextlib
+import datetime
+import random
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.utils import timezone
+
+from . import cache, counters, search
+from .models import (
+    Category, ChangeLog, Comment, Disaster, Field, Need, Organization, Photo,
+    Report, Resource,
+)
+
+BATCH_SIZE = 2000
+
+# (place, latitude, longitude, weight, spread in degrees)
+PLACES = [
+    ('Jacobabad', 28.28, 68.44, 10, 0.3),
+    ('Dadu', 26.73, 67.78, 9, 0.4),
+    ('Larkana', 27.56, 68.21, 8, 0.3),
+    ('Sukkur', 27.70, 68.86, 7, 0.3),
+    ('Khairpur', 27.53, 68.76, 6, 0.4),
+    ('Nawabshah', 26.24, 68.41, 6, 0.3),
+    ('Sanghar', 26.05, 68.95, 5, 0.3),
+    ('Mirpurkhas', 25.53, 69.01, 4, 0.3),
+    ('Badin', 24.66, 68.84, 4, 0.3),
+    ('Thatta', 24.75, 67.92, 3, 0.3),
+    ('Hyderabad', 25.39, 68.37, 5, 0.15),
+    ('Karachi', 24.86, 67.01, 6, 0.15),
+    ('Rajanpur', 29.10, 70.33, 6, 0.4),
+    ('Dera Ghazi Khan', 30.05, 70.64, 5, 0.4),
+    ('Dera Ismail Khan', 31.83, 70.90, 4, 0.4),
+    ('Nowshera', 34.02, 71.98, 4, 0.2),
+    ('Charsadda', 34.15, 71.73, 3, 0.2),
+    ('Swat', 34.78, 72.36, 4, 0.3),
+    ('Jaffarabad', 28.30, 68.20, 4, 0.3),
+    ('Naseerabad', 28.53, 68.45, 3, 0.3),
+    ('Quetta', 30.18, 66.99, 2, 0.2),
+    ('Lahore', 31.55, 74.34, 1, 0.15),
+]
+
+# (name, category_type, weight); names match seed_data's categories
+CATEGORIES = [
+    ('Relief Needed', 'problem', 30),
+    ('Flooded/Affected Areas', 'problem', 18),
+    ('Relief Camps / Shelters', 'service', 12),
+    ('Medical Camps', 'service', 8),
+    ('Damaged Roads / Railways', 'problem', 7),
+    ('Destroyed Buildings', 'problem', 6),
+    ('Disease Outbreaks/Medical Cases', 'problem', 5),
+    ('Kitchens', 'service', 4),
+    ('Relief Collection Points', 'service', 3),
+    ('Water Filtration Plant', 'service', 2),
+    ('Schools for Flood Affected', 'service', 2),
+    ('Fundraisers / Charities', 'information', 2),
+    ('Govt. Data on the Water Flow', 'information', 1),
+]
+
+STATUS_WEIGHTS = {'open': 60, 'in_progress': 15, 'resolved': 15, 'verified': 5, 'closed': 4, 'reopened': 1}
+PRIORITY_WEIGHTS = {'low': 25, 'medium': 45, 'high': 22, 'urgent': 8}
+RESOURCE_STATUS_WEIGHTS = {'offered': 55, 'confirmed': 20, 'delivered': 20, 'cancelled': 5}
+
+# Child rows per need are int(expovariate) at these scales: most needs get
+# none or one, a few get many
+MEAN_FIELDS = 1.5
+MEAN_COMMENTS = 1.5
+MEAN_RESOURCES = 0.5
+MEAN_PHOTOS = 0.3
+# Share of needs flagged by the community, each by one or more reporters
+FLAGGED_SHARE = 0.03
+# Share of needs reported without coordinates
+UNPLACED_SHARE = 0.1
+# Mean days between a disaster's start and a report
+MEAN_REPORT_DAYS = 10
+
+ITEMS = [
+    'Drinking water', 'Food rations', 'Tents', 'Mosquito nets', 'Medicines',
+    'Baby formula', 'Blankets', 'Boats', 'Hygiene kits', 'Fodder',
+    'Tarpaulins', 'Water purification tablets', 'Cooked meals', 'Doctors',
+]
+NEEDS_FOR = ['families', 'households', 'children', 'people', 'patients']
+FIELD_KEYS = [
+    ('families_affected', 'number'), ('people_affected', 'number'),
+    ('water_depth_ft', 'number'), ('access', 'text'), ('union_council', 'text'),
+    ('reported_via', 'text'),
+]
+COMMENTS = [
+    'Team reached the site, distribution started.',
+    'Road is still cut off, boats needed to reach them.',
+    'Still waiting for help here.',
+    'Verified by local volunteers.',
+    'Supplies delivered this morning.',
+    'Water level rising again.',
+]
+
+
+@contextlib.contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create keep the created/updated times set on instances,
+    which auto_now and auto_now_add would otherwise overwrite."""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Generator:
+    """Writes ``needs`` synthetic needs and their related rows."""
+
+    def __init__(self, seed=0, disasters=3, users=200, batch_size=BATCH_SIZE, index=True):
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.index = index
+        self.now = timezone.now()
+        self.disasters = self._disasters(disasters)
+        self.categories = self._categories()
+        self.users = self._users(users)
+        self.organizations = self._organizations()
+        self.need_type = ContentType.objects.get_for_model(Need)
+        self.created = 0
+
+    def _disasters(self, count):
+        disasters = []
+        for i in range(count):
+            disaster, _ = Disaster.objects.get_or_create(
+                slug=f'load-test-{i + 1}',
+                defaults={
+                    'name': f'Load test floods {i + 1}',
+                    'affected_areas': ', '.join(place[0] for place in PLACES),
+                    'severity': 'critical' if i == 0 else 'high',
+                    'start_date': (self.now - datetime.timedelta(days=90 - 20 * i)).date(),
+                },
+            )
+            disasters.append(disaster)
+        return disasters
+
+    def _categories(self):
+        categories = []
+        for name, category_type, _ in CATEGORIES:
+            category, _ = Category.objects.get_or_create(name=name, defaults={'category_type': category_type})
+            categories.append(category)
+        return categories
+
+    def _users(self, count):
+        User.objects.bulk_create([
+            User(username=f'load-user-{i + 1}', password='!') for i in range(count)
+        ], ignore_conflicts=True)
+        return list(User.objects.filter(username__startswith='load-user-').order_by('id'))
+
+    def _organizations(self):
+        organizations = []
+        for i, organization_type in enumerate(['ngo', 'government', 'charity', 'international', 'private']):
+            organization, _ = Organization.objects.get_or_create(
+                name=f'Load test {organization_type} {i + 1}',
+                defaults={'organization_type': organization_type},
+            )
+            organizations.append(organization)
+        return organizations
+
+    def count(self, mean):
+        return int(self.rng.expovariate(1 / mean)) if mean else 0
+
+    def choice(self, weights):
+        return self.rng.choices(list(weights), list(weights.values()))[0]
+
+    def run(self, needs, progress=None):
+        """Create ``needs`` needs; ``progress(generator)`` is called per batch."""
+        with explicit_timestamps(Need, Comment, Resource, Photo, Report, ChangeLog):
+            while self.created < needs:
+                self.write(min(self.batch_size, needs - self.created))
+                if progress:
+                    progress(self)
+        counters.invalidate()
+        cache.bump_data_version()
+
+    def need(self):
+        rng = self.rng
+        # Earlier disasters are bigger
+        disaster = rng.choices(self.disasters, [2 ** -i for i in range(len(self.disasters))])[0]
+        category = rng.choices(self.categories, [weight for _, _, weight in CATEGORIES])[0]
+        place, latitude, longitude, _, spread = rng.choices(PLACES, [place[3] for place in PLACES])[0]
+        placed = rng.random() >= UNPLACED_SHARE
+
+        start = datetime.datetime.combine(disaster.start_date, datetime.time(), tzinfo=datetime.timezone.utc)
+        created_at = min(start + datetime.timedelta(days=rng.expovariate(1 / MEAN_REPORT_DAYS)), self.now)
+        updated_at = min(created_at + datetime.timedelta(hours=rng.expovariate(1 / 24)), self.now)
+        status = self.choice(STATUS_WEIGHTS)
+        item = rng.choice(ITEMS)
+        size = min(int(rng.paretovariate(1.2) * 10), 5000)
+        flags = self.count(2) + 1 if rng.random() < FLAGGED_SHARE else 0
+        verified = rng.random() < 0.3
+
+        need = Need(
+            disaster=disaster,
+            category=category,
+            title=f'{item} needed in {place}',
+            description=f'{item} needed for about {size} {rng.choice(NEEDS_FOR)} near {place}. '
+                        f'Reported by local volunteers.',
+            location=f'Near {place}',
+            city=place,
+            latitude=round(rng.gauss(latitude, spread), 6) if placed else None,
+            longitude=round(rng.gauss(longitude, spread), 6) if placed else None,
+            contact_person=f'Volunteer {rng.randrange(10000)}',
+            contact_phone=f'+92-300-{rng.randrange(10 ** 7):07d}',
+            status=status,
+            priority=self.choice(PRIORITY_WEIGHTS),
+            reported_by=rng.choice(self.users),
+            is_verified=verified,
+            verified_by=rng.choice(self.users) if verified else None,
+            verified_at=updated_at if verified else None,
+            flag_count=flags,
+            is_flagged=flags >= 3,
+            created_at=created_at,
+            updated_at=updated_at,
+            resolved_at=updated_at if status in ('resolved', 'closed') else None,
+        )
+        need.refresh_denormalized_fields()
+        return need
+
+    def related(self, need):
+        """Unsaved rows belonging to a saved need, by model."""
+        rng = self.rng
+        rows = {model: [] for model in (Field, Comment, Resource, Photo, Report, ChangeLog)}
+
+        keys = rng.sample(FIELD_KEYS, min(self.count(MEAN_FIELDS), len(FIELD_KEYS)))
+        for key, field_type in keys:
+            value = str(rng.randrange(1, 500)) if field_type == 'number' else f'{key.replace("_", " ")} {rng.randrange(100)}'
+            rows[Field].append(Field(need=need, key=key, value=value, field_type=field_type))
+
+        def later(days=5):
+            return min(need.created_at + datetime.timedelta(days=rng.expovariate(1 / days)), self.now)
+
+        for _ in range(self.count(MEAN_COMMENTS)):
+            at = later()
+            rows[Comment].append(Comment(
+                need=need, user=rng.choice(self.users), text=rng.choice(COMMENTS),
+                is_status_update=rng.random() < 0.2, created_at=at, updated_at=at,
+            ))
+        for _ in range(self.count(MEAN_RESOURCES)):
+            at = later()
+            by_organization = rng.random() < 0.4
+            rows[Resource].append(Resource(
+                need=need,
+                provider_user=None if by_organization else rng.choice(self.users),
+                provider_organization=rng.choice(self.organizations) if by_organization else None,
+                description=f'Can provide {need.title.split(" needed")[0].lower()}',
+                quantity=f'{rng.randrange(1, 200)} units',
+                status=self.choice(RESOURCE_STATUS_WEIGHTS),
+                created_at=at, updated_at=at,
+            ))
+        for _ in range(self.count(MEAN_PHOTOS)):
+            rows[Photo].append(Photo(
+                need=need, image=f'needs/load/{rng.randrange(1000)}.jpg',
+                uploaded_by=rng.choice(self.users), uploaded_at=later(1),
+            ))
+        for reporter in rng.sample(self.users, min(need.flag_count, len(self.users))):
+            rows[Report].append(Report(
+                content_type=self.need_type, object_id=need.id,
+                report_type=rng.choice(Report.REPORT_TYPES)[0],
+                description='Looks out of date', reported_by=reporter, created_at=later(),
+            ))
+
+        rows[ChangeLog].append(ChangeLog(
+            content_type=self.need_type, object_id=need.id, user=need.reported_by,
+            action='created', timestamp=need.created_at,
+        ))
+        if need.status != 'open':
+            rows[ChangeLog].append(ChangeLog(
+                content_type=self.need_type, object_id=need.id, user=rng.choice(self.users),
+                action='status_changed', field_changes={'status': ['open', need.status]},
+                timestamp=need.updated_at,
+            ))
+        return rows
+
+    def write(self, size):
+        with transaction.atomic():
+            needs = Need.objects.bulk_create([self.need() for _ in range(size)])
+            rows = {}
+            for need in needs:
+                for model, objs in self.related(need).items():
+                    rows.setdefault(model, []).extend(objs)
+            for model, objs in rows.items():
+                model.objects.bulk_create(objs)
+            if self.index:
+                backend = search.get_backend()
+                backend.index_new_needs(needs)
+                backend.index_new_resources(rows.get(Resource, []))
+                search.index_new_fuzzy(needs)
+        self.created += size
@@ -0,0 +1,144 @@
+import json
+import os
+import subprocess
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from app import benchmark, loadgen
+from app.models import Need
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark every public view and API against generated datasets in a '
+        'separate test database, optionally failing on regressions against a baseline'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='1000,10000,100000',
+            help='Comma separated numbers of needs to benchmark at (default: 1000,10000,100000)',
+        )
+        parser.add_argument('--seed', type=int, default=0, help='Seed for the generated data (default: 0)')
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=benchmark.REPEAT,
+            help=f'Timed requests per scenario (default: {benchmark.REPEAT})',
+        )
+        parser.add_argument(
+            '--warmup',
+            type=int,
+            default=benchmark.WARMUP,
+            help=f'Untimed requests per scenario first (default: {benchmark.WARMUP})',
+        )
+        parser.add_argument('--only', help='Comma separated scenario names to run')
+        parser.add_argument('--output', '-o', help='Write the results to this JSON file')
+        parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=benchmark.THRESHOLD,
+            help=f'Relative median slowdown that counts as a regression (default: {benchmark.THRESHOLD})',
+        )
+        parser.add_argument(
+            '--keepdb',
+            action='store_true',
+            help='Keep the benchmark database, and reuse the one left by an earlier run',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted({int(size) for size in options['sizes'].split(',')})
+        except ValueError:
+            raise CommandError('--sizes must be comma separated numbers')
+        if not sizes or sizes[0] < 1 or options['repeat'] < 1 or options['warmup'] < 0:
+            raise CommandError('--sizes and --repeat must be positive')
+
+        scenarios = benchmark.SCENARIOS
+        if options['only']:
+            names = set(options['only'].split(','))
+            scenarios = [scenario for scenario in scenarios if scenario.name in names]
+            unknown = names - {scenario.name for scenario in scenarios}
+            if unknown:
+                raise CommandError(f'Unknown scenarios: {", ".join(sorted(unknown))}')
+        for name in sorted(benchmark.uncovered_routes()):
+            self.stderr.write(self.style.WARNING(f'No benchmark scenario for route {name!r}'))
+
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as f:
+                baseline = json.load(f)['results']
+
+        results = self.run(sizes, scenarios, options)
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'commit': self.commit(),
+            'database': connection.vendor,
+            'seed': options['seed'],
+            'warmup': options['warmup'],
+            'repeat': options['repeat'],
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+                f.write('\n')
+            self.stdout.write(self.style.SUCCESS(f'Wrote {options["output"]}'))
+
+        if baseline is not None:
+            regressions = benchmark.compare(baseline, results, options['threshold'])
+            if regressions:
+                raise CommandError('Regressions against the baseline:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
+
+    def run(self, sizes, scenarios, options):
+        if connection.vendor == 'sqlite':
+            # The test database would otherwise live in memory, unlike production
+            connection.settings_dict['TEST']['NAME'] = os.path.join(
+                tempfile.gettempdir(), 'floodlight-benchmark.sqlite3',
+            )
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False, keepdb=options['keepdb'],
+        )
+        setup_test_environment()
+        try:
+            generator = loadgen.Generator(seed=options['seed'])
+            results = {}
+            for size in sizes:
+                missing = size - Need.objects.count()
+                if missing > 0:
+                    self.stderr.write(f'Generating {missing} needs...')
+                    generator.run(missing)
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+                self.stdout.write(f'{size} needs')
+                results[str(size)] = benchmark.run(
+                    scenarios, options['warmup'], options['repeat'], self.progress,
+                )
+            return results
+        finally:
+            teardown_test_environment()
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+    def progress(self, scenario, result):
+        style = self.style.ERROR if result['status'] >= 400 else (lambda text: text)
+        self.stdout.write(style(
+            f'  {scenario.name:<22} p50 {result["p50_ms"]:8.1f}ms  p90 {result["p90_ms"]:8.1f}ms  '
+            f'p99 {result["p99_ms"]:8.1f}ms  {result["queries"]:3d} queries  {result["bytes"]:9d} bytes'
+        ))
+
+    def commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from app import export
+
+
+class Command(BaseCommand):
+    help = 'Export needs as GeoJSON, NDJSON or CSV, streaming rows to a file or stdout'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format',
+            choices=list(export.FORMATS),
+            default='geojson',
+            help='Output format (default: geojson)',
+        )
+        parser.add_argument(
+            '--output', '-o',
+            help='File to write to (default: stdout)',
+        )
+        parser.add_argument(
+            '--type',
+            choices=['problem', 'service', 'information'],
+            help='Only export needs of this category type',
+        )
+        parser.add_argument('--disaster', type=int, help='Only export needs of this disaster id')
+        parser.add_argument('--status', help='Only export needs with this status')
+
+    def handle(self, *args, **options):
+        fmt = export.FORMATS[options['format']]
+        needs = export.export_needs(
+            entry_type=options['type'],
+            disaster_id=options['disaster'],
+            status=options['status'],
+        )
+
+        if not options['output']:
+            for chunk in export.chunks(fmt, needs):
+                self.stdout.write(chunk, ending='')
+            return
+
+        with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+            for chunk in export.chunks(fmt, needs):
+                f.write(chunk)
+        self.stderr.write(self.style.SUCCESS(f'Wrote {options["output"]}'))
@@ -0,0 +1,70 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app import loadgen
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic needs at production volume for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--needs',
+            type=int,
+            default=100000,
+            help='Number of needs to create (default: 100000)',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Random seed; the same seed gives the same data (default: 0)',
+        )
+        parser.add_argument(
+            '--disasters',
+            type=int,
+            default=3,
+            help='Number of load test disasters to spread needs over (default: 3)',
+        )
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=200,
+            help='Number of load test users acting as reporters (default: 200)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=loadgen.BATCH_SIZE,
+            help=f'Needs written per transaction (default: {loadgen.BATCH_SIZE})',
+        )
+        parser.add_argument(
+            '--no-search-index',
+            action='store_true',
+            help='Skip indexing the new needs for search, which is faster',
+        )
+
+    def handle(self, *args, **options):
+        for name in ('needs', 'disasters', 'users', 'batch_size'):
+            if options[name] < 1:
+                raise CommandError(f'--{name.replace("_", "-")} must be at least 1')
+
+        generator = loadgen.Generator(
+            seed=options['seed'],
+            disasters=options['disasters'],
+            users=options['users'],
+            batch_size=options['batch_size'],
+            index=not options['no_search_index'],
+        )
+        started = time.monotonic()
+
+        def progress(generator):
+            if options['verbosity'] >= 1:
+                rate = generator.created / (time.monotonic() - started)
+                self.stderr.write(f'{generator.created}/{options["needs"]} needs ({rate:.0f}/s)')
+
+        generator.run(options['needs'], progress)
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {generator.created} needs in {time.monotonic() - started:.1f}s'
+        ))
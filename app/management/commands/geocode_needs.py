@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app import geocoding
+
+
+class Command(BaseCommand):
+    help = 'Place needs without coordinates on the map from their location and city, using the gazetteer'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--redo',
+            action='store_true',
+            help='Also geocode needs placed from the gazetteer before, e.g. after adding GAZETTEER_FILES',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=geocoding.BATCH_SIZE,
+            help=f'Needs read and written at a time (default: {geocoding.BATCH_SIZE})',
+        )
+        parser.add_argument(
+            '--unresolved',
+            type=int,
+            default=20,
+            help='Show this many of the most common locations that could not be placed (default: 20)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Count what would change without writing anything',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        result = geocoding.geocode_needs(
+            redo=options['redo'], batch_size=options['batch_size'], dry_run=options['dry_run'],
+        )
+        for text, count in result.unresolved.most_common(options['unresolved']):
+            self.stdout.write(f'{count:6}  {text}')
+
+        verb = 'Would geocode' if options['dry_run'] else 'Geocoded'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {result.geocoded} of {result.checked} needs checked, '
+            f'{sum(result.unresolved.values())} not placed, {result.cleared} no longer placed'
+        ))
@@ -0,0 +1,101 @@
+import csv
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app import importer
+from app.models import Disaster
+
+
+class Command(BaseCommand):
+    help = 'Import needs from a CSV or .xlsx file, such as a KoBoToolbox export'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or .xlsx file to import')
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'xlsx'],
+            help='File format (default: from the file extension)',
+        )
+        parser.add_argument(
+            '--disaster',
+            help='Slug or id of the disaster for rows without a disaster column',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=importer.BATCH_SIZE,
+            help=f'Needs written per transaction (default: {importer.BATCH_SIZE})',
+        )
+        parser.add_argument(
+            '--rejects',
+            help='CSV file to write rejected rows to, with the line number and reason',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Validate every row without writing anything',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        default_disaster = None
+        if options['disaster']:
+            value = options['disaster']
+            lookup = {'id': value} if value.isdigit() else {'slug': value}
+            try:
+                default_disaster = Disaster.objects.get(**lookup)
+            except Disaster.DoesNotExist:
+                raise CommandError(f'Disaster {value!r} does not exist')
+
+        fmt = options['format'] or os.path.splitext(options['path'])[1].lstrip('.').lower()
+        if fmt not in ('csv', 'xlsx'):
+            raise CommandError('Cannot tell the file format, pass --format')
+
+        run = importer.Importer(
+            default_disaster=default_disaster,
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+        )
+        rejects_file = open(options['rejects'], 'w', encoding='utf-8', newline='') if options['rejects'] else None
+        rejects = csv.writer(rejects_file) if rejects_file else None
+        started = time.monotonic()
+
+        def reject(line, values, reason):
+            if rejects:
+                rejects.writerow([line, reason, *values])
+            if options['verbosity'] >= 2:
+                self.stderr.write(f'Line {line}: {reason}')
+
+        def progress(run):
+            if options['verbosity'] >= 2:
+                self.stderr.write(f'{run.imported} imported, {run.rejected} rejected')
+
+        try:
+            if fmt == 'xlsx':
+                try:
+                    rows = importer.read_xlsx(options['path'])
+                    run.run(rows, reject, progress)
+                except ImportError:
+                    raise CommandError('Reading .xlsx files needs openpyxl: pip install openpyxl')
+            else:
+                with open(options['path'], encoding='utf-8-sig', newline='') as f:
+                    run.run(importer.read_csv(f), reject, progress)
+        except importer.RowError as e:
+            raise CommandError(str(e))
+        except OSError as e:
+            raise CommandError(e)
+        finally:
+            if rejects_file:
+                rejects_file.close()
+
+        elapsed = time.monotonic() - started
+        rate = (run.imported + run.rejected) / elapsed if elapsed else 0
+        verb = 'Validated' if options['dry_run'] else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {run.imported} needs ({run.geocoded} placed from their location), '
+            f'rejected {run.rejected} rows in {elapsed:.1f}s ({rate:.0f} rows/s)'
+        ))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from PIL import Image, UnidentifiedImageError
+
+from app import images
+from app.models import Photo
+
+
+class Command(BaseCommand):
+    help = 'Resize, recompress and make thumbnails of photos that have not been processed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Count the photos to process without changing anything',
+        )
+
+    def handle(self, *args, **options):
+        photos = Photo.objects.filter(width__isnull=True).exclude(image='').order_by('id')
+        if options['dry_run']:
+            self.stdout.write(f'{photos.count()} photos to process')
+            return
+
+        processed = failed = 0
+        for photo in photos.iterator():
+            try:
+                images.process_photo(photo)
+            except (OSError, UnidentifiedImageError, Image.DecompressionBombError) as e:
+                # Missing files, files that are not images and images too
+                # large to decode stay as they are
+                failed += 1
+                self.stderr.write(f'Photo {photo.id} ({photo.image.name}): {e}')
+                continue
+            processed += 1
+            if options['verbosity'] >= 2:
+                self.stdout.write(f'Photo {photo.id}: {photo.image.name}, {len(photo.thumbnails)} thumbnails')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {processed} photos ({images.output_format()}), {failed} failed'
+        ))
@@ -0,0 +1,45 @@
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app import tasks
+
+
+class Command(BaseCommand):
+    help = 'Run queued background tasks (see app.tasks) until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run the tasks that are due, then exit',
+        )
+        parser.add_argument(
+            '--poll',
+            type=float,
+            default=tasks.POLL_SECONDS,
+            help=f'Seconds to wait when the queue is empty (default: {tasks.POLL_SECONDS})',
+        )
+        parser.add_argument(
+            '--name',
+            help='Name the worker marks its tasks with (default: host:pid)',
+        )
+
+    def handle(self, *args, **options):
+        if options['poll'] <= 0:
+            raise CommandError('--poll must be positive')
+        worker = tasks.Worker(name=options['name'], poll_seconds=options['poll'])
+
+        if options['once']:
+            worker.housekeeping()
+            worker.run_pending()
+        else:
+            def stop(signum, frame):
+                # The task being run is finished first
+                worker.stop()
+            signal.signal(signal.SIGTERM, stop)
+            signal.signal(signal.SIGINT, stop)
+            self.stdout.write(f'Worker {worker.name} waiting for tasks')
+            worker.run()
+
+        self.stdout.write(self.style.SUCCESS(f'Ran {worker.done} tasks, {worker.failed} failed'))
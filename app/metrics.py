@@ -0,0 +1,245 @@
+"""Request metrics in the Prometheus text format, and JSON request logs.
+
+``RequestMetricsMiddleware`` (``app.middleware``) records every request
+against its route (the URL pattern's view name, never the raw path):
+
+- a counter of requests by method and status
+- a latency histogram
+- response bytes
+- page cache hits, misses and 304s
+
+A METRICS_SAMPLE_RATE share of requests is also sampled. Its database
+queries are counted and timed into two more histograms, whose ``_count``
+is the number of sampled requests, and it is logged as one JSON line to the
+``app.requests`` logger. Everything else is a few dictionary updates per
+request, cheap enough to leave on.
+
+Latency and bytes stop when the response is returned: a streaming response
+is timed to its first byte and its size is not known. The metrics live in
+the process that served the requests, so with several workers each one
+reports its own share to whoever scrapes it.
+"""
+import bisect
+import json
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger('app.requests')
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+# Anything else is counted as 'other', so made-up methods cannot add series
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+_lock = threading.Lock()
+# Database stats of the sampled request running in this context, if any.
+# asgiref copies the context into sync_to_async threads, so queries made by
+# async views are counted too.
+_db_stats = ContextVar('db_stats', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(value) if value != int(value) else str(int(value))
+    return str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.values = {}
+
+    def inc(self, labels=(), amount=1):
+        with _lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} counter'
+        for labels, value in sorted(self.values.items()):
+            yield f'{self.name}{_labels(self.labels, labels)} {_number(value)}'
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.labels = labels
+        # Labels -> [count per bucket plus one for +Inf, sum]
+        self.values = {}
+
+    def observe(self, labels, value):
+        with _lock:
+            series = self.values.get(labels)
+            if series is None:
+                series = self.values[labels] = [[0] * (len(self.buckets) + 1), 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def render(self):
+        yield f'# HELP {self.name} {self.documentation}'
+        yield f'# TYPE {self.name} histogram'
+        for labels, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                le = (('le', _number(bound)),)
+                yield f'{self.name}_bucket{_labels(self.labels, labels, le)} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.labels, labels)} {_number(total)}'
+            yield f'{self.name}_count{_labels(self.labels, labels)} {cumulative}'
+
+
+REQUESTS = Counter('floodlight_requests_total', 'Requests by route, method and status.', ('view', 'method', 'status'))
+DURATION = Histogram(
+    'floodlight_request_duration_seconds', 'Time to build the response, by route.',
+    DURATION_BUCKETS, ('view',),
+)
+RESPONSE_BYTES = Counter(
+    'floodlight_response_bytes_total', 'Bytes of non-streaming response bodies, by route.', ('view',),
+)
+PAGE_CACHE = Counter(
+    'floodlight_page_cache_total', 'Page cache results (hit, miss, not_modified), by route.', ('view', 'result'),
+)
+DB_QUERIES = Histogram(
+    'floodlight_request_db_queries', 'Database queries per sampled request, by route.',
+    QUERY_BUCKETS, ('view',),
+)
+DB_DURATION = Histogram(
+    'floodlight_request_db_seconds', 'Time spent in database queries per sampled request, by route.',
+    DURATION_BUCKETS, ('view',),
+)
+METRICS = [REQUESTS, DURATION, RESPONSE_BYTES, PAGE_CACHE, DB_QUERIES, DB_DURATION]
+
+
+def exposition():
+    """Every metric in the Prometheus text exposition format."""
+    lines = [
+        '# HELP floodlight_metrics_sample_rate Share of requests whose database use is measured.',
+        '# TYPE floodlight_metrics_sample_rate gauge',
+        f'floodlight_metrics_sample_rate {_number(float(settings.METRICS_SAMPLE_RATE))}',
+    ]
+    with _lock:
+        for metric in METRICS:
+            lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    with _lock:
+        for metric in METRICS:
+            metric.values.clear()
+
+
+class DBStats:
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+def record_query(execute, sql, params, many, context):
+    stats = _db_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.seconds += time.perf_counter() - started
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    # The wrapper stays on the connection object across reconnects. It goes
+    # first because connection.execute_wrapper() pops the last one on exit.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+class RequestSample:
+    """Measures one request, from before the view runs to its response."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db = DBStats() if random.random() < settings.METRICS_SAMPLE_RATE else None
+        self._token = _db_stats.set(self.db)
+
+    def finish(self, request, response):
+        seconds = time.perf_counter() - self.started
+        _db_stats.reset(self._token)
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unmatched'
+
+        method = request.method if request.method in METHODS else 'other'
+        REQUESTS.inc((view, method, str(response.status_code)))
+        DURATION.observe((view,), seconds)
+        size = None
+        if not response.streaming:
+            size = len(response.content)
+            RESPONSE_BYTES.inc((view,), size)
+        cache_result = 'not_modified' if response.status_code == 304 else response.get('X-Cache', '').lower()
+        if cache_result:
+            PAGE_CACHE.inc((view, cache_result))
+
+        if self.db is None:
+            return
+        DB_QUERIES.observe((view,), self.db.queries)
+        DB_DURATION.observe((view,), self.db.seconds)
+        logger.info(
+            '%s %s %s', request.method, request.path, response.status_code,
+            extra={
+                'method': request.method,
+                'path': request.path,
+                'view': view,
+                'status': response.status_code,
+                'duration_ms': round(seconds * 1000, 2),
+                'bytes': size,
+                'cache': cache_result or None,
+                'db_queries': self.db.queries,
+                'db_ms': round(self.db.seconds * 1000, 2),
+            },
+        )
+
+
+# Attributes every LogRecord has; anything else was passed in ``extra``
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+
+class JSONFormatter(logging.Formatter):
+    """Format records as one JSON object per line, with their ``extra`` fields."""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+    def formatTime(self, record, datefmt=None):
+        return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z'
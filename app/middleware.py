@@ -0,0 +1,123 @@
+import logging
+import threading
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.urls import Resolver404, resolve
+
+from . import budgets, metrics, profiling
+
+logger = logging.getLogger('app.budgets')
+
+
+class QueryBudgetMiddleware:
+    """Log the requests that go over their route's query budget.
+
+    Enabled by the QUERY_BUDGETS setting, which follows DEBUG. Queries run
+    while a streaming response is consumed happen after this returns and are
+    not counted.
+    """
+
+    def __init__(self, get_response):
+        if not settings.QUERY_BUDGETS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = budgets.QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        if request.resolver_match is not None:
+            signed_in = hasattr(request, 'user') and request.user.is_authenticated
+            report = budgets.check(request.resolver_match.view_name, recorder, signed_in)
+            if report:
+                logger.warning(report)
+        return response
+
+
+class RequestMetricsMiddleware:
+    """Record every request in app.metrics.
+
+    Runs natively under both WSGI and ASGI, so it adds no thread switch in
+    front of the async views.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        sample = metrics.RequestSample()
+        response = self.get_response(request)
+        sample.finish(request, response)
+        return response
+
+    async def __acall__(self, request):
+        sample = metrics.RequestSample()
+        response = await self.get_response(request)
+        sample.finish(request, response)
+        return response
+
+
+class ProfilingMiddleware:
+    """Profile requests to the routes app.profiling's config watches."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def watched_view(self, request, config):
+        if config is None:
+            return None
+        try:
+            view_name = resolve(request.path_info).view_name
+        except Resolver404:
+            return None
+        return view_name if config.watches(view_name) else None
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        config = profiling.config()
+        view_name = self.watched_view(request, config)
+        if view_name is None:
+            return self.get_response(request)
+
+        profile = profiling.RequestProfile(view_name, config, threading.get_ident())
+        try:
+            response = self.get_response(request)
+        finally:
+            profile.stop()
+        profile.write(request)
+        return response
+
+    async def __acall__(self, request):
+        if profiling.config_is_stale():
+            config = await sync_to_async(profiling.config)()
+        else:
+            config = profiling.config()
+        view_name = self.watched_view(request, config)
+        if view_name is None:
+            return await self.get_response(request)
+
+        profile = profiling.RequestProfile(view_name, config)
+        try:
+            response = await self.get_response(request)
+        finally:
+            profile.stop()
+        await sync_to_async(profile.write)(request)
+        return response
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.5 on 2026-10-17 07:17
+
+from django.db import migrations, models
+
+# A frozen copy of app.geo.encode_geohash as of this migration, so later
+# changes to the live encoder cannot change what this backfill writes.
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    latitude, longitude = float(latitude), float(longitude)
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        target, bounds = (longitude, lng_range) if even else (latitude, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        value <<= 1
+        if target >= mid:
+            value |= 1
+            bounds[0] = mid
+        else:
+            bounds[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def backfill_geohash(apps, schema_editor):
+    Need = apps.get_model('app', 'Need')
+    needs = Need.objects.filter(latitude__isnull=False, longitude__isnull=False).only('latitude', 'longitude')
+    batch = []
+    for need in needs.iterator(chunk_size=2000):
+        need.geohash = encode_geohash(need.latitude, need.longitude)
+        batch.append(need)
+        if len(batch) >= 2000:
+            Need.objects.bulk_update(batch, ['geohash'])
+            batch = []
+    Need.objects.bulk_update(batch, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_disaster_affected_areas_disaster_severity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='need',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text='Geohash of latitude/longitude, maintained on save', max_length=12),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
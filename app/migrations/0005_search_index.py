@@ -0,0 +1,75 @@
+# Full-text search tables for needs and resources, see app/search.py
+
+from django.db import migrations, OperationalError
+
+
+def create_search_tables(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        try:
+            schema_editor.execute(
+                "CREATE VIRTUAL TABLE app_need_search USING fts5("
+                "title, description, location, city, "
+                "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            )
+        except OperationalError:
+            # SQLite built without FTS5, search falls back to icontains
+            return
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE app_resource_search USING fts5("
+            "description, need_title, need_location, "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        schema_editor.execute(
+            "INSERT INTO app_need_search (rowid, title, description, location, city) "
+            "SELECT id, title, description, location, city FROM app_need"
+        )
+        schema_editor.execute(
+            "INSERT INTO app_resource_search (rowid, description, need_title, need_location) "
+            "SELECT r.id, r.description, n.title, n.location "
+            "FROM app_resource r JOIN app_need n ON n.id = r.need_id"
+        )
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE TABLE app_need_search ("
+            "id bigint PRIMARY KEY REFERENCES app_need (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+            "document tsvector NOT NULL)"
+        )
+        schema_editor.execute(
+            "CREATE TABLE app_resource_search ("
+            "id bigint PRIMARY KEY REFERENCES app_resource (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+            "document tsvector NOT NULL)"
+        )
+        schema_editor.execute("CREATE INDEX app_need_search_document ON app_need_search USING GIN (document)")
+        schema_editor.execute("CREATE INDEX app_resource_search_document ON app_resource_search USING GIN (document)")
+        schema_editor.execute(
+            "INSERT INTO app_need_search (id, document) "
+            "SELECT id, setweight(to_tsvector('simple', title), 'A') "
+            "|| setweight(to_tsvector('simple', description), 'B') "
+            "|| setweight(to_tsvector('simple', location), 'C') "
+            "|| setweight(to_tsvector('simple', city), 'C') FROM app_need"
+        )
+        schema_editor.execute(
+            "INSERT INTO app_resource_search (id, document) "
+            "SELECT r.id, setweight(to_tsvector('simple', r.description), 'A') "
+            "|| setweight(to_tsvector('simple', n.title), 'B') "
+            "|| setweight(to_tsvector('simple', n.location), 'C') "
+            "FROM app_resource r JOIN app_need n ON n.id = r.need_id"
+        )
+
+
+def drop_search_tables(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute("DROP TABLE IF EXISTS app_need_search")
+        schema_editor.execute("DROP TABLE IF EXISTS app_resource_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_need_geohash'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_tables, drop_search_tables),
+    ]
@@ -0,0 +1,151 @@
+# Generated by Django 5.2.5 on 2026-10-17 07:23
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# A frozen copy of the normalization in app.textnorm, so that this
+# migration keeps building the same keys however that module changes.
+
+URDU_TO_ROMAN = {
+    'ا': 'a', 'آ': 'a', 'أ': 'a', 'إ': 'i', 'ع': '',
+    'ب': 'b', 'پ': 'p', 'ت': 't', 'ٹ': 't', 'ث': 's', 'ج': 'j', 'چ': 'ch',
+    'ح': 'h', 'خ': 'kh', 'د': 'd', 'ڈ': 'd', 'ذ': 'z', 'ر': 'r', 'ڑ': 'r',
+    'ز': 'z', 'ژ': 'zh', 'س': 's', 'ش': 'sh', 'ص': 's', 'ض': 'z', 'ط': 't',
+    'ظ': 'z', 'غ': 'gh', 'ف': 'f', 'ق': 'q', 'ک': 'k', 'ك': 'k', 'گ': 'g',
+    'ل': 'l', 'م': 'm', 'ن': 'n', 'ں': 'n', 'و': 'o', 'ؤ': 'o', 'ہ': 'h',
+    'ھ': '', 'ۃ': 'h', 'ة': 'h', 'ه': 'h', 'ء': '', 'ی': 'i', 'ي': 'i',
+    'ى': 'i', 'ئ': 'i', 'ے': 'e', 'ۓ': 'e',
+}
+ROMAN_FOLDS = [
+    ('kh', 'X'), ('sh', 'S'), ('ch', 'C'), ('zh', 'z'), ('gh', 'g'), ('ph', 'f'),
+    ('ck', 'k'), ('q', 'k'), ('v', 'w'),
+]
+SOFT_C = re.compile(r'c(?=[eiy])')
+SKELETON_DROP = set('aeiouhwy')
+STOP_WORDS = [
+    'city', 'district', 'distt', 'dist', 'tehsil', 'tehseel', 'village', 'town',
+    'near', 'the', 'of', 'in', 'area', 'areas', 'shehar', 'shahar', 'zila', 'zilla',
+    'gaon', 'goth', 'mohalla', 'muhalla', 'and',
+    'شہر', 'ضلع', 'تحصیل', 'گاؤں', 'گوٹھ', 'محلہ', 'اور',
+]
+SPLIT_SUFFIXES = ['abad', 'pur', 'kot', 'garh', 'nagar', 'آباد', 'پور', 'کوٹ', 'گڑھ', 'نگر']
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def fold(word):
+    chars = []
+    for ch in word.casefold():
+        if ch in URDU_TO_ROMAN:
+            chars.append(URDU_TO_ROMAN[ch])
+        elif ch.isdigit():
+            chars.append(str(unicodedata.digit(ch, 0)))
+        else:
+            chars.append(ch)
+    word = SOFT_C.sub('s', ''.join(chars))
+    for old, new in ROMAN_FOLDS:
+        word = word.replace(old, new)
+    return word.replace('c', 'k')
+
+
+def skeleton(word):
+    chars = []
+    for ch in fold(word):
+        if ch in SKELETON_DROP or (chars and chars[-1] == ch):
+            continue
+        chars.append(ch)
+    return ''.join(chars)
+
+
+STOP_FOLDED = {fold(word) for word in STOP_WORDS}
+STOP_SKELETONS = {key for key in map(skeleton, STOP_WORDS) if len(key) >= 3}
+SUFFIX_SKELETONS = {skeleton(word) for word in SPLIT_SUFFIXES}
+
+
+def search_key(text):
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in decomposed if not unicodedata.combining(ch) and ch != 'ـ')
+    keys = []
+    for word in WORD_RE.findall(text):
+        key = skeleton(word)
+        if not key or key in STOP_SKELETONS or fold(word) in STOP_FOLDED:
+            continue
+        if keys and key in SUFFIX_SKELETONS:
+            keys[-1] += key[1:] if keys[-1].endswith(key[0]) else key
+        else:
+            keys.append(key)
+    return ' '.join(keys)
+
+
+def trigrams(key):
+    grams = set()
+    for word in key.split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def backfill_fuzzy_index(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    SearchKey = apps.get_model('app', 'SearchKey')
+    SearchTrigram = apps.get_model('app', 'SearchTrigram')
+    sources = [
+        ('need', ['title', 'location', 'city']),
+        ('disaster', ['affected_areas']),
+    ]
+    for model_name, fields in sources:
+        model = apps.get_model('app', model_name)
+        content_type, _ = ContentType.objects.get_or_create(app_label='app', model=model_name)
+        keys = []
+        grams = []
+        for row in model.objects.values_list('id', *fields).iterator(chunk_size=2000):
+            key = search_key(' '.join(value or '' for value in row[1:]))
+            keys.append(SearchKey(content_type=content_type, object_id=row[0], key=key))
+            grams.extend(
+                SearchTrigram(content_type=content_type, object_id=row[0], trigram=trigram)
+                for trigram in trigrams(key)
+            )
+            if len(grams) >= 5000:
+                SearchKey.objects.bulk_create(keys)
+                SearchTrigram.objects.bulk_create(grams)
+                keys, grams = [], []
+        SearchKey.objects.bulk_create(keys)
+        SearchTrigram.objects.bulk_create(grams)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_search_index'),
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('key', models.TextField(blank=True)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'unique_together': {('content_type', 'object_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='SearchTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_id', models.PositiveIntegerField()),
+                ('trigram', models.CharField(max_length=3)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['content_type', 'trigram'], name='app_trigram_lookup'), models.Index(fields=['content_type', 'object_id'], name='app_trigram_object')],
+            },
+        ),
+        migrations.RunPython(backfill_fuzzy_index, migrations.RunPython.noop),
+    ]
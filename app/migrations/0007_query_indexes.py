@@ -0,0 +1,44 @@
+# Generated by Django 5.2.5 on 2026-10-17 07:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_fuzzy_search_index'),
+        ('contenttypes', '0002_remove_content_type_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='changelog',
+            index=models.Index(fields=['content_type', 'object_id', '-timestamp'], name='changelog_object_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='need',
+            index=models.Index(fields=['status', '-created_at', '-id'], name='need_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='need',
+            index=models.Index(fields=['status', '-priority', '-created_at', '-id'], name='need_status_priority_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='need',
+            index=models.Index(fields=['category', 'status', '-created_at', '-id'], name='need_category_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='need',
+            index=models.Index(fields=['disaster', 'status', '-created_at', '-id'], name='need_disaster_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='need',
+            index=models.Index(condition=models.Q(('geohash__gt', ''), ('status', 'open')), fields=['geohash'], name='need_open_geolocated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='resource',
+            index=models.Index(fields=['status', '-created_at', '-id'], name='resource_status_created_idx'),
+        ),
+    ]
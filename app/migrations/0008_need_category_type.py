@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-17 07:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_category_type(apps, schema_editor):
+    Category = apps.get_model('app', 'Category')
+    Need = apps.get_model('app', 'Need')
+    for category_id, category_type in Category.objects.values_list('id', 'category_type'):
+        Need.objects.filter(category_id=category_id).update(category_type=category_type)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='need',
+            name='need_status_priority_idx',
+        ),
+        migrations.AddField(
+            model_name='need',
+            name='category_type',
+            field=models.CharField(blank=True, choices=[('problem', 'Problem/Issue'), ('service', 'Service/Solution'), ('information', 'Information/Data')], editable=False, help_text='Copy of category.category_type, maintained on save', max_length=20),
+        ),
+        migrations.RunPython(backfill_category_type, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='need',
+            index=models.Index(fields=['category_type', 'status', '-created_at', '-id'], name='need_type_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='need',
+            index=models.Index(fields=['category_type', 'status', '-priority', '-created_at', '-id'], name='need_type_priority_idx'),
+        ),
+    ]
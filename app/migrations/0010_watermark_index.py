@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-17 07:37
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_sync_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='need',
+            index=models.Index(fields=['disaster', 'updated_at'], name='need_disaster_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-17 08:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_watermark_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfilingConfig',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('enabled', models.BooleanField(default=False)),
+                ('routes', models.TextField(blank=True, help_text='View names to profile, comma separated, e.g. app:needs_list, app:map_data_api. Empty for every route.')),
+                ('sample_every', models.PositiveIntegerField(default=10, help_text='Profile one in this many requests to each route')),
+                ('slow_query_ms', models.PositiveIntegerField(default=100, help_text='Capture and EXPLAIN queries slower than this, on every request to the routes')),
+                ('until', models.DateTimeField(blank=True, help_text='Switch profiling off at this time', null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'profiling configuration',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-17 08:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0013_task_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='need',
+            name='geocoded',
+            field=models.BooleanField(default=False, editable=False, help_text='Latitude/longitude were looked up from location/city in the gazetteer'),
+        ),
+    ]
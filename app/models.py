@@ -1,7 +1,14 @@
+import math
+from decimal import Decimal
+
 from django.db import models
+from django.db.models.functions import Cast
+from django.utils import timezone
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 
+from . import geo, geocoding, images
+
 
 class Disaster(models.Model):
     """A disaster event that needs tracking and response coordination."""
@@ -51,6 +58,42 @@ class Category(models.Model):
         ordering = ['category_type', 'name']
 
 
+class NeedQuerySet(models.QuerySet):
+    def geolocated(self):
+        """Needs with coordinates, answered from the geohash index"""
+        return self.filter(geohash__gt='')
+
+    def in_bbox(self, bbox):
+        """Needs inside a geo.BBox, using geohash range scans then exact bounds"""
+        condition = models.Q(pk__in=[])
+        for box in geo.split_antimeridian(bbox):
+            cover = models.Q()
+            for prefix in geo.geohash_cover(box):
+                cover |= models.Q(geohash__gte=prefix, geohash__lt=prefix + geo.GEOHASH_RANGE_END)
+            condition |= cover & models.Q(
+                latitude__gte=box.south, latitude__lte=box.north,
+                longitude__gte=box.west, longitude__lte=box.east,
+            )
+        # geolocated() is implied by the cover, but spelling it out lets the
+        # database match the partial index on open geolocated needs
+        return self.geolocated().filter(condition)
+
+    def near(self, latitude, longitude, radius_km):
+        """Needs inside the bounding box of a radius around a point"""
+        return self.in_bbox(geo.radius_bbox(latitude, longitude, radius_km))
+
+    def order_by_distance(self, latitude, longitude):
+        """Order by approximate distance from a point, computed in the database.
+
+        Uses the equirectangular projection, which preserves the ranking of
+        nearby points; callers needing exact kilometres use geo.haversine_km.
+        """
+        cos_lat = math.cos(math.radians(float(latitude)))
+        dy = Cast('latitude', models.FloatField()) - models.Value(float(latitude))
+        dx = (Cast('longitude', models.FloatField()) - models.Value(float(longitude))) * models.Value(cos_lat)
+        return self.annotate(distance_rank=dx * dx + dy * dy).order_by('distance_rank')
+
+
 class Need(models.Model):
     """An issue/need reported for a disaster that requires resolution."""
     STATUS_CHOICES = [
@@ -64,6 +107,8 @@ class Need(models.Model):
 
     disaster = models.ForeignKey(Disaster, on_delete=models.CASCADE, related_name='needs')
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True)
+    category_type = models.CharField(max_length=20, choices=Category.CATEGORY_TYPES, blank=True, editable=False,
+                                     help_text="Copy of category.category_type, maintained on save")
     title = models.CharField(max_length=200)
     description = models.TextField()
     
@@ -71,6 +116,10 @@ class Need(models.Model):
     location = models.CharField(max_length=255, blank=True)
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False,
+                               help_text="Geohash of latitude/longitude, maintained on save")
+    geocoded = models.BooleanField(default=False, editable=False,
+                                   help_text="Latitude/longitude were looked up from location/city in the gazetteer")
     city = models.CharField(max_length=100, blank=True)
     
     # Contact information
@@ -106,10 +155,83 @@ class Need(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     resolved_at = models.DateTimeField(null=True, blank=True)
 
+    objects = NeedQuerySet.as_manager()
+
+    def refresh_denormalized_fields(self):
+        """Recompute the columns derived from other fields.
+
+        Called on save; code that bypasses save() (bulk_create, imports) must
+        call it itself.
+        """
+        self.refresh_location()
+        self.category_type = self.category.category_type if self.category_id else ''
+
+    # Fields whose stored values refresh_location compares against
+    LOCATION_FIELDS = ('location', 'city', 'latitude', 'longitude')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        need = super().from_db(db, field_names, values)
+        need._remember_location()
+        return need
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self._remember_location()
+
+    def _remember_location(self):
+        # Deferred fields are left out, and never count as changed
+        self._stored_location = {
+            name: self.__dict__[name] for name in self.LOCATION_FIELDS if name in self.__dict__
+        }
+
+    def _location_changed(self, *names):
+        stored = getattr(self, '_stored_location', {})
+        return any(name in stored and stored[name] != getattr(self, name) for name in names)
+
+    def refresh_location(self, redo=False):
+        """Geocode a need reported without coordinates (see app.geocoding)
+        and recompute the geohash.
+
+        A geocoded need is looked up again when its location or city
+        changed, or with ``redo``. Coordinates set on it explicitly are kept
+        and clear ``geocoded``.
+        """
+        if self.geocoded and self._location_changed('latitude', 'longitude'):
+            self.geocoded = False
+        if self.latitude is None or self.longitude is None or (
+                self.geocoded and (redo or self._location_changed('location', 'city'))):
+            place = geocoding.locate(self.location, self.city)
+            if place is not None:
+                self.latitude = Decimal(f'{place.latitude:.6f}')
+                self.longitude = Decimal(f'{place.longitude:.6f}')
+                self.geocoded = True
+            elif self.geocoded:
+                # The location no longer names a known place
+                self.latitude = self.longitude = None
+                self.geocoded = False
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = geo.encode_geohash(self.latitude, self.longitude)
+        else:
+            self.geohash = ''
+
+    def save(self, *args, **kwargs):
+        self.refresh_denormalized_fields()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if {'latitude', 'longitude', 'location', 'city'} & update_fields:
+                update_fields.update(['latitude', 'longitude', 'geocoded', 'geohash'])
+            if 'category' in update_fields:
+                update_fields.add('category_type')
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+        self._remember_location()
+
     @property 
     def entry_type(self):
         """Returns the type based on category"""
-        return self.category.category_type if self.category else 'problem'
+        return self.category_type or 'problem'
 
     @property
     def is_problem(self):
@@ -126,6 +248,26 @@ class Need(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Open-needs lists and home page, newest first
+            models.Index(fields=['status', '-created_at', '-id'], name='need_status_created_idx'),
+            # Problem/service lists and home page sections
+            models.Index(fields=['category_type', 'status', '-created_at', '-id'], name='need_type_status_idx'),
+            # problems_list orders open problems by priority
+            models.Index(fields=['category_type', 'status', '-priority', '-created_at', '-id'],
+                         name='need_type_priority_idx'),
+            # category filter on lists
+            models.Index(fields=['category', 'status', '-created_at', '-id'], name='need_category_status_idx'),
+            # disaster filter on lists, disaster_detail
+            models.Index(fields=['disaster', 'status', '-created_at', '-id'], name='need_disaster_status_idx'),
+            # Delta sync
+            models.Index(fields=['updated_at', 'id'], name='need_updated_idx'),
+            # Map conditional GET watermark per disaster
+            models.Index(fields=['disaster', 'updated_at'], name='need_disaster_updated_idx'),
+            # nearby_api: open needs with coordinates
+            models.Index(fields=['geohash'], condition=models.Q(status='open', geohash__gt=''),
+                         name='need_open_geolocated_idx'),
+        ]
 
 
 class Problem(models.Model):
@@ -310,6 +452,14 @@ class Resource(models.Model):
     def __str__(self):
         return f"Resource from {self.provider_name} for {self.need.title}"
 
+    class Meta:
+        indexes = [
+            # home and resources_list: offered resources, newest first
+            models.Index(fields=['status', '-created_at', '-id'], name='resource_status_created_idx'),
+            # Delta sync
+            models.Index(fields=['updated_at', 'id'], name='resource_updated_idx'),
+        ]
+
     def clean(self):
         from django.core.exceptions import ValidationError
         if not self.provider_user and not self.provider_organization:
@@ -325,10 +475,33 @@ class Photo(models.Model):
     caption = models.CharField(max_length=200, blank=True)
     uploaded_by = models.ForeignKey('auth.User', on_delete=models.SET_NULL, null=True, blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # Set when the image is processed, see app.images
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    thumbnails = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return f"Photo for {self.need.title}"
 
+    def sizes(self):
+        """(width, url) of the image and its thumbnails, narrowest first."""
+        storage = self.image.storage
+        sizes = sorted((int(width), storage.url(name)) for width, name in self.thumbnails.items())
+        if self.width:
+            sizes.append((self.width, self.image.url))
+        return sizes
+
+    def thumbnail_url(self, width=images.THUMBNAIL_WIDTHS[0]):
+        """URL of the narrowest copy at least ``width`` wide, or the image."""
+        for size, url in self.sizes():
+            if size >= width:
+                return url
+        return self.image.url
+
+    @property
+    def srcset(self):
+        return ', '.join(f'{url} {width}w' for width, url in self.sizes())
+
 
 class Comment(models.Model):
     """Comments/updates on needs for discussion and status updates."""
@@ -424,3 +597,99 @@ class ChangeLog(models.Model):
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            # History of one object; Report is covered by its unique_together
+            models.Index(fields=['content_type', 'object_id', '-timestamp'], name='changelog_object_idx'),
+            # Deletion tombstones for delta sync
+            models.Index(fields=['action', 'timestamp', 'id'], name='changelog_action_idx'),
+        ]
+
+
+class SearchKey(models.Model):
+    """Normalized fuzzy-search key of an object's place names, see app.textnorm."""
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    key = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"{self.content_type.model} {self.object_id}: {self.key}"
+
+    class Meta:
+        unique_together = ['content_type', 'object_id']
+
+
+class SearchTrigram(models.Model):
+    """Trigram of a SearchKey, the index that fuzzy searches probe."""
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    trigram = models.CharField(max_length=3)
+
+    def __str__(self):
+        return f"{self.content_type.model} {self.object_id}: {self.trigram!r}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['content_type', 'trigram'], name='app_trigram_lookup'),
+            models.Index(fields=['content_type', 'object_id'], name='app_trigram_object'),
+        ]
+
+
+class ProfilingConfig(models.Model):
+    """Runtime switch for the request profiler in app.profiling. One row."""
+    enabled = models.BooleanField(default=False)
+    routes = models.TextField(
+        blank=True,
+        help_text='View names to profile, comma separated, e.g. app:needs_list, app:map_data_api. '
+                  'Empty for every route.',
+    )
+    sample_every = models.PositiveIntegerField(
+        default=10, help_text='Profile one in this many requests to each route',
+    )
+    slow_query_ms = models.PositiveIntegerField(
+        default=100, help_text='Capture and EXPLAIN queries slower than this, on every request to the routes',
+    )
+    until = models.DateTimeField(null=True, blank=True, help_text='Switch profiling off at this time')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Profiling {'on' if self.enabled else 'off'}"
+
+    class Meta:
+        verbose_name = 'profiling configuration'
+
+
+class Task(models.Model):
+    """A run of a background task, see app.tasks."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=200)
+    kwargs = models.JSONField(default=dict, blank=True)
+    priority = models.SmallIntegerField(default=0, help_text='Higher runs first')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # The worker's claim query
+            models.Index(fields=['status', '-priority', 'run_after', 'id'], name='task_queue_idx'),
+        ]
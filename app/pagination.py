@@ -0,0 +1,161 @@
+"""Keyset (cursor) pagination.
+
+Django's Paginator issues a COUNT(*) per page and fetches page N with
+``OFFSET (N - 1) * per_page``, so deep pages get linearly slower. A keyset
+page instead remembers the sort key of its first and last rows in an opaque
+cursor and fetches the neighbouring page with a ``WHERE`` on that key, which
+costs the same at any depth. There is no total count and no jumping to an
+arbitrary page number: only "newer" and "older".
+
+The ordering must end in a unique field (``id``) so every row has a distinct
+position.
+"""
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPaginator:
+    def __init__(self, queryset, per_page, ordering):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = [
+            (name.lstrip('-'), name.startswith('-')) for name in ordering
+        ]
+
+    def get_page(self, cursor=None):
+        """Page after (or, for a previous-page cursor, before) ``cursor``.
+
+        Malformed or stale cursors fall back to the first page, like
+        Paginator.get_page() does for bad page numbers.
+        """
+        try:
+            return self.page(cursor)
+        except InvalidCursor:
+            return self.page(None)
+
+    async def aget_page(self, cursor=None):
+        """Async get_page(), for async views."""
+        try:
+            return await self.apage(cursor)
+        except InvalidCursor:
+            return await self.apage(None)
+
+    def page(self, cursor=None):
+        queryset, backwards = self._page_queryset(cursor)
+        return self._make_page(list(queryset), backwards, cursor)
+
+    async def apage(self, cursor=None):
+        queryset, backwards = self._page_queryset(cursor)
+        return self._make_page([row async for row in queryset], backwards, cursor)
+
+    def _page_queryset(self, cursor):
+        """(queryset of the page plus one lookahead row, whether it runs backwards)"""
+        backwards = False
+        queryset = self.queryset
+        if cursor:
+            backwards, values = self.decode_cursor(cursor)
+            queryset = queryset.filter(self._after(values, backwards))
+
+        ordering = [
+            F(name).asc() if descending == backwards else F(name).desc()
+            for name, descending in self.ordering
+        ]
+        return queryset.order_by(*ordering)[:self.per_page + 1], backwards
+
+    def _make_page(self, rows, backwards, cursor):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+            return KeysetPage(self, rows, has_next=True, has_previous=has_more)
+        return KeysetPage(self, rows, has_next=has_more, has_previous=bool(cursor))
+
+    def _after(self, values, backwards):
+        """Rows strictly past ``values`` in the (possibly reversed) ordering.
+
+        For ordering (a, b) that is ``a > x OR (a = x AND b > y)``.
+        """
+        condition = Q()
+        equal = Q()
+        for (name, descending), value in zip(self.ordering, values):
+            lookup = 'lt' if descending != backwards else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def encode_cursor(self, row, backwards):
+        values = [self._field_value(row, name) for name, _ in self.ordering]
+        payload = json.dumps([int(backwards), *values], default=str, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            backwards, *values = json.loads(base64.urlsafe_b64decode(padded))
+            if len(values) != len(self.ordering):
+                raise InvalidCursor(cursor)
+            return bool(backwards), [
+                self._to_python(name, value)
+                for (name, _), value in zip(self.ordering, values)
+            ]
+        except (binascii.Error, UnicodeDecodeError, ValueError, TypeError, ValidationError) as e:
+            raise InvalidCursor(cursor) from e
+
+    def _field_value(self, row, name):
+        if isinstance(row, dict):
+            return row[name]
+        return getattr(row, name)
+
+    def _to_python(self, name, value):
+        if name in self.queryset.query.annotations:
+            return value
+        return self.queryset.model._meta.get_field(name).to_python(value)
+
+
+class KeysetPage:
+    """One page of results; iterable like a Paginator page."""
+
+    def __init__(self, paginator, object_list, has_next, has_previous):
+        self.paginator = paginator
+        self.object_list = object_list
+        self._has_next = has_next and bool(object_list)
+        self._has_previous = has_previous and bool(object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next:
+            return self.paginator.encode_cursor(self.object_list[-1], backwards=False)
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous:
+            return self.paginator.encode_cursor(self.object_list[0], backwards=True)
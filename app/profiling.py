@@ -0,0 +1,267 @@
+"""Profiling of live requests to chosen routes, switched on at runtime.
+
+The ProfilingConfig row, edited in the admin, names the routes (view names)
+to watch; every worker picks a change up within CONFIG_SECONDS. Until the
+row is first saved, the PROFILE_* settings decide, so profiling can also be
+on from startup through the environment.
+
+For every request to a watched route, queries slower than ``slow_query_ms``
+are captured. After the response they are EXPLAINed and appended as JSON
+lines, with the app and template line that ran them, to
+``<PROFILE_DIR>/<route>.slow-sql.jsonl``.
+
+One in ``sample_every`` requests is also profiled. A background thread
+samples the stacks every SAMPLE_INTERVAL and appends them, folded, to
+``<PROFILE_DIR>/<route>.folded``. That file feeds straight into
+flamegraph.pl or speedscope, and keeps adding up over requests.
+
+Sync views are sampled on the request's thread only. Async views run on the
+event loop and in sync_to_async threads shared by every request, so all
+threads that are not idle are sampled, and concurrent requests show up too.
+"""
+import itertools
+import json
+import os
+import sys
+import sysconfig
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import budgets
+
+CONFIG_SECONDS = 10
+SAMPLE_INTERVAL = 0.005
+# Innermost frames of threads waiting for work, left out of async profiles
+IDLE_FRAMES = {
+    ('selectors.py', 'select'),
+    ('threading.py', 'wait'),
+    ('queue.py', 'get'),
+    ('thread.py', '_worker'),
+}
+
+# Slow queries of the watched request running in this context
+_slow_queries = ContextVar('slow_queries', default=None)
+_lock = threading.Lock()
+_counters = {}
+_config = None
+_config_loaded = float('-inf')
+
+
+class Config(NamedTuple):
+    # View names, or None for every route
+    routes: frozenset
+    sample_every: int
+    slow_query_ms: float
+
+    def watches(self, view_name):
+        return self.routes is None or view_name in self.routes
+
+
+class SlowQuery(NamedTuple):
+    sql: str
+    params: object
+    ms: float
+    origin: str
+
+
+class SlowQueries(list):
+    def __init__(self, threshold_ms):
+        super().__init__()
+        self.threshold_ms = threshold_ms
+
+
+def _parse_routes(routes):
+    names = frozenset(name.strip() for name in routes if name.strip())
+    return names or None
+
+
+def load_config():
+    """The profiling config in force, or None when profiling is off."""
+    from .models import ProfilingConfig
+
+    row = ProfilingConfig.objects.order_by('id').first()
+    if row is None:
+        if not settings.PROFILE_ROUTES:
+            return None
+        return Config(
+            _parse_routes(settings.PROFILE_ROUTES), settings.PROFILE_SAMPLE_EVERY, settings.PROFILE_SLOW_QUERY_MS,
+        )
+    if not row.enabled or (row.until is not None and row.until <= timezone.now()):
+        return None
+    return Config(_parse_routes(row.routes.split(',')), max(row.sample_every, 1), row.slow_query_ms)
+
+
+def config_is_stale():
+    return time.monotonic() - _config_loaded >= CONFIG_SECONDS
+
+
+def config():
+    """load_config(), reloaded at most every CONFIG_SECONDS."""
+    global _config, _config_loaded
+    if config_is_stale():
+        _config = load_config()
+        _config_loaded = time.monotonic()
+    return _config
+
+
+def clear_config():
+    global _config_loaded
+    _config_loaded = float('-inf')
+
+
+def record_slow_query(execute, sql, params, many, context):
+    queries = _slow_queries.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        ms = (time.perf_counter() - started) * 1000
+        if ms >= queries.threshold_ms and not many:
+            queries.append(SlowQuery(sql, params, ms, budgets.query_origin()))
+
+
+@receiver(connection_created)
+def install_slow_query_recorder(sender, connection, **kwargs):
+    # First, like app.metrics' wrapper, as execute_wrapper() pops the last one
+    if record_slow_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_slow_query)
+
+
+# Longest first: site-packages lies inside the standard library directory
+_PATH_PREFIXES = sorted(
+    {os.path.join(path, '') for path in (*sysconfig.get_paths().values(), str(settings.BASE_DIR))},
+    key=len, reverse=True,
+)
+
+
+def _short_path(filename):
+    for prefix in _PATH_PREFIXES:
+        if filename.startswith(prefix):
+            return filename[len(prefix):]
+    return filename
+
+
+def fold(frame):
+    """``frame``'s stack, outermost first, as one folded flame graph line."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_qualname} ({_short_path(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def is_idle(frame):
+    return (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FRAMES
+
+
+class StackSampler:
+    """Counts the folded stacks of threads, sampled on a background thread.
+
+    Samples ``thread_id`` only, or every thread that is not idle.
+    """
+
+    def __init__(self, thread_id=None, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiling-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if self.thread_id is not None:
+                    if thread_id != self.thread_id:
+                        continue
+                elif is_idle(frame):
+                    continue
+                self.stacks[fold(frame)] += 1
+
+
+def _route_path(view_name, suffix):
+    return os.path.join(settings.PROFILE_DIR, view_name.replace(':', '.') + suffix)
+
+
+def _append(path, text):
+    if not text:
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with _lock, open(path, 'a', encoding='utf-8') as f:
+        f.write(text)
+
+
+def explain(sql, params):
+    """The database's plan for a SELECT, one line per step, or None."""
+    if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+        return [str(row[-1]) for row in cursor.fetchall()]
+
+
+class RequestProfile:
+    """Profiling of one request to a watched route."""
+
+    def __init__(self, view_name, config, thread_id=None):
+        self.view_name = view_name
+        self.slow_queries = SlowQueries(config.slow_query_ms)
+        self._token = _slow_queries.set(self.slow_queries)
+        self.sampler = None
+        with _lock:
+            count = _counters.setdefault(view_name, itertools.count())
+            sampled = next(count) % config.sample_every == 0
+        if sampled:
+            self.sampler = StackSampler(thread_id)
+            self.sampler.start()
+
+    def stop(self):
+        """Stop recording; call on the request's own context."""
+        _slow_queries.reset(self._token)
+        if self.sampler is not None:
+            self.sampler.stop()
+
+    def write(self, request):
+        """Write what was recorded to PROFILE_DIR. Queries the database."""
+        if self.sampler is not None:
+            _append(_route_path(self.view_name, '.folded'), ''.join(
+                f'{stack} {count}\n' for stack, count in self.sampler.stacks.items()
+            ))
+        lines = []
+        for query in self.slow_queries:
+            try:
+                plan = explain(query.sql, query.params)
+            except Exception as e:
+                plan = [f'EXPLAIN failed: {e}']
+            lines.append(json.dumps({
+                'time': timezone.now().isoformat(),
+                'path': request.get_full_path(),
+                'ms': round(query.ms, 2),
+                'origin': query.origin,
+                'sql': query.sql,
+                'params': query.params,
+                'plan': plan,
+            }, default=str) + '\n')
+        _append(_route_path(self.view_name, '.slow-sql.jsonl'), ''.join(lines))
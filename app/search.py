@@ -0,0 +1,423 @@
+"""Full-text search over needs and resources.
+
+Each indexed model has a companion search table created by migration 0005:
+an FTS5 virtual table on SQLite, and a table of ``tsvector`` documents behind a
+GIN index on PostgreSQL. The signal handlers in ``app.signals`` keep them in step with
+writes. Queries match every term as a prefix and are ranked by relevance.
+
+The matching rows and their ranks come from one pass over the search table,
+joined to the searched table as a derived table (``_MatchJoin``); ranking
+with a subquery per row would run the full-text query once per match.
+
+Databases without a search table (other vendors, or SQLite builds without
+FTS5) fall back to the original ``icontains`` filters.
+
+Place names are additionally matched fuzzily, so Urdu, Roman Urdu and
+misspelled queries still find them: ``app.textnorm`` reduces them to search
+keys whose trigrams are stored in SearchTrigram at write time. A query probes
+that index for candidates and ranks them by edit distance. Fuzzy matches only
+ever rank after the full-text ones, so the probe is skipped when full-text
+search alone already has FUZZY_LIMIT of them.
+"""
+import re
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.db.models import Case, Count, FloatField, Q, Value, When
+from django.db.models.expressions import Expression
+from django.db.models.functions import Coalesce
+from django.db.models.sql.constants import INNER
+from django.db.models.sql.datastructures import Join
+
+from . import textnorm
+from .models import SearchKey, SearchTrigram
+
+NEED_TABLE = 'app_need_search'
+RESOURCE_TABLE = 'app_resource_search'
+# Longer queries are truncated, a search box is not a query language
+MAX_TERMS = 8
+
+# Fields whose text is indexed for fuzzy matching, per model
+FUZZY_FIELDS = {
+    'app.need': ['title', 'location', 'city'],
+    'app.disaster': ['affected_areas'],
+}
+# Objects sharing the most trigrams with the query that are scored
+FUZZY_CANDIDATES = 200
+# Best fuzzy matches mixed into a result
+FUZZY_LIMIT = 50
+# Minimum textnorm.similarity() for a fuzzy match
+FUZZY_THRESHOLD = 0.75
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def search_terms(query):
+    return _TERM_RE.findall(query.lower())[:MAX_TERMS]
+
+
+def need_document(need):
+    return [need.title, need.description, need.location, need.city]
+
+
+def resource_document(resource, need):
+    return [resource.description, need.title, need.location]
+
+
+class _MatchJoin(Join):
+    """INNER JOIN of a derived table of ``(id, rank)`` rows to the searched table.
+
+    Django only joins tables reached through relations; this joins the SQL of
+    an IndexedBackend match instead, so each matching row and its rank is
+    produced once and rows it does not list are filtered out.
+    """
+
+    def __init__(self, table_name, sql, params, parent_alias, table_alias=None):
+        self.table_name = table_name
+        self.sql = sql
+        self.params = tuple(params)
+        self.parent_alias = parent_alias
+        self.table_alias = table_alias
+        self.join_type = INNER
+        self.join_field = None
+        self.nullable = False
+        self.filtered_relation = None
+
+    def as_sql(self, compiler, connection):
+        qn = compiler.quote_name_unless_alias
+        return (
+            f'{self.join_type} ({self.sql}) {qn(self.table_alias)} '
+            f'ON ({qn(self.table_alias)}.{qn("id")} = {qn(self.parent_alias)}.{qn("id")})',
+            list(self.params),
+        )
+
+    def relabeled_clone(self, change_map):
+        return self.__class__(
+            self.table_name, self.sql, self.params,
+            change_map.get(self.parent_alias, self.parent_alias),
+            change_map.get(self.table_alias, self.table_alias),
+        )
+
+    @property
+    def identity(self):
+        return self.__class__, self.table_name, self.sql, self.params, self.parent_alias
+
+    def promote(self):
+        # The join is the filter; as an outer join it would match every row
+        return self.relabeled_clone({})
+
+
+class _MatchRank(Expression):
+    """The rank column of a _MatchJoin, followed through alias relabeling."""
+
+    output_field = FloatField()
+
+    def __init__(self, alias):
+        super().__init__()
+        self.alias = alias
+
+    def as_sql(self, compiler, connection):
+        return f'{compiler.quote_name_unless_alias(self.alias)}.{connection.ops.quote_name("rank")}', []
+
+    def relabeled_clone(self, change_map):
+        return self.__class__(change_map.get(self.alias, self.alias))
+
+    def get_group_by_cols(self):
+        return [self]
+
+
+class LikeBackend:
+    """Fallback: unindexed ``icontains`` scans."""
+
+    FIELDS = {
+        NEED_TABLE: ['title', 'description', 'location'],
+        RESOURCE_TABLE: ['description', 'need__title', 'need__location'],
+    }
+
+    def search(self, queryset, table, query, fuzzy_scores):
+        """``queryset`` filtered to the rows matching ``query`` or listed in
+        ``fuzzy_scores``, annotated with their ``search_rank``."""
+        condition = Q()
+        for field in self.FIELDS[table]:
+            condition |= Q(**{f'{field}__icontains': query})
+        rank = Case(When(condition, then=Value(0.0)), output_field=FloatField())
+        if fuzzy_scores:
+            condition |= Q(pk__in=list(fuzzy_scores))
+            # Fuzzy-only matches rank after every full-text match, closest first
+            rank = Coalesce(rank, Case(
+                *[When(pk=pk, then=Value(1.0 - score)) for pk, score in fuzzy_scores.items()],
+                output_field=FloatField(),
+            ))
+        return queryset.filter(condition).annotate(search_rank=rank)
+
+    def count_matches(self, table, query, limit):
+        """How many rows match ``query``, counting no further than ``limit``"""
+        # Unknown without the scan the count would avoid
+        return 0
+
+    def index_need(self, need):
+        pass
+
+    def index_resource(self, resource):
+        pass
+
+    def index_new_needs(self, needs):
+        pass
+
+    def index_new_resources(self, resources):
+        pass
+
+    def remove_need(self, need_id):
+        pass
+
+    def remove_resource(self, resource_id):
+        pass
+
+
+class IndexedBackend(LikeBackend):
+    """Shared plumbing for the backends with a real search table."""
+
+    def search(self, queryset, table, query, fuzzy_scores):
+        terms = search_terms(query)
+        parts, params = [], []
+        if terms:
+            parts.append(self.match_sql(table))
+            params.append(self.match_param(terms))
+        if fuzzy_scores:
+            # Fuzzy-only matches rank after every full-text match, closest
+            # first; a row matching both keeps its full-text rank
+            for pk, score in fuzzy_scores.items():
+                parts.append('SELECT %s AS id, %s AS rank')
+                params.extend([pk, 1.0 - score])
+        if not parts:
+            return queryset.none().annotate(search_rank=Value(None, output_field=FloatField()))
+        sql = ' UNION ALL '.join(parts)
+        if fuzzy_scores:
+            sql = f'SELECT id, MIN(rank) AS rank FROM ({sql}) matches GROUP BY id'
+        queryset = queryset.all()
+        alias = queryset.query.join(_MatchJoin(table, sql, params, queryset.query.get_initial_alias()))
+        return queryset.annotate(search_rank=_MatchRank(alias))
+
+    def count_matches(self, table, query, limit):
+        terms = search_terms(query)
+        if not terms:
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT COUNT(*) FROM ({self.match_sql(table)} LIMIT %s) matches',
+                [self.match_param(terms), limit],
+            )
+            return cursor.fetchone()[0]
+
+    def index_need(self, need):
+        self.upsert(NEED_TABLE, need.pk, need_document(need))
+        # Resources are searchable by their need's title and location
+        for resource in need.resources.only('id', 'description'):
+            self.upsert(RESOURCE_TABLE, resource.pk, resource_document(resource, need))
+
+    def index_new_needs(self, needs):
+        """Index needs just created in bulk; they have no resources yet."""
+        self.upsert_many(NEED_TABLE, [(need.pk, need_document(need)) for need in needs])
+
+    def index_resource(self, resource):
+        self.upsert(RESOURCE_TABLE, resource.pk, resource_document(resource, resource.need))
+
+    def index_new_resources(self, resources):
+        self.upsert_many(RESOURCE_TABLE, [
+            (resource.pk, resource_document(resource, resource.need)) for resource in resources
+        ])
+
+    def upsert(self, table, pk, document):
+        self.upsert_many(table, [(pk, document)])
+
+    def remove_need(self, need_id):
+        self.delete(NEED_TABLE, need_id)
+
+    def remove_resource(self, resource_id):
+        self.delete(RESOURCE_TABLE, resource_id)
+
+
+class SQLiteBackend(IndexedBackend):
+    """FTS5 virtual tables whose rowid is the indexed row's primary key."""
+
+    COLUMNS = {
+        NEED_TABLE: ['title', 'description', 'location', 'city'],
+        RESOURCE_TABLE: ['description', 'need_title', 'need_location'],
+    }
+
+    def match_sql(self, table):
+        return f'SELECT rowid AS id, rank FROM {table} WHERE {table} MATCH %s'
+
+    def match_param(self, terms):
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    def upsert_many(self, table, rows):
+        if not rows:
+            return
+        columns = ', '.join(['rowid', *self.COLUMNS[table]])
+        placeholders = ', '.join(['%s'] * (len(self.COLUMNS[table]) + 1))
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT OR REPLACE INTO {table} ({columns}) VALUES ({placeholders})',
+                [[pk, *document] for pk, document in rows],
+            )
+
+    def delete(self, table, pk):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {table} WHERE rowid = %s', [pk])
+
+
+class PostgresBackend(IndexedBackend):
+    """``tsvector`` documents weighted by field, behind a GIN index."""
+
+    # Weight per document position; titles outrank descriptions
+    WEIGHTS = ['A', 'B', 'C', 'C']
+
+    def match_sql(self, table):
+        # Only matching rows are ranked; a rank of 0 for the others would
+        # sort them before the fuzzy matches (ranks are negated)
+        return (
+            f"SELECT id, -ts_rank(document, query) AS rank FROM {table}, to_tsquery('simple', %s) query "
+            f"WHERE document @@ query"
+        )
+
+    def match_param(self, terms):
+        return ' & '.join(f'{term}:*' for term in terms)
+
+    def upsert_many(self, table, rows):
+        if not rows:
+            return
+        vector = ' || '.join(
+            f"setweight(to_tsvector('simple', %s), '{weight}')"
+            for weight, _ in zip(self.WEIGHTS, rows[0][1])
+        )
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {table} (id, document) VALUES (%s, {vector}) '
+                f'ON CONFLICT (id) DO UPDATE SET document = EXCLUDED.document',
+                [[pk, *document] for pk, document in rows],
+            )
+
+    def delete(self, table, pk):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {table} WHERE id = %s', [pk])
+
+
+_backends = {}
+
+
+def get_backend():
+    """The search backend for the default database, detected once per database."""
+    key = (connection.vendor, connection.settings_dict['NAME'])
+    if key not in _backends:
+        tables = connection.introspection.table_names()
+        if NEED_TABLE not in tables or RESOURCE_TABLE not in tables:
+            _backends[key] = LikeBackend()
+        elif connection.vendor == 'sqlite':
+            _backends[key] = SQLiteBackend()
+        elif connection.vendor == 'postgresql':
+            _backends[key] = PostgresBackend()
+        else:
+            _backends[key] = LikeBackend()
+    return _backends[key]
+
+
+def _search(queryset, query, table, fuzzy_scores):
+    queryset = get_backend().search(queryset, table, query, fuzzy_scores)
+    # Lower ranks sort first, so the best match leads
+    return queryset.order_by('search_rank', '-created_at')
+
+
+def search_needs(queryset, query):
+    """Filter a Need queryset to ``query`` matches, best matches first."""
+    # Counted over the whole search table, which is cheap, not the queryset
+    if get_backend().count_matches(NEED_TABLE, query, FUZZY_LIMIT) >= FUZZY_LIMIT:
+        fuzzy_scores = None
+    else:
+        fuzzy_scores = fuzzy_matches(queryset.model, query)
+    return _search(queryset, query, NEED_TABLE, fuzzy_scores)
+
+
+def search_resources(queryset, query):
+    """Filter a Resource queryset to ``query`` matches, best matches first."""
+    return _search(queryset, query, RESOURCE_TABLE, None)
+
+
+def fuzzy_key(obj):
+    fields = FUZZY_FIELDS[obj._meta.label_lower]
+    return textnorm.search_key(' '.join(getattr(obj, field) or '' for field in fields))
+
+
+def index_fuzzy(obj):
+    """Store the search key and trigrams of ``obj``, skipping unchanged keys."""
+    content_type = ContentType.objects.get_for_model(obj)
+    key = fuzzy_key(obj)
+    search_key, created = SearchKey.objects.get_or_create(
+        content_type=content_type, object_id=obj.pk, defaults={'key': key},
+    )
+    if not created:
+        if search_key.key == key:
+            return
+        search_key.key = key
+        search_key.save(update_fields=['key'])
+        SearchTrigram.objects.filter(content_type=content_type, object_id=obj.pk).delete()
+    SearchTrigram.objects.bulk_create([
+        SearchTrigram(content_type=content_type, object_id=obj.pk, trigram=trigram)
+        for trigram in textnorm.trigrams(key)
+    ])
+
+
+def index_new_fuzzy(objs):
+    """index_fuzzy() for objects just created in bulk.
+
+    Rows are inserted directly, an import creates a dozen trigrams per object
+    and building model instances for them would dominate its run time.
+    """
+    if not objs:
+        return
+    content_type = ContentType.objects.get_for_model(objs[0])
+    keys = [(obj.pk, fuzzy_key(obj)) for obj in objs]
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {SearchKey._meta.db_table} (content_type_id, object_id, key) VALUES (%s, %s, %s)',
+            [(content_type.id, pk, key) for pk, key in keys],
+        )
+        cursor.executemany(
+            f'INSERT INTO {SearchTrigram._meta.db_table} (content_type_id, object_id, trigram) VALUES (%s, %s, %s)',
+            [(content_type.id, pk, trigram) for pk, key in keys for trigram in textnorm.trigrams(key)],
+        )
+
+
+def remove_fuzzy(obj):
+    content_type = ContentType.objects.get_for_model(obj)
+    SearchKey.objects.filter(content_type=content_type, object_id=obj.pk).delete()
+    SearchTrigram.objects.filter(content_type=content_type, object_id=obj.pk).delete()
+
+
+def fuzzy_matches(model, query):
+    """Map of object id to similarity for the objects of ``model`` whose place
+    names resemble ``query``, best FUZZY_LIMIT only."""
+    query_key = textnorm.search_key(query)
+    if not query_key:
+        return {}
+    content_type = ContentType.objects.get_for_model(model)
+    candidates = (
+        SearchTrigram.objects
+        .filter(content_type=content_type, trigram__in=textnorm.trigrams(query_key))
+        .values('object_id')
+        .annotate(hits=Count('id'))
+        .order_by('-hits')[:FUZZY_CANDIDATES]
+    )
+    keys = SearchKey.objects.filter(
+        content_type=content_type,
+        object_id__in=[candidate['object_id'] for candidate in candidates],
+    ).values_list('object_id', 'key')
+    scores = {
+        object_id: textnorm.similarity(query_key, key)
+        for object_id, key in keys
+    }
+    best = sorted(
+        (item for item in scores.items() if item[1] >= FUZZY_THRESHOLD),
+        key=lambda item: item[1], reverse=True,
+    )
+    return dict(best[:FUZZY_LIMIT])
@@ -0,0 +1,93 @@
+"""Plain-dict serializers shared by the JSON endpoints."""
+
+
+def need_feature(need, truncate=True):
+    """Serialize a Need as a GeoJSON Feature.
+
+    Expects ``category`` and ``disaster`` to be select_related. Needs without
+    coordinates get a null geometry. Descriptions are cut to 200 characters
+    unless ``truncate`` is false.
+    """
+    geometry = None
+    if need.latitude is not None and need.longitude is not None:
+        geometry = {
+            'type': 'Point',
+            'coordinates': [float(need.longitude), float(need.latitude)]
+        }
+    description = need.description
+    if truncate and len(description) > 200:
+        description = description[:200] + '...'
+    return {
+        'type': 'Feature',
+        'geometry': geometry,
+        'properties': {
+            'id': need.id,
+            'title': need.title,
+            'description': description,
+            'category': need.category.name if need.category else 'Unknown',
+            'category_type': need.category_type or 'unknown',
+            'disaster': need.disaster.name,
+            'location': need.location,
+            'city': need.city,
+            # Coordinates looked up from location/city, see app.geocoding
+            'geocoded': need.geocoded,
+            'status': need.status,
+            'priority': need.priority,
+            'is_verified': need.is_verified,
+            'contact_person': need.contact_person,
+            'contact_phone': need.contact_phone,
+            'created_at': need.created_at.isoformat(),
+            'url': f'/needs/{need.id}/'
+        }
+    }
+
+
+def resource_dict(resource):
+    return {
+        'id': resource.id,
+        'need': resource.need_id,
+        'description': resource.description,
+        'quantity': resource.quantity,
+        'availability_date': resource.availability_date.isoformat() if resource.availability_date else None,
+        'contact_info': resource.contact_info,
+        'provider_organization': resource.provider_organization_id,
+        'is_verified': resource.is_verified,
+        'status': resource.status,
+        'created_at': resource.created_at.isoformat(),
+        'updated_at': resource.updated_at.isoformat(),
+    }
+
+
+def service_dict(service):
+    return {
+        'id': service.id,
+        'need': service.need_id,
+        'service_type': service.service_type,
+        'capacity': service.capacity,
+        'current_occupancy': service.current_occupancy,
+        'operating_hours': service.operating_hours,
+        'start_date': service.start_date.isoformat() if service.start_date else None,
+        'end_date': service.end_date.isoformat() if service.end_date else None,
+        'eligibility_criteria': service.eligibility_criteria,
+        'requirements': service.requirements,
+        'provider_organization': service.provider_organization_id,
+    }
+
+
+def photo_dict(photo):
+    """A Photo with the URL of each stored size, for clients to pick from."""
+    return {
+        'id': photo.id,
+        'caption': photo.caption,
+        'width': photo.width,
+        'height': photo.height,
+        'url': photo.image.url,
+        'sizes': {str(width): url for width, url in photo.sizes()},
+    }
+
+
+def feature_collection(features):
+    return {
+        'type': 'FeatureCollection',
+        'features': list(features),
+    }
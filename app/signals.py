@@ -0,0 +1,126 @@
+"""Signal handlers keeping derived data in step with model writes."""
+from django.contrib.contenttypes.models import ContentType
+from django.core.signals import setting_changed
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import cache, counters, geocoding, live, profiling, search, tasks
+from .models import Category, ChangeLog, Disaster, Need, Photo, ProfilingConfig, Resource, Service
+
+
+@receiver(post_save, sender=Category)
+def sync_need_category_type(sender, instance, created, **kwargs):
+    if not created:
+        Need.objects.filter(category=instance).exclude(
+            category_type=instance.category_type,
+        ).update(category_type=instance.category_type, updated_at=timezone.now())
+
+
+@receiver(pre_delete, sender=Category)
+def clear_need_category_type(sender, instance, **kwargs):
+    # on_delete=SET_NULL updates the needs without saving them
+    Need.objects.filter(category=instance).update(category_type='', updated_at=timezone.now())
+
+
+@receiver([post_save, post_delete], sender=Need)
+@receiver([post_save, post_delete], sender=Resource)
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_counters(sender, **kwargs):
+    counters.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Need)
+@receiver([post_save, post_delete], sender=Resource)
+@receiver([post_save, post_delete], sender=Disaster)
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_page_cache(sender, **kwargs):
+    cache.bump_data_version()
+
+
+@receiver([post_save, post_delete], sender=Disaster)
+@receiver([post_save, post_delete], sender=Category)
+def record_untracked_change(sender, instance, signal, created=False, **kwargs):
+    """Log writes not visible through Need.updated_at (see cache.untracked_sources);
+    deleted needs have their tombstone already."""
+    if signal is post_delete:
+        action = 'deleted'
+    else:
+        action = 'created' if created else 'updated'
+    ChangeLog.objects.create(
+        content_type=ContentType.objects.get_for_model(sender), object_id=instance.pk, action=action,
+    )
+
+
+@receiver([post_save, post_delete], sender=Need)
+def wake_live_map(sender, **kwargs):
+    live.broker.notify()
+
+
+@receiver(post_save, sender=Need)
+def index_need(sender, instance, **kwargs):
+    # Also refreshes the fuzzy keys; the worker does it after the commit
+    tasks.index_need.enqueue(need_id=instance.pk)
+
+
+@receiver(post_delete, sender=Need)
+def unindex_need(sender, instance, **kwargs):
+    search.get_backend().remove_need(instance.pk)
+
+
+@receiver(post_save, sender=Resource)
+def index_resource(sender, instance, **kwargs):
+    tasks.index_resource.enqueue(resource_id=instance.pk)
+
+
+@receiver(post_delete, sender=Resource)
+def unindex_resource(sender, instance, **kwargs):
+    search.get_backend().remove_resource(instance.pk)
+
+
+@receiver(post_save, sender=Disaster)
+def index_disaster(sender, instance, **kwargs):
+    tasks.index_disaster.enqueue(disaster_id=instance.pk)
+
+
+@receiver(post_delete, sender=Need)
+@receiver(post_delete, sender=Disaster)
+def unindex_fuzzy(sender, instance, **kwargs):
+    search.remove_fuzzy(instance)
+
+
+@receiver(post_save, sender=Photo)
+def process_photo(sender, instance, **kwargs):
+    # Processing saves the photo again, with its width set
+    if instance.width is None and instance.image:
+        tasks.process_photo.enqueue(photo_id=instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Service)
+def touch_service_need(sender, instance, **kwargs):
+    # Sync clients find changed services through their need's updated_at
+    Need.objects.filter(pk=instance.need_id).update(updated_at=timezone.now())
+
+
+@receiver(post_delete, sender=Need)
+@receiver(post_delete, sender=Resource)
+@receiver(post_delete, sender=Service)
+def record_deletion(sender, instance, **kwargs):
+    """Leave a tombstone for sync clients (see app.sync)."""
+    ChangeLog.objects.create(
+        content_type=ContentType.objects.get_for_model(sender),
+        object_id=instance.pk,
+        action='deleted',
+    )
+
+
+@receiver([post_save, post_delete], sender=ProfilingConfig)
+def reload_profiling_config(sender, **kwargs):
+    # Other processes pick the change up within profiling.CONFIG_SECONDS
+    profiling.clear_config()
+
+
+@receiver(setting_changed)
+def reload_gazetteer(sender, setting, **kwargs):
+    if setting == 'GAZETTEER_FILES':
+        geocoding.reset()
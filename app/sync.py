@@ -0,0 +1,167 @@
+"""Incremental sync for offline field clients.
+
+A client keeps the ``next_since`` watermark of its last sync and sends it
+back as ``since``; the server answers with the needs, resources and services
+written at or after it, plus tombstones for the ones deleted since. The work
+is proportional to what changed, not to the size of the dataset.
+
+Rows are found through ``updated_at`` (services through their need, which is
+touched whenever its service changes) and deletions through the ``deleted``
+ChangeLog entries written by ``app.signals``.
+
+A row can commit slightly after its ``updated_at`` was taken, so a complete
+sync hands back a watermark SYNC_OVERLAP in the past. Clients therefore see
+some rows twice and must apply changes as upserts by id.
+
+A truncated sync resumes each kind of row from the ``(updated_at, id)`` of
+the last one sent, so it moves forward even when more than ``limit`` rows
+share one ``updated_at`` (a category change touches all its needs at once).
+Its ``next_since`` is then an opaque cursor holding those positions.
+"""
+import base64
+import binascii
+import datetime
+import json
+
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import ChangeLog, Need, Resource, Service
+from .serializers import need_feature, resource_dict, service_dict
+
+SYNC_LIMIT = 1000
+SYNC_MAX_LIMIT = 5000
+SYNC_OVERLAP = datetime.timedelta(seconds=30)
+# Models whose deletions are reported, and their key in the response
+TOMBSTONE_KEYS = {Need: 'needs', Resource: 'resources', Service: 'services'}
+# Kinds of row a cursor holds a position for; services follow their needs
+CURSOR_KINDS = ('needs', 'resources', 'deleted')
+
+
+def parse_since(value):
+    """Parse an ISO 8601 watermark; naive values are taken as UTC.
+
+    Raises ValueError when ``value`` is not a datetime.
+    """
+    since = parse_datetime(value)
+    if since is None:
+        raise ValueError('since must be an ISO 8601 datetime')
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since, datetime.timezone.utc)
+    return since
+
+
+def parse_cursor(value):
+    """Parse a ``since`` value into a position per kind of row (see CURSOR_KINDS).
+
+    ``value`` is an ISO 8601 watermark or the ``next_since`` of a truncated
+    sync. Raises ValueError when it is neither.
+    """
+    try:
+        since = parse_since(value)
+    except ValueError:
+        pass
+    else:
+        return {kind: (since, None) for kind in CURSOR_KINDS}
+    try:
+        padded = value + '=' * (-len(value) % 4)
+        positions = json.loads(base64.urlsafe_b64decode(padded))
+        cursor = {}
+        for kind in CURSOR_KINDS:
+            changed_at, last_id = positions[kind]
+            if last_id is not None and not isinstance(last_id, int):
+                raise TypeError(last_id)
+            cursor[kind] = (parse_since(changed_at), last_id)
+        return cursor
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError, KeyError) as e:
+        raise ValueError('since must be an ISO 8601 datetime or a next_since value') from e
+
+
+def encode_cursor(cursor):
+    """The ``since`` value for ``cursor``: a plain watermark when every kind
+    resumes from the same time, else an opaque token."""
+    positions = set(cursor.values())
+    if len(positions) == 1:
+        (changed_at, last_id), = positions
+        if last_id is None:
+            return changed_at.isoformat()
+    payload = json.dumps(
+        {kind: [changed_at.isoformat(), last_id] for kind, (changed_at, last_id) in cursor.items()},
+        separators=(',', ':'),
+    )
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def after(field, position):
+    """Filter for rows whose ``field`` changed at or after ``position``.
+
+    ``position`` is a (time, id) pair; with an id, rows at that very time
+    are only taken past it.
+    """
+    changed_at, last_id = position
+    if last_id is None:
+        return Q(**{f'{field}__gte': changed_at})
+    return Q(**{f'{field}__gt': changed_at}) | Q(**{field: changed_at, 'id__gt': last_id})
+
+
+def _changed(queryset, field, position, limit):
+    """Up to ``limit`` rows changed at or after ``position``, oldest change first.
+
+    Returns the rows and, when more remain, the position of the last one.
+    """
+    if position is not None:
+        queryset = queryset.filter(after(field, position))
+    rows = list(queryset.order_by(field, 'id')[:limit + 1])
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, (getattr(rows[-1], field), rows[-1].id)
+    return rows, None
+
+
+def changes_since(since=None, limit=SYNC_LIMIT):
+    """Changes past the cursor ``since`` (everything when None), as a JSON-ready dict.
+
+    When a kind of row has more than ``limit`` changes, ``complete`` is false
+    and ``next_since`` resumes that kind after the last row sent; the other
+    kinds resume from the usual overlapping watermark.
+    """
+    until = timezone.now()
+    since = since or {}
+    resume = {}
+    needs, resume['needs'] = _changed(
+        Need.objects.select_related('category', 'disaster'), 'updated_at', since.get('needs'), limit,
+    )
+    resources, resume['resources'] = _changed(Resource.objects.all(), 'updated_at', since.get('resources'), limit)
+    services = Service.objects.filter(need__in=[need.id for need in needs])
+
+    deleted = {key: [] for key in TOMBSTONE_KEYS.values()}
+    if since:
+        # A first sync has nothing to delete
+        keys = {
+            content_type.id: TOMBSTONE_KEYS[model]
+            for model, content_type in ContentType.objects.get_for_models(*TOMBSTONE_KEYS).items()
+        }
+        tombstones = ChangeLog.objects.filter(action='deleted', content_type__in=list(keys))
+        entries, resume['deleted'] = _changed(tombstones, 'timestamp', since.get('deleted'), limit)
+        for entry in entries:
+            deleted[keys[entry.content_type_id]].append(entry.object_id)
+
+    complete = not any(resume.values())
+    next_since = {kind: resume.get(kind) or (until - SYNC_OVERLAP, None) for kind in CURSOR_KINDS}
+    return {
+        'since': encode_cursor(since) if since else None,
+        'next_since': encode_cursor(next_since),
+        'complete': complete,
+        'needs': [_sync_feature(need) for need in needs],
+        'resources': [resource_dict(resource) for resource in resources],
+        'services': [service_dict(service) for service in services],
+        'deleted': deleted,
+    }
+
+
+def _sync_feature(need):
+    feature = need_feature(need, truncate=False)
+    feature['properties']['updated_at'] = need.updated_at.isoformat()
+    return feature
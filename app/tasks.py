@@ -0,0 +1,215 @@
+"""A database-backed queue for work that should not hold up a request.
+
+Functions decorated with ``@task`` are queued with ``.enqueue(**kwargs)``,
+which inserts a Task row in the current transaction: if the request's
+writes roll back, so does the task, and the worker only sees it once they
+commit. ``manage.py run_worker`` claims due tasks, highest priority first,
+and runs each in its own transaction. A task that raises is retried after
+RETRY_DELAY, doubling each time, until it has run ``max_attempts`` times,
+and then stays failed, with its traceback, for the admin to retry.
+
+Tasks are claimed with a conditional UPDATE rather than row locks, so any
+number of workers can share the queue on SQLite as well as PostgreSQL.
+A worker that dies mid-task leaves it running; after STALE_AFTER another
+worker puts it back in the queue.
+
+With TASKS_EAGER (the default when DEBUG is on) ``enqueue`` runs the task
+at once instead, so development needs no worker.
+
+Keyword arguments must be JSON serializable; pass ids, not model instances.
+"""
+import datetime
+import logging
+import os
+import socket
+import threading
+import traceback
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image
+
+from . import images, search
+from .models import Disaster, Need, Photo, Resource, Task
+
+logger = logging.getLogger('app.tasks')
+
+HIGH = 10
+NORMAL = 0
+LOW = -10
+MAX_ATTEMPTS = 3
+RETRY_DELAY = datetime.timedelta(seconds=30)
+# Running this long means the worker died
+STALE_AFTER = datetime.timedelta(minutes=15)
+# Finished tasks are deleted after this long
+KEEP_DONE = datetime.timedelta(days=7)
+POLL_SECONDS = 1.0
+# Seconds between the worker's housekeeping passes
+HOUSEKEEPING_SECONDS = 60
+
+registry = {}
+
+
+class TaskFunction:
+    """A function run by the worker; calling it still runs it directly."""
+
+    def __init__(self, func, priority, max_attempts, unique):
+        self.func = func
+        self.name = f'{func.__module__}.{func.__qualname__}'
+        self.priority = priority
+        self.max_attempts = max_attempts
+        self.unique = unique
+
+    def __call__(self, **kwargs):
+        return self.func(**kwargs)
+
+    def enqueue(self, priority=None, delay=None, **kwargs):
+        """Queue a run with ``kwargs``. Returns the Task, or None when it ran
+        eagerly or an identical unique task was already queued."""
+        if settings.TASKS_EAGER:
+            self.func(**kwargs)
+            return None
+        if self.unique and Task.objects.filter(name=self.name, kwargs=kwargs, status=Task.QUEUED).exists():
+            return None
+        return Task.objects.create(
+            name=self.name,
+            kwargs=kwargs,
+            priority=self.priority if priority is None else priority,
+            max_attempts=self.max_attempts,
+            run_after=timezone.now() + (delay or datetime.timedelta()),
+        )
+
+
+def task(priority=NORMAL, max_attempts=MAX_ATTEMPTS, unique=False):
+    """Register a function as a task.
+
+    ``unique`` tasks are not queued again while an identical one is waiting,
+    which coalesces bursts of saves into one run.
+    """
+    def decorator(func):
+        task_function = TaskFunction(func, priority, max_attempts, unique)
+        registry[task_function.name] = task_function
+        return task_function
+    return decorator
+
+
+class Worker:
+    def __init__(self, name=None, poll_seconds=POLL_SECONDS):
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self.poll_seconds = poll_seconds
+        self.stopping = threading.Event()
+        self.done = 0
+        self.failed = 0
+
+    def claim(self):
+        """Mark the next due task as running on this worker and return it, or None."""
+        now = timezone.now()
+        due = Task.objects.filter(status=Task.QUEUED, run_after__lte=now).order_by('-priority', 'run_after', 'id')
+        for task_id in due.values_list('id', flat=True)[:10]:
+            claimed = Task.objects.filter(id=task_id, status=Task.QUEUED).update(
+                status=Task.RUNNING, locked_by=self.name, started_at=now, attempts=F('attempts') + 1,
+            )
+            if claimed:
+                return Task.objects.get(id=task_id)
+            # Another worker got there first
+        return None
+
+    def execute(self, task):
+        task_function = registry.get(task.name)
+        try:
+            if task_function is None:
+                raise LookupError(f'No task named {task.name}')
+            with transaction.atomic():
+                task_function.func(**task.kwargs)
+        except Exception:
+            task.last_error = traceback.format_exc()
+            if task_function is not None and task.attempts < task.max_attempts:
+                task.status = Task.QUEUED
+                task.run_after = timezone.now() + RETRY_DELAY * 2 ** (task.attempts - 1)
+                logger.warning('Task %s %s failed, retrying at %s', task.id, task.name, task.run_after, exc_info=True)
+            else:
+                task.status = Task.FAILED
+                task.finished_at = timezone.now()
+                self.failed += 1
+                logger.error('Task %s %s failed for good', task.id, task.name, exc_info=True)
+        else:
+            task.status = Task.DONE
+            task.finished_at = timezone.now()
+            self.done += 1
+        task.locked_by = ''
+        task.save(update_fields=['status', 'run_after', 'finished_at', 'last_error', 'locked_by'])
+
+    def run_pending(self):
+        """Run due tasks until none are left or the worker is stopped."""
+        count = 0
+        while not self.stopping.is_set():
+            task = self.claim()
+            if task is None:
+                break
+            self.execute(task)
+            count += 1
+        return count
+
+    def housekeeping(self):
+        now = timezone.now()
+        requeued = Task.objects.filter(status=Task.RUNNING, started_at__lt=now - STALE_AFTER).update(
+            status=Task.QUEUED, locked_by='',
+        )
+        if requeued:
+            logger.warning('Requeued %s tasks left running by a dead worker', requeued)
+        Task.objects.filter(status=Task.DONE, finished_at__lt=now - KEEP_DONE).delete()
+
+    def run(self):
+        """Work until stop() is called."""
+        next_housekeeping = 0
+        while not self.stopping.is_set():
+            close_old_connections()
+            try:
+                if timezone.now().timestamp() >= next_housekeeping:
+                    self.housekeeping()
+                    next_housekeeping = timezone.now().timestamp() + HOUSEKEEPING_SECONDS
+                ran = self.run_pending()
+            except Exception:
+                # The database went away, say; keep the worker alive
+                logger.exception('Worker %s could not poll the queue', self.name)
+                ran = 0
+            if not ran:
+                self.stopping.wait(self.poll_seconds)
+
+    def stop(self):
+        self.stopping.set()
+
+
+@task(priority=HIGH, unique=True)
+def index_need(need_id):
+    need = Need.objects.filter(pk=need_id).first()
+    if need is not None:
+        search.get_backend().index_need(need)
+        search.index_fuzzy(need)
+
+
+@task(priority=HIGH, unique=True)
+def index_resource(resource_id):
+    resource = Resource.objects.select_related('need').filter(pk=resource_id).first()
+    if resource is not None:
+        search.get_backend().index_resource(resource)
+
+
+@task(priority=HIGH, unique=True)
+def index_disaster(disaster_id):
+    disaster = Disaster.objects.filter(pk=disaster_id).first()
+    if disaster is not None:
+        search.index_fuzzy(disaster)
+
+
+@task(unique=True)
+def process_photo(photo_id):
+    photo = Photo.objects.filter(pk=photo_id, width__isnull=True).exclude(image='').first()
+    if photo is not None:
+        try:
+            images.process_photo(photo)
+        except Image.DecompressionBombError:
+            # Would fail the same way on every retry
+            logger.warning('Photo %s (%s) is too large to process', photo.id, photo.image.name, exc_info=True)
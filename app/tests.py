@@ -1,3 +1,1329 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import warnings
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache as django_cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.http import QueryDict
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import benchmark, budgets, cache, clusters, counters, export, geo, geocoding, images, importer, live, loadgen, metrics, pagination, profiling, search, tasks, textnorm
+from .models import Category, ChangeLog, Comment, Disaster, Field, Need, Photo, ProfilingConfig, Resource, SearchKey, Service, Task
+from .serializers import need_feature
+from .views import RECENT_ORDERING, SEARCH_ORDERING
+
+
+class ViewportTests(TestCase):
+    def test_bbox_past_the_antimeridian_wraps(self):
+        self.assertEqual(geo.parse_bbox('-200,0,-190,10'), geo.BBox(160.0, 0.0, 170.0, 10.0))
+        self.assertEqual(geo.parse_bbox('-190,0,-180,10'), geo.BBox(170.0, 0.0, 180.0, 10.0))
+        # Crossing it
+        self.assertEqual(geo.parse_bbox('170,0,190,10'), geo.BBox(170.0, 0.0, -170.0, 10.0))
+        # A view wider than the world is the world
+        self.assertEqual(geo.parse_bbox('-500,-100,500,100'), geo.BBox(-180.0, -90.0, 180.0, 90.0))
+
+    def test_map_data_for_a_viewport_past_the_antimeridian(self):
+        disaster = Disaster.objects.create(
+            name='Cyclone', slug='cyclone', affected_areas='Fiji', start_date=datetime.date(2025, 8, 1),
+        )
+        Need.objects.create(disaster=disaster, title='Fiji', description='', latitude=5, longitude=165)
+        Need.objects.create(disaster=disaster, title='Sindh', description='', latitude=26, longitude=68)
+        for bbox in ['-200,0,-190,10', '160,0,200,10']:
+            response = self.client.get(reverse('app:map_data_api'), {'bbox': bbox})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([f['properties']['title'] for f in response.json()['features']], ['Fiji'])
+
+    def test_parse_bbox(self):
+        self.assertEqual(geo.parse_bbox('66.5,24.1,71.2,28.9'), geo.BBox(66.5, 24.1, 71.2, 28.9))
+        # Latitudes past the poles are clamped
+        self.assertEqual(geo.parse_bbox('60,-95,70,95'), geo.BBox(60.0, -90.0, 70.0, 90.0))
+        for value in ['66,24,71', '66,24,71,28,1', 'a,24,71,28', '66,nan,71,28', '66,inf,71,28', '66,28,71,24']:
+            with self.assertRaises(ValueError, msg=value):
+                geo.parse_bbox(value)
+
+    def test_parse_zoom(self):
+        self.assertIsNone(geo.parse_zoom(None))
+        self.assertEqual(geo.parse_zoom('', default=5), 5)
+        self.assertEqual(geo.parse_zoom('9'), 9)
+        self.assertEqual((geo.parse_zoom('-3'), geo.parse_zoom('40')), (0, geo.MAX_ZOOM))
+        with self.assertRaises(ValueError):
+            geo.parse_zoom('close')
+
+    def test_tile_bbox(self):
+        world = geo.tile_bbox(0, 0, 0)
+        self.assertEqual((world.west, world.east), (-180.0, 180.0))
+        self.assertAlmostEqual(world.north, 85.0511, places=4)
+        self.assertAlmostEqual(world.south, -85.0511, places=4)
+        # The north-east quarter
+        tile = geo.tile_bbox(1, 1, 0)
+        self.assertEqual((tile.west, tile.east), (0.0, 180.0))
+        self.assertAlmostEqual(tile.south, 0.0)
+        for z, x, y in [(-1, 0, 0), (geo.MAX_ZOOM + 1, 0, 0), (1, 2, 0), (1, 0, -1)]:
+            with self.assertRaises(ValueError):
+                geo.tile_bbox(z, x, y)
+
+    def test_map_data_and_tiles_for_a_viewport(self):
+        disaster = Disaster.objects.create(
+            name='Flood', slug='flood', affected_areas='Sindh', start_date=datetime.date(2025, 8, 1),
+        )
+        Need.objects.create(disaster=disaster, title='Dadu', description='', latitude=26.73, longitude=67.78)
+        Need.objects.create(disaster=disaster, title='Swat', description='', latitude=35.22, longitude=72.43)
+        response = self.client.get(reverse('app:map_data_api'), {'bbox': '66,24,70,28'})
+        self.assertEqual([f['properties']['title'] for f in response.json()['features']], ['Dadu'])
+        response = self.client.get(reverse('app:map_data_api'), {'bbox': '66,28,70,24'})
+        self.assertEqual(response.status_code, 400)
+
+        # Tile 12/2819/1732 contains Dadu
+        response = self.client.get(reverse('app:map_tile_api', args=[12, 2819, 1732]))
+        self.assertEqual([f['properties']['title'] for f in response.json()['features']], ['Dadu'])
+        response = self.client.get(reverse('app:map_tile_api', args=[2, 4, 0]))
+        self.assertEqual(response.status_code, 400)
+
+
+class ClusterTests(TestCase):
+    def setUp(self):
+        disaster = Disaster.objects.create(
+            name='Flood', slug='flood', affected_areas='Sindh', start_date=datetime.date(2025, 8, 1),
+        )
+        kitchens = Category.objects.create(name='Kitchens', category_type='service')
+        rescue = Category.objects.create(name='Rescue', category_type='problem')
+        for title, category, priority, latitude, longitude in [
+            ('Boats', rescue, 'urgent', 26.73, 67.78),
+            ('Food', kitchens, 'low', 26.91, 67.95),
+            ('Tents', None, 'medium', 27.02, 68.10),
+            ('Bridge', rescue, 'high', 35.22, 72.43),
+        ]:
+            Need.objects.create(
+                disaster=disaster, title=title, description='', category=category, priority=priority,
+                latitude=latitude, longitude=longitude,
+            )
+
+    def cells(self, zoom):
+        return clusters.cluster_needs(Need.objects.all(), zoom)
+
+    def test_needs_are_grouped_by_grid_cell(self):
+        self.assertEqual(sorted(c['properties']['count'] for c in self.cells(5)), [1, 3])
+        (sindh,) = [c for c in self.cells(5) if c['properties']['count'] == 3]
+        properties = sindh['properties']
+        self.assertTrue(properties['cluster'])
+        self.assertEqual(properties['counts'], {'problem': 1, 'service': 1, 'unknown': 1})
+        self.assertEqual(properties['max_priority'], 'urgent')
+        # The centroid of its needs, inside the cell's bounds
+        lng, lat = sindh['geometry']['coordinates']
+        self.assertAlmostEqual(lat, (26.73 + 26.91 + 27.02) / 3)
+        self.assertAlmostEqual(lng, (67.78 + 67.95 + 68.10) / 3)
+        west, south, east, north = properties['bounds']
+        self.assertTrue(west <= lng < east and south <= lat < north)
+        self.assertAlmostEqual(east - west, geo.cluster_cell_size(5))
+
+    def test_cells_shrink_as_the_map_zooms_in(self):
+        self.assertEqual(len(self.cells(0)), 1)
+        self.assertEqual(len(self.cells(10)), 4)
+
+    def test_map_data_clusters_below_the_cluster_zoom(self):
+        url = reverse('app:map_data_api')
+        features = self.client.get(url, {'zoom': geo.CLUSTER_MAX_ZOOM - 1}).json()['features']
+        self.assertTrue(all(f['properties']['cluster'] for f in features))
+        features = self.client.get(url, {'zoom': geo.CLUSTER_MAX_ZOOM}).json()['features']
+        self.assertEqual(len(features), 4)
+        self.assertNotIn('cluster', features[0]['properties'])
+
+
+class GeohashTests(TestCase):
+    def setUp(self):
+        disaster = Disaster.objects.create(
+            name='Cyclone', slug='cyclone', affected_areas='Fiji', start_date=datetime.date(2025, 8, 1),
+        )
+        for title, longitude in [('Fiji', 178), ('Samoa', -172), ('Sindh', 68)]:
+            Need.objects.create(disaster=disaster, title=title, description='', latitude=-15, longitude=longitude)
+
+    def in_bbox(self, *bbox):
+        return sorted(Need.objects.in_bbox(geo.BBox(*bbox)).values_list('title', flat=True))
+
+    def test_encode_geohash(self):
+        self.assertEqual(geo.encode_geohash(57.64911, 10.40744), 'u4pruydqq')
+        self.assertEqual(geo.encode_geohash(42.6, -5.6, precision=5), 'ezs42')
+        self.assertEqual(geo.encode_geohash(Decimal('-15.000000'), Decimal('178.000000'), precision=3), 'rvq')
+        # Nearby points share a prefix
+        self.assertEqual(geo.encode_geohash(26.73, 67.78)[:4], geo.encode_geohash(26.74, 67.79)[:4])
+
+    def test_geohash_cover(self):
+        bbox = geo.BBox(66.5, 24.1, 71.2, 28.9)
+        cover = geo.geohash_cover(bbox)
+        self.assertLessEqual(len(cover), geo.GEOHASH_MAX_COVER_CELLS)
+        self.assertEqual(len({len(prefix) for prefix in cover}), 1)
+        for latitude in [24.1, 26.5, 28.9]:
+            for longitude in [66.5, 68.85, 71.2]:
+                geohash = geo.encode_geohash(latitude, longitude)
+                self.assertTrue(any(geohash.startswith(prefix) for prefix in cover), (latitude, longitude))
+        # Smaller boxes get longer prefixes
+        self.assertGreater(len(geo.geohash_cover(geo.BBox(67.78, 26.73, 67.79, 26.74))[0]), len(cover[0]))
+        # The whole world is one range
+        self.assertEqual(geo.geohash_cover(geo.BBox(-180, -90, 180, 90)), [''])
+        with self.assertRaises(ValueError):
+            geo.geohash_cover(geo.BBox(170, -20, -170, -10))
+
+    def test_split_antimeridian(self):
+        self.assertEqual(geo.split_antimeridian(geo.BBox(60, 20, 80, 30)), [geo.BBox(60, 20, 80, 30)])
+        self.assertEqual(
+            geo.split_antimeridian(geo.BBox(170, -20, -170, -10)),
+            [geo.BBox(170, -20, 180.0, -10), geo.BBox(-180.0, -20, -170, -10)],
+        )
+        # A half that would not shrink is not split again
+        self.assertEqual(geo.split_antimeridian(geo.BBox(-180, 0, -190, 10)), [])
+        self.assertEqual(geo.split_antimeridian(geo.BBox(200, 0, 190, 10)), [])
+
+    def test_in_bbox_across_the_antimeridian(self):
+        self.assertEqual(self.in_bbox(170, -20, -170, -10), ['Fiji', 'Samoa'])
+        self.assertEqual(self.in_bbox(175, -20, -175, -10), ['Fiji'])
+        self.assertEqual(self.in_bbox(60, -20, 80, -10), ['Sindh'])
+
+    def test_in_bbox_with_longitudes_out_of_range(self):
+        # Used to recurse until RecursionError
+        self.assertEqual(self.in_bbox(-180, -20, -190, -10), [])
+        self.assertEqual(self.in_bbox(200, -20, 190, -10), [])
+
+
+class NearbyTests(TestCase):
+    def setUp(self):
+        disaster = Disaster.objects.create(
+            name='Flood', slug='flood', affected_areas='Sindh', start_date=datetime.date(2025, 8, 1),
+        )
+        kitchens = Category.objects.create(name='Kitchens', category_type='service')
+        # Degrees of latitude north of (26, 68), about 1.1, 5.6 and 11.1 km
+        for title, offset, status in [
+            ('Far', 0.1, 'open'), ('Near', 0.01, 'open'), ('Middle', 0.05, 'open'), ('Done', 0.02, 'resolved'),
+        ]:
+            Need.objects.create(
+                disaster=disaster, title=title, description='', status=status, latitude=26 + offset, longitude=68,
+            )
+        kitchen = Need.objects.create(
+            disaster=disaster, title='Kitchen', description='', category=kitchens, latitude=25.97, longitude=68,
+        )
+        Service.objects.create(need=kitchen, service_type='food')
+        closed = Need.objects.create(
+            disaster=disaster, title='Closed kitchen', description='', category=kitchens, latitude=26, longitude=68,
+        )
+        Service.objects.create(need=closed, service_type='food', end_date=datetime.date(2025, 8, 2))
+
+    def nearby(self, **params):
+        response = self.client.get(reverse('app:nearby_api'), {'lat': 26, 'lng': 68, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['features']
+
+    def test_open_needs_nearest_first(self):
+        features = self.nearby()
+        self.assertEqual([f['properties']['title'] for f in features], ['Near', 'Kitchen', 'Middle'])
+        self.assertAlmostEqual(features[0]['properties']['distance_km'], 1.112, places=2)
+        self.assertEqual(features[1]['properties']['service_type'], 'food')
+        self.assertEqual(features[0]['properties']['photos'], [])
+
+    def test_radius_limit_and_filters(self):
+        self.assertEqual([f['properties']['title'] for f in self.nearby(radius=2)], ['Near'])
+        self.assertEqual(len(self.nearby(radius=20)), 4)
+        self.assertEqual(len(self.nearby(radius=20, limit=2)), 2)
+        self.assertEqual([f['properties']['title'] for f in self.nearby(type='service')], ['Kitchen'])
+        self.assertEqual([f['properties']['title'] for f in self.nearby(service_type='food')], ['Kitchen'])
+
+    def test_bad_parameters(self):
+        url = reverse('app:nearby_api')
+        for params in [{'lat': 26}, {'lat': 'north', 'lng': 68}, {'lat': 95, 'lng': 68}, {'lat': 26, 'lng': 68, 'limit': '1.5'}]:
+            self.assertEqual(self.client.get(url, params).status_code, 400, params)
+
+    def test_non_finite_numbers_are_rejected(self):
+        url = reverse('app:nearby_api')
+        for params in [
+            {'lat': '25', 'lng': '68', 'radius': 'nan'},
+            {'lat': '25', 'lng': '68', 'radius': 'inf'},
+            {'lat': 'nan', 'lng': '68'},
+            {'lat': '25', 'lng': '-inf'},
+        ]:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn('finite', response.json()['error'])
+
+
+class CounterTests(TestCase):
+    def setUp(self):
+        django_cache.clear()
+        self.disaster = Disaster.objects.create(
+            name='Flood', slug='flood', affected_areas='Sindh', start_date=datetime.date(2025, 8, 1),
+        )
+        rescue = Category.objects.create(name='Rescue', category_type='problem')
+        self.need = Need.objects.create(
+            disaster=self.disaster, title='Boats', description='', category=rescue, latitude=26.7, longitude=67.8,
+        )
+        Need.objects.create(disaster=self.disaster, title='Tents', description='', category=rescue, status='resolved')
+        Need.objects.create(disaster=self.disaster, title='Food', description='')
+        Resource.objects.create(need=self.need, description='Two boats')
+
+    def test_counts_by_criteria_from_one_query(self):
+        with self.assertNumQueries(1):
+            counts = counters.need_counts()
+        self.assertEqual(counts.count(), 3)
+        self.assertEqual(counts.count(category_type='problem'), 2)
+        self.assertEqual(counts.count(category_type='problem', status='open'), 1)
+        self.assertEqual(counts.count(geolocated=True), 1)
+        self.assertEqual(counts.count(disaster_id=self.disaster.id + 1), 0)
+        self.assertEqual(counters.resource_counts(), {'offered': 1})
+        with self.assertNumQueries(0):
+            counters.need_counts()
+            counters.resource_counts()
+
+    def test_writes_invalidate_the_counts(self):
+        counters.need_counts()
+        counters.resource_counts()
+        self.need.status = 'resolved'
+        self.need.save()
+        self.assertEqual(counters.need_counts().count(status='open'), 1)
+        Resource.objects.get().delete()
+        self.assertEqual(counters.resource_counts(), {})
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        django_cache.clear()
+        self.disaster = Disaster.objects.create(
+            name='Flood', slug='flood', affected_areas='Sindh', start_date=datetime.date(2025, 8, 1),
+        )
+
+    def test_anonymous_pages_are_served_from_the_cache_until_data_changes(self):
+        url = reverse('app:map_data_api')
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        # Only the map watermark is queried
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        # Equivalent query strings share an entry
+        self.assertEqual(self.client.get(url + '?bbox=&zoom=').status_code, 200)
+        self.assertEqual(self.client.get(url + '?zoom=&bbox=')['X-Cache'], 'HIT')
+
+        Need.objects.create(disaster=self.disaster, title='Boats', description='', latitude=26.7, longitude=67.8)
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.json()['features']), 1)
+
+        self.disaster.name = 'Monsoon flood'
+        self.disaster.save()
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+
+    def test_signed_in_users_bypass_the_cache(self):
+        self.client.force_login(User.objects.create_user('volunteer'))
+        url = reverse('app:map_data_api')
+        self.client.get(url)
+        self.assertNotIn('X-Cache', self.client.get(url))
+
+    def test_signed_in_user_is_loaded_once(self):
+        self.client.force_login(User.objects.create_user('volunteer'))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('app:map_data_api'))
+        user_queries = [query for query in queries if 'FROM "auth_user"' in query['sql']]
+        self.assertEqual(len(user_queries), 1)
+
+    def test_normalized_query_string(self):
+        self.assertEqual(cache.normalized_query_string(QueryDict('b=2&a=1&c=&a=0')), 'a=0&a=1&b=2')
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.disaster = Disaster.objects.create(
+            name='Flood', slug='flood', affected_areas='Sindh', start_date=datetime.date(2025, 8, 1),
+        )
+
+    def search(self, query):
+        return list(search.search_needs(Need.objects.all(), query).values_list('title', flat=True))
+
+    def test_every_term_matches_as_a_prefix(self):
+        Need.objects.create(disaster=self.disaster, title='Boats for rescue', description='Stranded families')
+        Need.objects.create(disaster=self.disaster, title='Tents', description='Families need shelter')
+        self.assertEqual(self.search('boa'), ['Boats for rescue'])
+        self.assertEqual(sorted(self.search('FAMIL')), ['Boats for rescue', 'Tents'])
+        self.assertEqual(self.search('families shelt'), ['Tents'])
+        self.assertEqual(self.search('boats shelter'), [])
+        # Punctuation is not query syntax
+        self.assertEqual(self.search('"boats*'), ['Boats for rescue'])
+        self.assertEqual(self.search('!!'), [])
+
+    def test_better_matches_rank_first(self):
+        Need.objects.create(disaster=self.disaster, title='Water', description='Water and food, water tanks')
+        Need.objects.create(disaster=self.disaster, title='Food', description='Some water')
+        self.assertEqual(self.search('water'), ['Water', 'Food'])
+
+    def test_index_follows_edits_and_deletes(self):
+        need = Need.objects.create(disaster=self.disaster, title='Boats', description='')
+        need.title = 'Tents'
+        need.save()
+        self.assertEqual(self.search('boats'), [])
+        self.assertEqual(self.search('tents'), ['Tents'])
+        need.delete()
+        self.assertEqual(self.search('tents'), [])
+
+    def test_resources_match_their_need(self):
+        need = Need.objects.create(disaster=self.disaster, title='Boats', description='', location='Dadu')
+        resource = Resource.objects.create(need=need, description='Two motor boats')
+        self.assertEqual(list(search.search_resources(Resource.objects.all(), 'dadu')), [resource])
+        self.assertEqual(list(search.search_resources(Resource.objects.all(), 'motor')), [resource])
+
+    def test_postgres_ranks_only_matching_rows(self):
+        match = search.PostgresBackend().match_sql(search.NEED_TABLE)
+        # A rank of 0 for other rows would sort them before the fuzzy matches
+        self.assertIn('WHERE document @@ query', match)
+        self.assertEqual(match.count('%s'), 1)
+
+    def test_full_text_matches_rank_before_fuzzy_ones(self):
+        fuzzy = Need.objects.create(disaster=self.disaster, title='Tents', description='', city='Jakobabad')
+        exact = Need.objects.create(disaster=self.disaster, title='Jacobabad relief camp', description='')
+        results = search.search_needs(Need.objects.all(), 'Jacobabad')
+        self.assertEqual(list(results), [exact, fuzzy])
+        self.assertIsNotNone(results[1].search_rank)
+
+    def test_fuzzy_matching_is_skipped_with_enough_full_text_matches(self):
+        Need.objects.create(disaster=self.disaster, title='Tents', description='', city='Jakobabad')
+        for i in range(2):
+            Need.objects.create(disaster=self.disaster, title=f'Jacobabad camp {i}', description='')
+        with mock.patch.object(search, 'FUZZY_LIMIT', 3):
+            self.assertEqual(len(self.search('Jacobabad')), 3)
+        with mock.patch.object(search, 'FUZZY_LIMIT', 2), self.assertNumQueries(2):
+            self.assertEqual(sorted(self.search('Jacobabad')), ['Jacobabad camp 0', 'Jacobabad camp 1'])
+
+
+class TextNormTests(TestCase):
+    def test_spellings_share_a_key(self):
+        for spelling in ['Jakobabad city', 'جیکب آباد', 'Jacob abad', 'JACOBABAD']:
+            self.assertEqual(textnorm.search_key(spelling), textnorm.search_key('Jacobabad'), spelling)
+        self.assertEqual(textnorm.search_key('Qambar'), textnorm.search_key('Kambar'))
+        self.assertEqual(textnorm.search_key('Muzaffar Garh'), textnorm.search_key('Muzaffargarh'))
+        # Filler words are dropped, in English and Urdu
+        self.assertEqual(textnorm.search_key('District Dadu'), textnorm.search_key('ضلع دادو'))
+        self.assertEqual(textnorm.search_key('near the city'), '')
+        self.assertNotEqual(textnorm.search_key('Shikarpur'), textnorm.search_key('Sukkur'))
+
+    def test_trigrams_and_distances(self):
+        self.assertEqual(textnorm.trigrams('jkbd'), {'  j', ' jk', 'jkb', 'kbd', 'bd '})
+        self.assertEqual(textnorm.trigrams(''), set())
+        self.assertEqual(textnorm.edit_distance('kitten', 'sitting'), 3)
+        self.assertEqual(textnorm.edit_distance('', 'abc'), 3)
+        self.assertEqual(textnorm.similarity('jkbd', 'dd jkbd'), 1.0)
+        self.assertEqual(textnorm.similarity('jkbd', ''), 0.0)
+        self.assertLess(textnorm.similarity('jkbd', 'skr'), search.FUZZY_THRESHOLD)
+
+    def test_search_finds_other_spellings_of_place_names(self):
+        disaster = Disaster.objects.create(
+            name='Flood', slug='flood', affected_areas='Sindh', start_date=datetime.date(2025, 8, 1),
+        )
+        need = Need.objects.create(disaster=disaster, title='Tents', description='', city='Jacobabad')
+        Need.objects.create(disaster=disaster, title='Boats', description='', city='Sukkur')
+        for query in ['جیکب آباد', 'Jakobabad', 'Jacobabaad']:
+            self.assertEqual(list(search.search_needs(Need.objects.all(), query)), [need], query)
+        self.assertEqual(search.fuzzy_matches(Disaster, 'Sind'), {disaster.id: 1.0})
+
+        need.city = 'Shikarpur'
+        need.save()
+        self.assertEqual(list(search.search_needs(Need.objects.all(), 'Jakobabad')), [])
+        need.delete()
+        self.assertFalse(SearchKey.objects.filter(object_id=need.id, content_type__model='need').exists())
+
+    def test_bulk_indexing_matches_single_indexing(self):
+        disaster = Disaster.objects.create(
+            name='Flood', slug='flood', affected_areas='Sindh', start_date=datetime.date(2025, 8, 1),
+        )
+        needs = Need.objects.bulk_create([
+            Need(disaster=disaster, title='Tents', description='', city='Jacobabad'),
+            Need(disaster=disaster, title='Boats', description='', location='Goth Allah Bux'),
+        ])
+        search.index_new_fuzzy(needs)
+        bulk = dict(SearchKey.objects.filter(content_type__model='need').values_list('object_id', 'key'))
+        SearchKey.objects.filter(content_type__model='need').delete()
+        for need in needs:
+            search.index_fuzzy(need)
+        self.assertEqual(dict(SearchKey.objects.filter(content_type__model='need').values_list('object_id', 'key')), bulk)
+
+
+class PaginationTests(TestCase):
+    def setUp(self):
+        disaster = Disaster.objects.create(
+            name='Flood', slug='flood', affected_areas='Sindh', start_date=datetime.date(2025, 8, 1),
+        )
+        for i in range(5):
+            Need.objects.create(disaster=disaster, title=f'Boats {i}', description='Boats ' * (i + 1))
+        # Ties on created_at are broken by id
+        Need.objects.filter(title__in=['Boats 1', 'Boats 2', 'Boats 3']).update(
+            created_at=timezone.now() - datetime.timedelta(days=1),
+        )
+        self.expected = list(Need.objects.order_by('-created_at', '-id').values_list('title', flat=True))
+
+    def titles(self, page):
+        return [need.title for need in page]
+
+    def test_next_and_previous_cursors_walk_every_row_once(self):
+        paginator = pagination.KeysetPaginator(Need.objects.all(), 2, RECENT_ORDERING)
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+        self.assertEqual([title for page in pages for title in self.titles(page)], self.expected)
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertFalse(pages[0].has_previous())
+        self.assertIsNone(pages[-1].next_cursor)
+
+        previous = paginator.page(pages[-1].previous_cursor)
+        self.assertEqual(self.titles(previous), self.titles(pages[1]))
+        self.assertTrue(previous.has_next() and previous.has_previous())
+        first = paginator.page(previous.previous_cursor)
+        self.assertEqual(self.titles(first), self.titles(pages[0]))
+        self.assertFalse(first.has_previous())
+
+    async def test_async_pages(self):
+        paginator = pagination.KeysetPaginator(Need.objects.all(), 3, RECENT_ORDERING)
+        page = await paginator.apage()
+        second = await paginator.aget_page(page.next_cursor)
+        self.assertEqual(self.titles(page) + self.titles(second), self.expected)
+
+    def test_tampered_cursors(self):
+        paginator = pagination.KeysetPaginator(Need.objects.all(), 2, RECENT_ORDERING)
+        cursor = paginator.page().next_cursor
+        # Not base64, cut short, a value of the wrong type, too few values
+        for bad in ['!!!', cursor[:-3], 'WzEsIm5vdCBhIGRhdGUiLDFd', 'WzFd']:
+            with self.assertRaises(pagination.InvalidCursor, msg=bad):
+                paginator.page(bad)
+            # Pages fall back to the first one
+            self.assertEqual(self.titles(paginator.get_page(bad)), self.expected[:2])
+        response = self.client.get(reverse('app:map_data_api'), {'cursor': 'WzFd'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_search_results_page_by_rank(self):
+        needs = search.search_needs(Need.objects.all(), 'boats')
+        expected = list(needs.values_list('title', flat=True))
+        paginator = pagination.KeysetPaginator(needs, 2, SEARCH_ORDERING)
+        page = paginator.page()
+        titles = self.titles(page)
+        while page.has_next():
+            page = paginator.page(page.next_cursor)
+            titles += self.titles(page)
+        self.assertEqual(titles, expected)
+        self.assertEqual(sorted(titles), sorted(self.expected))
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'query plans are checked on SQLite')
+class QueryPlanTests(TestCase):
+    """The hot list and map queries are answered from the composite indexes
+    in Need/Resource/ChangeLog.Meta, not by scanning and sorting the table."""
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn(f'USING INDEX {index}', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def assertNoTableScan(self, queryset, table):
+        plan = queryset.explain()
+        self.assertIsNone(
+            re.search(rf'\bSCAN {table}\b(?! USING)', plan),
+            f'{table} is scanned without an index:\n{plan}',
+        )
+
+    def test_open_needs_by_recency(self):
+        queryset = Need.objects.filter(status='open').order_by(*RECENT_ORDERING)[:12]
+        self.assertUsesIndex(queryset, 'need_status_created_idx')
+
+    def test_open_needs_by_priority(self):
+        queryset = Need.objects.filter(
+            status='open', category_type='problem',
+        ).order_by('-priority', *RECENT_ORDERING)[:12]
+        self.assertUsesIndex(queryset, 'need_type_priority_idx')
+
+    def test_disaster_needs(self):
+        queryset = Need.objects.filter(disaster_id=1, status='open').order_by(*RECENT_ORDERING)[:12]
+        self.assertUsesIndex(queryset, 'need_disaster_status_idx')
+
+    def test_category_needs(self):
+        queryset = Need.objects.filter(category_id=1, status='open').order_by(*RECENT_ORDERING)[:12]
+        self.assertUsesIndex(queryset, 'need_category_status_idx')
+
+    def test_category_type_needs(self):
+        queryset = Need.objects.filter(
+            status='open', category_type='problem',
+        ).order_by(*RECENT_ORDERING)[:12]
+        self.assertUsesIndex(queryset, 'need_type_status_idx')
+
+    def test_nearby_needs(self):
+        queryset = Need.objects.filter(status='open').near(30.0, 70.0, 10).order_by_distance(30.0, 70.0)[:20]
+        self.assertNoTableScan(queryset, 'app_need')
+
+    def test_offered_resources_by_recency(self):
+        queryset = Resource.objects.filter(status='offered').order_by(*RECENT_ORDERING)[:12]
+        self.assertUsesIndex(queryset, 'resource_status_created_idx')
+
+    def test_object_history(self):
+        content_type = ContentType.objects.get_for_model(Need)
+        queryset = ChangeLog.objects.filter(content_type=content_type, object_id=1)
+        self.assertUsesIndex(queryset, 'changelog_object_idx')
+
+    def test_search_ranks_in_one_pass(self):
+        disaster = Disaster.objects.create(
+            name='Flood', slug='flood', affected_areas='Sindh', start_date=datetime.date(2025, 8, 1),
+        )
+        Need.objects.create(disaster=disaster, title='Water', description='Water tanks', city='Dadu')
+        queryset = search.search_needs(Need.objects.filter(status='open'), 'water dadu')
+        plan = queryset.explain()
+        # The full-text query runs once, not once per matching row
+        self.assertEqual(plan.count('app_need_search VIRTUAL TABLE'), 1, plan)
+        self.assertNotIn('CORRELATED', plan)
+        self.assertNoTableScan(queryset, 'app_need')
+
+
+class NeedCategoryTypeTests(TestCase):
+    """Need.category_type follows its category."""
+
+    def setUp(self):
+        self.disaster = Disaster.objects.create(
+            name='Flood', slug='flood', affected_areas='Sindh', start_date=datetime.date(2025, 8, 1),
+        )
+        self.category = Category.objects.create(name='Shelter', category_type='service')
+        self.need = Need.objects.create(
+            disaster=self.disaster, category=self.category, title='Tents', description='Tents',
+        )
+
+    def test_copied_on_save(self):
+        self.assertEqual(self.need.category_type, 'service')
+        self.need.category = Category.objects.create(name='Road', category_type='problem')
+        self.need.save(update_fields=['category'])
+        self.need.refresh_from_db()
+        self.assertEqual(self.need.category_type, 'problem')
+
+    def test_follows_category_type_change(self):
+        self.category.category_type = 'information'
+        self.category.save()
+        self.need.refresh_from_db()
+        self.assertEqual(self.need.category_type, 'information')
+
+    def test_cleared_with_category(self):
+        self.category.delete()
+        self.need.refresh_from_db()
+        self.assertEqual(self.need.category_type, '')
+        self.assertEqual(self.need.entry_type, 'problem')
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        disaster = Disaster.objects.create(
+            name='Flood', slug='flood', affected_areas='Sindh', start_date=datetime.date(2025, 8, 1),
+        )
+        Need.objects.create(disaster=disaster, title='Boats', description='x' * 300, latitude=27.7, longitude=68.8)
+        Need.objects.create(disaster=disaster, title='Unplaced', description='Somewhere')
+
+    def test_geojson_streams_every_need(self):
+        response = self.client.get('/api/export/needs/')
+        self.assertTrue(response.streaming)
+        features = json.loads(b''.join(response.streaming_content))['features']
+        self.assertEqual([f['properties']['title'] for f in features], ['Boats', 'Unplaced'])
+        self.assertEqual(len(features[0]['properties']['description']), 300)
+        self.assertIsNone(features[1]['geometry'])
+
+    def test_ndjson_and_csv(self):
+        lines = b''.join(self.client.get('/api/export/needs/?format=ndjson').streaming_content).splitlines()
+        self.assertEqual(len(lines), 2)
+        rows = b''.join(self.client.get('/api/export/needs/?format=csv').streaming_content).splitlines()
+        self.assertEqual(len(rows), 3)
+
+    def test_rejects_unknown_format(self):
+        self.assertEqual(self.client.get('/api/export/needs/?format=xml').status_code, 400)
+
+    async def test_streams_asynchronously_under_asgi(self):
+        with warnings.catch_warnings(record=True) as caught, mock.patch.object(export, 'CHUNK_SIZE', 1):
+            warnings.simplefilter('always')
+            for fmt, count in [('geojson', 2), ('ndjson', 2), ('csv', 3)]:
+                response = await self.async_client.get(f'/api/export/needs/?format={fmt}')
+                self.assertTrue(response.is_async)
+                body = b''.join([chunk async for chunk in response.streaming_content])
+                if fmt == 'geojson':
+                    self.assertEqual(len(json.loads(body)['features']), count)
+                else:
+                    self.assertEqual(len(body.splitlines()), count)
+        self.assertFalse([w for w in caught if 'StreamingHttpResponse' in str(w.message)])
+
+
+class SyncTests(TestCase):
+    def setUp(self):
+        self.disaster = Disaster.objects.create(
+            name='Flood', slug='flood', affected_areas='Sindh', start_date=datetime.date(2025, 8, 1),
+        )
+        self.need = Need.objects.create(disaster=self.disaster, title='Boats', description='Boats')
+
+    def sync(self, **params):
+        response = self.client.get('/api/sync/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_first_sync_returns_everything(self):
+        data = self.sync()
+        self.assertTrue(data['complete'])
+        self.assertEqual([f['properties']['id'] for f in data['needs']], [self.need.id])
+
+    def test_changes_and_tombstones_since_watermark(self):
+        since = self.sync()['next_since']
+        new = Need.objects.create(disaster=self.disaster, title='Tents', description='Tents')
+        deleted_id = self.need.id
+        self.need.delete()
+        data = self.sync(since=since)
+        self.assertEqual([f['properties']['id'] for f in data['needs']], [new.id])
+        self.assertEqual(data['deleted']['needs'], [deleted_id])
+
+    def test_truncated_sync_resumes(self):
+        for i in range(3):
+            Need.objects.create(disaster=self.disaster, title=f'Need {i}', description='x')
+        seen = set()
+        data = {'complete': False, 'next_since': None}
+        while not data['complete']:
+            params = {'limit': 2}
+            if data['next_since']:
+                params['since'] = data['next_since']
+            data = self.sync(**params)
+            seen.update(f['properties']['id'] for f in data['needs'])
+        self.assertEqual(seen, set(Need.objects.values_list('id', flat=True)))
+
+    def test_truncated_sync_moves_past_shared_timestamp(self):
+        for i in range(4):
+            Need.objects.create(disaster=self.disaster, title=f'Need {i}', description='x')
+        # A category change stamps all its needs with one updated_at
+        Need.objects.update(updated_at=timezone.now())
+        seen = []
+        params = {'limit': 2}
+        for _ in range(5):
+            data = self.sync(**params)
+            seen.extend(f['properties']['id'] for f in data['needs'])
+            if data['complete']:
+                break
+            params['since'] = data['next_since']
+        self.assertTrue(data['complete'])
+        self.assertEqual(sorted(seen), sorted(Need.objects.values_list('id', flat=True)))
+
+    def test_rejects_bad_watermark(self):
+        self.assertEqual(self.client.get('/api/sync/', {'since': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/sync/', {'since': 'e30'}).status_code, 400)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        django_cache.clear()
+        self.disaster = Disaster.objects.create(
+            name='Flood', slug='flood', affected_areas='Sindh', start_date=datetime.date(2025, 8, 1),
+        )
+        self.need = Need.objects.create(
+            disaster=self.disaster, title='Boats', description='Boats', latitude=27.7, longitude=68.8,
+        )
+
+    def test_unchanged_page_is_not_rebuilt(self):
+        etag = self.client.get('/')['ETag']
+        # Only the watermark is queried
+        with self.assertNumQueries(1):
+            response = self.client.get('/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.need.save()
+        self.assertEqual(self.client.get('/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_writes_from_other_processes_move_the_watermark(self):
+        etag = self.client.get('/')['ETag']
+        # update() sends no signals, so this process' cache is not told
+        Need.objects.filter(pk=self.need.pk).update(updated_at=timezone.now())
+        response = self.client.get('/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+    def test_category_edits_move_the_map_watermark(self):
+        category = Category.objects.create(name='Boats', category_type='problem')
+        etag = self.client.get('/api/map-data/')['ETag']
+        category.name = 'Rescue boats'
+        category.save()
+        self.assertEqual(self.client.get('/api/map-data/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_map_watermark_is_scoped_to_disaster(self):
+        url = f'/api/map-data/?disaster={self.disaster.id}'
+        other = Disaster.objects.create(name='Quake', slug='quake', affected_areas='KP', start_date=datetime.date(2025, 9, 1))
+        etag = self.client.get(url)['ETag']
+        Need.objects.create(disaster=other, title='Tents', description='Tents')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.need.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class LiveMapTests(TestCase):
+    def test_catch_up_respects_filters(self):
+        disaster = Disaster.objects.create(
+            name='Flood', slug='flood', affected_areas='Sindh', start_date=datetime.date(2025, 8, 1),
+        )
+        since = timezone.now().isoformat()
+        problem = Category.objects.create(name='Road', category_type='problem')
+        service = Category.objects.create(name='Camp', category_type='service')
+        Need.objects.create(disaster=disaster, category=problem, title='Bridge', description='x', latitude=27, longitude=68)
+        Need.objects.create(disaster=disaster, category=service, title='Camp', description='x', latitude=27, longitude=68)
+
+        messages = live.opening_messages(live.Subscription(entry_type='problem'), since)
+        self.assertTrue(messages[0].startswith('retry: '))
+        self.assertEqual(len(messages), 2)
+        self.assertIn('"title":"Bridge"', messages[1])
+
+    def test_poll_moves_past_rows_sharing_a_timestamp(self):
+        disaster = Disaster.objects.create(
+            name='Flood', slug='flood', affected_areas='Sindh', start_date=datetime.date(2025, 8, 1),
+        )
+        broker = live.Broker()
+        broker.positions = live.start_positions(timezone.now() - datetime.timedelta(minutes=1))
+        for i in range(5):
+            Need.objects.create(disaster=disaster, title=f'Need {i}', description='x', latitude=27, longitude=68)
+        # A category change stamps all its needs with one updated_at
+        changed_at = timezone.now()
+        Need.objects.update(updated_at=changed_at)
+
+        def poll():
+            return {object_id for _, _, event, (object_id, _, _) in broker.poll() if event == 'need'}
+
+        with mock.patch.object(live, 'POLL_LIMIT', 2):
+            seen = set()
+            for _ in range(3):
+                seen |= poll()
+            self.assertEqual(seen, set(Need.objects.values_list('id', flat=True)))
+            # A row committed late, behind the position, is still picked up
+            late = Need.objects.create(disaster=disaster, title='Late', description='x', latitude=27, longitude=68)
+            Need.objects.filter(pk=late.pk).update(updated_at=changed_at - datetime.timedelta(seconds=5))
+            self.assertIn(late.id, poll())
+
+    def test_slow_subscriber_is_told_to_reload(self):
+        subscription = live.Subscription()
+        for i in range(live.QUEUE_SIZE + 1):
+            subscription.put('need', {'id': i})
+        self.assertEqual(subscription.queue.qsize(), 1)
+        self.assertEqual(subscription.queue.get_nowait(), ('reload', {}))
+
+
+class ImportTests(TestCase):
+    def setUp(self):
+        self.disaster = Disaster.objects.create(
+            name='Flood', slug='flood', affected_areas='Sindh', start_date=datetime.date(2025, 8, 1),
+        )
+        Category.objects.create(name='Kitchens', category_type='service')
+
+    def test_kobo_export(self):
+        export = io.StringIO(
+            'start;group_a/Title;Category;group_b/gps;District;household_size;_uuid\n'
+            '2025-08-01;Cooked food;kitchens;27.5 68.2 0 5;Jacobabad;7;a1\n'
+            '2025-08-01;Tents;Shelter;27.5 68.2 0 5;Jacobabad;3;a2\n'
+            '2025-08-01;Boats;;not a point;Dadu;4;a3\n'
+        )
+        rejects = []
+        run = importer.Importer(default_disaster=self.disaster, batch_size=1)
+        run.run(importer.read_csv(export), reject=lambda line, values, reason: rejects.append((line, reason)))
+
+        self.assertEqual((run.imported, run.rejected), (1, 2))
+        self.assertEqual([line for line, _ in rejects], [3, 4])
+        need = Need.objects.get()
+        self.assertEqual((need.category_type, need.city, str(need.latitude)), ('service', 'Jacobabad', '27.500000'))
+        self.assertTrue(need.geohash)
+        self.assertEqual(list(Field.objects.values_list('key', 'value')), [('household_size', '7')])
+        self.assertEqual(list(search.search_needs(Need.objects.all(), 'cooked')), [need])
+
+    def test_dry_run_writes_nothing(self):
+        rows = [['Title', 'Disaster'], ['Boats', 'flood'], ['Tents', 'quake']]
+        run = importer.Importer(dry_run=True)
+        run.run(rows)
+        self.assertEqual((run.imported, run.rejected), (1, 1))
+        self.assertFalse(Need.objects.exists())
+
+
+class LoadDataTests(TestCase):
+    def test_generates_backdated_needs(self):
+        generator = loadgen.Generator(seed=1, users=5, batch_size=40)
+        generator.run(100)
+        self.assertEqual(Need.objects.count(), 100)
+        self.assertTrue(Comment.objects.exists())
+        self.assertEqual(ChangeLog.objects.filter(action='created', content_type__model='need').count(), 100)
+        # Timestamps are spread over the disasters, not all "now"
+        self.assertLess(Need.objects.order_by('created_at').first().created_at, generator.now - datetime.timedelta(days=7))
+        self.assertTrue(search.search_needs(Need.objects.all(), 'needed').exists())
+        # auto_now is restored afterwards
+        self.assertTrue(Need._meta.get_field('updated_at').auto_now)
+
+
+class BenchmarkTests(TestCase):
+    def test_every_route_has_a_scenario(self):
+        self.assertEqual(benchmark.uncovered_routes(), set())
+
+    def test_every_scenario_succeeds(self):
+        loadgen.Generator(seed=2, users=5).run(50)
+        fixture = benchmark.make_fixture()
+        for scenario in benchmark.SCENARIOS:
+            with self.subTest(scenario.name):
+                result = benchmark.measure(scenario, fixture, warmup=0, repeat=1)
+                self.assertEqual(result['status'], 200)
+
+    def test_compare_flags_slower_medians_and_extra_queries(self):
+        before = {'100': {'home': {'p50_ms': 10.0, 'queries': 5}, 'map': {'p50_ms': 1.0, 'queries': 2}}}
+        after = {'100': {'home': {'p50_ms': 20.0, 'queries': 6}, 'map': {'p50_ms': 2.0, 'queries': 2}}}
+        regressions = benchmark.compare(before, after)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(all(line.startswith('home @ 100') for line in regressions))
+
+
+class QueryBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        loadgen.Generator(seed=3, users=5).run(150)
+
+    def assertWithinBudget(self, client, url, params=None):
+        django_cache.clear()
+        recorder = budgets.QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = client.get(url, params or {})
+            # Count what streaming responses query as they are consumed too
+            b''.join(response) if response.streaming else response.content
+        self.assertEqual(response.status_code, 200)
+        view_name = response.resolver_match.view_name
+        signed_in = response.wsgi_request.user.is_authenticated
+        self.assertIn(view_name, budgets.BUDGETS)
+        self.assertIsNone(budgets.check(view_name, recorder, signed_in), budgets.report(
+            view_name, budgets.BUDGETS[view_name], recorder, signed_in,
+        ))
+
+    def test_public_views(self):
+        fixture = benchmark.make_fixture()
+        client = Client()
+        for scenario in benchmark.SCENARIOS:
+            with self.subTest(scenario.name):
+                self.assertWithinBudget(client, scenario.url(fixture), scenario.params(fixture))
+
+    def test_public_views_signed_in(self):
+        fixture = benchmark.make_fixture()
+        client = Client()
+        client.force_login(User.objects.create_user('budget-volunteer'))
+        for scenario in benchmark.SCENARIOS:
+            with self.subTest(scenario.name):
+                self.assertWithinBudget(client, scenario.url(fixture), scenario.params(fixture))
+
+    def test_admin_changelists(self):
+        client = Client()
+        client.force_login(User.objects.create_superuser('budget-admin'))
+        for model in (Category, ChangeLog, Comment, Disaster, Field, Need, Resource):
+            with self.subTest(model._meta.model_name):
+                self.assertWithinBudget(client, reverse(f'admin:app_{model._meta.model_name}_changelist'))
+
+    def test_report_groups_repeated_queries(self):
+        recorder = budgets.QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for need in Need.objects.all()[:3]:
+                need.disaster.name
+        report = budgets.check('app:nearby_api', recorder)
+        self.assertIn('3x', report)
+        self.assertIn('app/tests.py:', report)
+
+
+@override_settings(METRICS_SAMPLE_RATE=1.0)
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+        django_cache.clear()
+        disaster = Disaster.objects.create(
+            name='Flood', slug='flood', affected_areas='Sindh', start_date=datetime.date(2025, 8, 1),
+        )
+        self.need = Need.objects.create(
+            disaster=disaster, title='Clean water', description='Wells flooded', latitude=28.28, longitude=68.44,
+            reported_by=User.objects.create_user('reporter'),
+        )
+
+    def series(self, name):
+        """Value of the exposition line starting with ``name``."""
+        for line in metrics.exposition().splitlines():
+            if line.startswith(name):
+                return float(line.rsplit(' ', 1)[1])
+        return None
+
+    def test_records_requests_by_route(self):
+        self.client.get(reverse('app:needs_list'))
+        self.client.get(reverse('app:needs_list'))
+        self.client.get('/no-such-page/')
+        self.assertEqual(self.series('floodlight_requests_total{view="app:needs_list",method="GET",status="200"}'), 2)
+        self.assertEqual(self.series('floodlight_requests_total{view="unmatched",method="GET",status="404"}'), 1)
+        self.assertEqual(self.series('floodlight_request_duration_seconds_count{view="app:needs_list"}'), 2)
+        self.assertEqual(self.series('floodlight_page_cache_total{view="app:needs_list",result="hit"}'), 1)
+        self.assertEqual(self.series('floodlight_page_cache_total{view="app:needs_list",result="miss"}'), 1)
+        self.assertGreater(self.series('floodlight_response_bytes_total{view="app:needs_list"}'), 0)
+        self.assertGreater(self.series('floodlight_request_db_queries_sum{view="app:needs_list"}'), 0)
+
+    async def test_counts_queries_of_async_views(self):
+        await self.async_client.get(reverse('app:need_detail', args=[self.need.id]))
+        self.assertGreater(self.series('floodlight_request_db_queries_sum{view="app:need_detail"}'), 0)
+
+    @override_settings(METRICS_SAMPLE_RATE=0.0)
+    def test_unsampled_requests_skip_database_metrics(self):
+        with self.assertNoLogs('app.requests', 'INFO'):
+            self.client.get(reverse('app:needs_list'))
+        self.assertEqual(self.series('floodlight_request_duration_seconds_count{view="app:needs_list"}'), 1)
+        self.assertIsNone(self.series('floodlight_request_db_queries_count'))
+
+    def test_sampled_requests_are_logged_as_json(self):
+        with self.assertLogs('app.requests', 'INFO') as logs:
+            self.client.get(reverse('app:need_detail', args=[self.need.id]))
+        entry = json.loads(metrics.JSONFormatter().format(logs.records[0]))
+        self.assertEqual(entry['view'], 'app:need_detail')
+        self.assertEqual(entry['status'], 200)
+        self.assertGreater(entry['db_queries'], 0)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_endpoint_needs_the_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'# TYPE floodlight_requests_total counter', response.content)
+
+    def test_endpoint_is_hidden_without_a_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        self.profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.profile_dir)
+        self.addCleanup(profiling.clear_config)
+        profiling.clear_config()
+        django_cache.clear()
+
+    def profile_files(self):
+        return sorted(os.listdir(self.profile_dir))
+
+    def test_env_routes_capture_and_explain_slow_queries(self):
+        with self.settings(PROFILE_DIR=self.profile_dir, PROFILE_ROUTES=['app:needs_list'], PROFILE_SLOW_QUERY_MS=0):
+            self.client.get(reverse('app:needs_list'))
+            self.client.get(reverse('app:disasters_list'))
+        self.assertIn('app.needs_list.slow-sql.jsonl', self.profile_files())
+        self.assertNotIn('app.disasters_list.slow-sql.jsonl', self.profile_files())
+        with open(os.path.join(self.profile_dir, 'app.needs_list.slow-sql.jsonl')) as f:
+            entries = [json.loads(line) for line in f]
+        self.assertTrue(any(entry['plan'] for entry in entries))
+        self.assertTrue(all(entry['path'] == '/needs/' for entry in entries))
+
+    def test_admin_config_overrides_the_environment(self):
+        ProfilingConfig.objects.create(enabled=False)
+        with self.settings(PROFILE_DIR=self.profile_dir, PROFILE_ROUTES=['app:needs_list'], PROFILE_SLOW_QUERY_MS=0):
+            self.client.get(reverse('app:needs_list'))
+        self.assertEqual(self.profile_files(), [])
+
+        ProfilingConfig.objects.update(enabled=True, routes='app:disasters_list', slow_query_ms=0)
+        profiling.clear_config()
+        with self.settings(PROFILE_DIR=self.profile_dir):
+            self.client.get(reverse('app:disasters_list'))
+        self.assertIn('app.disasters_list.slow-sql.jsonl', self.profile_files())
+
+    def test_expired_config_is_off(self):
+        ProfilingConfig.objects.create(enabled=True, until=timezone.now() - datetime.timedelta(minutes=1))
+        self.assertIsNone(profiling.load_config())
+
+    def test_sampler_folds_stacks(self):
+        sampler = profiling.StackSampler(threading.get_ident(), interval=0.001)
+        sampler.start()
+        deadline = time.monotonic() + 0.05
+        while time.monotonic() < deadline:
+            pass
+        stacks = sampler.stop()
+        self.assertTrue(stacks)
+        self.assertTrue(all('test_sampler_folds_stacks (app/tests.py:' in stack for stack in stacks))
+
+
+@override_settings(TASKS_EAGER=False)
+class PhotoProcessingTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(self.settings(MEDIA_ROOT=media_root))
+        disaster = Disaster.objects.create(
+            name='Flood', slug='flood', affected_areas='Sindh', start_date=datetime.date(2025, 8, 1),
+        )
+        self.need = Need.objects.create(
+            disaster=disaster, title='Roof gone', description='Family of six', latitude=28.28, longitude=68.44,
+            reported_by=User.objects.create_user('reporter'),
+        )
+
+    def phone_photo(self):
+        """A 3000x2000 JPEG taken in portrait, with its GPS position in EXIF."""
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotate 90 degrees clockwise to display
+        exif[0x8825] = {2: (28.0, 16.0, 48.0)}
+        buffer = io.BytesIO()
+        Image.new('RGB', (3000, 2000), 'navy').save(buffer, 'JPEG', quality=95, exif=exif)
+        return SimpleUploadedFile('IMG_0001.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def test_upload_is_bounded_stripped_and_thumbnailed(self):
+        photo = Photo.objects.create(need=self.need, image=self.phone_photo())
+        self.assertIsNone(photo.width)
+        self.assertTrue(Task.objects.filter(name='app.tasks.process_photo', kwargs={'photo_id': photo.id}).exists())
+        tasks.Worker().run_pending()
+        photo.refresh_from_db()
+        storage = photo.image.storage
+        self.assertTrue(photo.image.name.startswith('needs/'))
+        self.assertTrue(photo.image.name.endswith('.' + images.output_format().lower().replace('jpeg', 'jpg')))
+        self.assertEqual((photo.width, photo.height), (1365, 2048))
+        self.assertEqual(sorted(photo.thumbnails, key=int), ['320', '640', '1280'])
+        with storage.open(photo.image.name) as f, Image.open(f) as stored:
+            self.assertEqual(stored.size, (1365, 2048))
+            self.assertEqual(dict(stored.getexif()), {})
+        with storage.open(photo.thumbnails['320']) as f, Image.open(f) as thumbnail:
+            self.assertEqual(thumbnail.size, (320, 480))
+        # The raw upload was deleted
+        self.assertEqual(len(storage.listdir(os.path.dirname(photo.image.name))[1]), 4)
+
+        self.assertEqual(photo.thumbnail_url(600), storage.url(photo.thumbnails['640']))
+        self.assertEqual(photo.thumbnail_url(4000), photo.image.url)
+        self.assertIn(f'{photo.image.url} 1365w', photo.srcset)
+
+    def test_need_page_and_nearby_offer_the_sizes(self):
+        photo = Photo.objects.create(need=self.need, image=self.phone_photo(), caption='The house')
+        tasks.Worker().run_pending()
+        photo.refresh_from_db()
+        response = self.client.get(reverse('app:need_detail', args=[self.need.id]))
+        self.assertContains(response, f'srcset="{photo.srcset}"')
+
+        response = self.client.get(reverse('app:nearby_api'), {'lat': 28.28, 'lng': 68.44})
+        photos = response.json()['features'][0]['properties']['photos']
+        self.assertEqual(photos[0]['caption'], 'The house')
+        self.assertEqual(list(photos[0]['sizes']), ['320', '640', '1280', '1365'])
+
+    def test_command_processes_photos_stored_before(self):
+        storage = Photo._meta.get_field('image').storage
+        name = storage.save('needs/2024/07/old.jpg', self.phone_photo())
+        photo = Photo.objects.create(need=self.need, image=name)
+        self.assertIsNone(photo.width)
+
+        call_command('process_photos', stdout=io.StringIO())
+        photo.refresh_from_db()
+        self.assertEqual(photo.width, 1365)
+        self.assertEqual(len(photo.thumbnails), 3)
+        self.assertFalse(storage.exists(name))
+
+    def test_images_too_large_to_decode_are_skipped(self):
+        storage = Photo._meta.get_field('image').storage
+        name = storage.save('needs/2024/07/bomb.jpg', self.phone_photo())
+        stored = Photo.objects.create(need=self.need, image=name)
+        # Pillow refuses images with over twice this many pixels
+        self.enterContext(mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 1000))
+
+        with self.assertLogs('app.tasks', 'WARNING'):
+            tasks.Worker().run_pending()
+        self.assertEqual(Task.objects.get(kwargs={'photo_id': stored.id}).status, Task.DONE)
+
+        err = io.StringIO()
+        call_command('process_photos', stdout=io.StringIO(), stderr=err)
+        self.assertIn(f'Photo {stored.id}', err.getvalue())
+        stored.refresh_from_db()
+        self.assertIsNone(stored.width)
+        self.assertTrue(storage.exists(name))
+
+# Tasks the queue tests run
+calls = []
+
+
+@tasks.task(unique=True)
+def record_call(label):
+    calls.append(label)
+
+
+@tasks.task(max_attempts=2)
+def fail():
+    raise ValueError('no such need')
+
+
+@override_settings(TASKS_EAGER=False)
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_runs_by_priority_then_age(self):
+        record_call.enqueue(label='normal')
+        record_call.enqueue(label='low', priority=tasks.LOW)
+        record_call.enqueue(label='high', priority=tasks.HIGH)
+        record_call.enqueue(label='later', delay=datetime.timedelta(minutes=5))
+        self.assertEqual(tasks.Worker().run_pending(), 3)
+        self.assertEqual(calls, ['high', 'normal', 'low'])
+        self.assertEqual(Task.objects.filter(status=Task.DONE).count(), 3)
+        self.assertEqual(Task.objects.get(status=Task.QUEUED).kwargs, {'label': 'later'})
+
+    def test_unique_tasks_are_queued_once(self):
+        self.assertIsNotNone(record_call.enqueue(label='a'))
+        self.assertIsNone(record_call.enqueue(label='a'))
+        self.assertIsNotNone(record_call.enqueue(label='b'))
+        self.assertEqual(Task.objects.count(), 2)
+
+    @override_settings(TASKS_EAGER=True)
+    def test_eager_tasks_run_at_once(self):
+        self.assertIsNone(record_call.enqueue(label='a'))
+        self.assertEqual(calls, ['a'])
+        self.assertFalse(Task.objects.exists())
+
+    def test_failures_are_retried_with_backoff_then_kept(self):
+        task = fail.enqueue()
+        worker = tasks.Worker()
+        with self.assertLogs('app.tasks', 'WARNING'):
+            worker.run_pending()
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (Task.QUEUED, 1))
+        self.assertGreater(task.run_after, timezone.now() + tasks.RETRY_DELAY / 2)
+        self.assertIn('ValueError: no such need', task.last_error)
+
+        Task.objects.filter(id=task.id).update(run_after=timezone.now())
+        with self.assertLogs('app.tasks', 'ERROR'):
+            worker.run_pending()
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts, worker.failed), (Task.FAILED, 2, 1))
+
+    def test_stale_running_tasks_are_requeued(self):
+        task = record_call.enqueue(label='a')
+        Task.objects.filter(id=task.id).update(status=Task.RUNNING, started_at=timezone.now() - tasks.STALE_AFTER * 2)
+        with self.assertLogs('app.tasks', 'WARNING'):
+            tasks.Worker().housekeeping()
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.QUEUED)
+
+    def test_saving_a_need_queues_its_indexing(self):
+        disaster = Disaster.objects.create(
+            name='Flood', slug='flood', affected_areas='Sindh', start_date=datetime.date(2025, 8, 1),
+        )
+        need = Need.objects.create(
+            disaster=disaster, title='Drinking water', description='Wells flooded', location='Dadu',
+            reported_by=User.objects.create_user('reporter'),
+        )
+        indexed = SearchKey.objects.filter(object_id=need.id, content_type=ContentType.objects.get_for_model(Need))
+        self.assertFalse(indexed.exists())
+        self.assertTrue(Task.objects.filter(name='app.tasks.index_need', kwargs={'need_id': need.id}).exists())
+
+        out = io.StringIO()
+        call_command('run_worker', '--once', stdout=out)
+        self.assertTrue(indexed.exists())
+        self.assertIn('Ran 2 tasks, 0 failed', out.getvalue())
+
+
+class GeocodingTests(TestCase):
+    def setUp(self):
+        self.disaster = Disaster.objects.create(
+            name='Flood', slug='flood', affected_areas='Sindh', start_date=datetime.date(2025, 8, 1),
+        )
+
+    def place(self, location, city=''):
+        place = geocoding.locate(location, city)
+        return place.name if place is not None else None
+
+    def test_resolves_spellings_scripts_and_context(self):
+        self.assertEqual(self.place('Jakobabad city'), 'Jacobabad')
+        self.assertEqual(self.place('جیکب آباد'), 'Jacobabad')
+        self.assertEqual(self.place('Hyderbad'), 'Hyderabad')
+        self.assertEqual(self.place('Muzaffarg'), 'Muzaffargarh')
+        self.assertEqual(self.place('D.G. Khan'), 'Dera Ghazi Khan')
+        # The longer name wins over the district inside it
+        self.assertEqual(self.place('Mirpur Khas'), 'Mirpur Khas')
+        # The most specific place, backed by its district
+        self.assertEqual(self.place('Goth Allah Bux, Tehsil Mehar', 'Dadu'), 'Mehar')
+        self.assertEqual(self.place('Near Johi bazaar', 'Dadu'), 'Johi')
+
+    def test_leaves_vague_or_ambiguous_text_alone(self):
+        self.assertIsNone(self.place('Sindh'))
+        self.assertIsNone(self.place('Sukkur, Larkana'))
+        self.assertIsNone(self.place('Hyderabad-Karachi Highway'))
+        self.assertIsNone(self.place('Relief camp near the water tank'))
+        self.assertIsNone(self.place('House 12, Street 4'))
+
+    def test_needs_without_coordinates_are_placed_on_save(self):
+        need = Need.objects.create(disaster=self.disaster, title='Camp', description='', location='Kotri Barrage')
+        need.refresh_from_db()
+        self.assertTrue(need.geocoded)
+        self.assertEqual((need.latitude, need.longitude), (Decimal('25.370000'), Decimal('68.310000')))
+        self.assertTrue(need.geohash)
+        self.assertTrue(need_feature(need)['properties']['geocoded'])
+
+        need.location = 'Somewhere on the canal'
+        need.save(update_fields=['location'])
+        need.refresh_from_db()
+        self.assertEqual((need.latitude, need.geohash, need.geocoded), (None, '', False))
+
+        reported = Need.objects.create(
+            disaster=self.disaster, title='Boat', description='', location='Kotri',
+            latitude=Decimal('25.4'), longitude=Decimal('68.3'),
+        )
+        self.assertFalse(reported.geocoded)
+        self.assertEqual(reported.latitude, Decimal('25.4'))
+
+    def test_coordinates_set_on_a_geocoded_need_are_kept(self):
+        need = Need.objects.create(disaster=self.disaster, title='Camp', description='', location='Kotri Barrage')
+        self.assertTrue(need.geocoded)
+
+        need.status = 'in_progress'
+        need.save()
+        self.assertTrue(need.geocoded)
+
+        need = Need.objects.get(pk=need.pk)
+        need.latitude, need.longitude = Decimal('25.412345'), Decimal('68.265432')
+        need.save()
+        need = Need.objects.get(pk=need.pk)
+        self.assertEqual((need.latitude, need.longitude), (Decimal('25.412345'), Decimal('68.265432')))
+        self.assertFalse(need.geocoded)
+        self.assertEqual(need.geohash, geo.encode_geohash(need.latitude, need.longitude))
+
+        # And stay when the need is saved again, even with a new location
+        need.location = 'Jamshoro'
+        need.save()
+        need.refresh_from_db()
+        self.assertEqual(need.latitude, Decimal('25.412345'))
+
+    def test_geocoded_need_is_placed_again_when_its_location_changes(self):
+        need = Need.objects.create(disaster=self.disaster, title='Camp', description='', city='Nawabshah')
+        need = Need.objects.get(pk=need.pk)
+        need.city = 'Dadu'
+        need.save()
+        need.refresh_from_db()
+        self.assertTrue(need.geocoded)
+        self.assertNotEqual(need.latitude, Decimal('26.240000'))
+
+    def test_more_gazetteer_files(self):
+        path = os.path.join(tempfile.mkdtemp(), 'villages.csv')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('name,kind,district,province,latitude,longitude,alt_names\n'
+                    'Goth Ghulam Nabi Lashari,village,Dadu,Sindh,26.61,67.55,\n')
+        self.assertEqual(self.place('Ghulam Nabi Lashari', 'Dadu'), 'Dadu')
+        with self.settings(GAZETTEER_FILES=[path]):
+            self.assertEqual(self.place('Ghulam Nabi Lashari', 'Dadu'), 'Goth Ghulam Nabi Lashari')
+
+    def test_command_geocodes_stored_needs(self):
+        need = Need.objects.create(disaster=self.disaster, title='Camp', description='', city='Nawabshah')
+        unknown = Need.objects.create(disaster=self.disaster, title='Tent', description='', location='Camp 4')
+        Need.objects.filter(pk=need.pk).update(latitude=None, longitude=None, geohash='', geocoded=False)
+        before = Need.objects.get(pk=need.pk).updated_at
+
+        out = io.StringIO()
+        call_command('geocode_needs', stdout=out)
+        need.refresh_from_db()
+        self.assertEqual(need.latitude, Decimal('26.240000'))
+        self.assertTrue(need.geocoded)
+        self.assertGreater(need.updated_at, before)
+        self.assertFalse(Need.objects.get(pk=unknown.pk).geocoded)
+        self.assertIn('Camp 4', out.getvalue())
+        self.assertIn('Geocoded 1 of 2 needs checked, 1 not placed', out.getvalue())
+
+    def test_command_refreshes_counts(self):
+        need = Need.objects.create(disaster=self.disaster, title='Camp', description='', city='Nawabshah')
+        Need.objects.filter(pk=need.pk).update(latitude=None, longitude=None, geohash='', geocoded=False)
+        self.assertEqual(counters.need_counts().count(geolocated=True), 0)
+        geocoding.geocode_needs()
+        self.assertEqual(counters.need_counts().count(geolocated=True), 1)
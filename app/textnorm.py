@@ -0,0 +1,172 @@
+"""Normalization of English, Urdu and Roman Urdu text for fuzzy matching.
+
+Reports spell the same place many ways: "Jacobabad", "Jakobabad city",
+"جیکب آباد". Urdu script omits short vowels and Roman Urdu spells vowels
+inconsistently, so both are reduced to a consonant *skeleton*:
+
+1. Urdu letters are transliterated to Roman (aspiration marks dropped),
+   digraphs (ch, sh, kh, ...) folded to single letters and look-alike
+   consonants (c/k/q, v/w, ...) merged.
+2. Vowels and weak letters (h, w, y) are dropped and doubled consonants
+   collapsed: "jacobabad" -> "jkbd", "جیکب آباد" -> "jkbd".
+3. Filler words ("city", "district", "ضلع", ...) are dropped and split suffixes
+   ("... آباد", "... pur") are joined back onto the word before them.
+
+The resulting keys are indexed by trigram (see ``app.search``) and ranked by
+edit distance.
+"""
+import re
+import unicodedata
+
+URDU_TO_ROMAN = {
+    'ا': 'a', 'آ': 'a', 'أ': 'a', 'إ': 'i', 'ع': '',
+    'ب': 'b', 'پ': 'p', 'ت': 't', 'ٹ': 't', 'ث': 's', 'ج': 'j', 'چ': 'ch',
+    'ح': 'h', 'خ': 'kh', 'د': 'd', 'ڈ': 'd', 'ذ': 'z', 'ر': 'r', 'ڑ': 'r',
+    'ز': 'z', 'ژ': 'zh', 'س': 's', 'ش': 'sh', 'ص': 's', 'ض': 'z', 'ط': 't',
+    'ظ': 'z', 'غ': 'gh', 'ف': 'f', 'ق': 'q', 'ک': 'k', 'ك': 'k', 'گ': 'g',
+    'ل': 'l', 'م': 'm', 'ن': 'n', 'ں': 'n', 'و': 'o', 'ؤ': 'o', 'ہ': 'h',
+    'ھ': '', 'ۃ': 'h', 'ة': 'h', 'ه': 'h', 'ء': '', 'ی': 'i', 'ي': 'i',
+    'ى': 'i', 'ئ': 'i', 'ے': 'e', 'ۓ': 'e',
+}
+
+# Applied in order; placeholders are upper case so later rules cannot re-match them
+ROMAN_FOLDS = [
+    ('kh', 'X'), ('sh', 'S'), ('ch', 'C'), ('zh', 'z'), ('gh', 'g'), ('ph', 'f'),
+    ('ck', 'k'), ('q', 'k'), ('v', 'w'),
+]
+# An unfolded "c" is soft before e/i/y (city) and hard elsewhere (Jacobabad)
+SOFT_C = re.compile(r'c(?=[eiy])')
+
+SKELETON_DROP = set('aeiouhwy')
+
+# Geographic filler words, in English, Roman Urdu and Urdu
+STOP_WORDS = [
+    'city', 'district', 'distt', 'dist', 'tehsil', 'tehseel', 'village', 'town',
+    'near', 'the', 'of', 'in', 'area', 'areas', 'shehar', 'shahar', 'zila', 'zilla',
+    'gaon', 'goth', 'mohalla', 'muhalla', 'and',
+    'شہر', 'ضلع', 'تحصیل', 'گاؤں', 'گوٹھ', 'محلہ', 'اور',
+]
+# Place-name suffixes frequently written as a separate word, e.g. "جیکب آباد"
+SPLIT_SUFFIXES = ['abad', 'pur', 'kot', 'garh', 'nagar', 'آباد', 'پور', 'کوٹ', 'گڑھ', 'نگر']
+
+_WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def _strip_marks(text):
+    """Drop combining marks (Urdu harakat, Latin accents) and tatweel."""
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(
+        ch for ch in decomposed
+        if not unicodedata.combining(ch) and ch != 'ـ'
+    )
+
+
+def transliterate(word):
+    """Romanize a single Urdu/Roman Urdu word to lower-case ASCII-ish text."""
+    chars = []
+    for ch in word:
+        if ch in URDU_TO_ROMAN:
+            chars.append(URDU_TO_ROMAN[ch])
+        elif ch.isdigit():
+            chars.append(str(unicodedata.digit(ch, 0)))
+        else:
+            chars.append(ch)
+    return ''.join(chars)
+
+
+def fold(word):
+    """Merge spellings that sound alike; returns the folded word."""
+    word = transliterate(word.casefold())
+    word = SOFT_C.sub('s', word)
+    for old, new in ROMAN_FOLDS:
+        word = word.replace(old, new)
+    return word.replace('c', 'k')
+
+
+def skeleton(word):
+    """Consonant skeleton of a word; digits are kept as they are."""
+    chars = []
+    for ch in fold(word):
+        if ch in SKELETON_DROP or (chars and chars[-1] == ch):
+            continue
+        chars.append(ch)
+    return ''.join(chars)
+
+
+def words(text):
+    return _WORD_RE.findall(_strip_marks(text or ''))
+
+
+# Short skeletons collide with real names ("the" and "Thatta" are both "t"), so
+# short filler words are only recognized by their folded spelling.
+_STOP_FOLDED = {fold(word) for word in STOP_WORDS}
+_STOP_SKELETONS = {key for key in map(skeleton, STOP_WORDS) if len(key) >= 3}
+_SUFFIX_SKELETONS = {skeleton(word) for word in SPLIT_SUFFIXES}
+
+
+def key_words(text):
+    """(skeleton, folded spelling) of each word of ``search_key(text)``."""
+    pairs = []
+    for word in words(text):
+        key = skeleton(word)
+        folded = fold(word)
+        if not key or key in _STOP_SKELETONS or folded in _STOP_FOLDED:
+            continue
+        if pairs and key in _SUFFIX_SKELETONS:
+            # Join without doubling the consonant at the seam
+            previous_key, previous_folded = pairs[-1]
+            key = key[1:] if previous_key.endswith(key[0]) else key
+            pairs[-1] = (previous_key + key, previous_folded + folded)
+        else:
+            pairs.append((key, folded))
+    return pairs
+
+
+def search_key(text):
+    """Normalized skeleton text used as the fuzzy search key."""
+    return ' '.join(key for key, _ in key_words(text))
+
+
+def trigrams(key):
+    """Distinct trigrams of every word in a search key, padded like pg_trgm."""
+    grams = set()
+    for word in key.split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def edit_distance(a, b):
+    """Levenshtein distance between two strings."""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ca != cb),
+            ))
+        previous = current
+    return previous[-1]
+
+
+def similarity(query_key, document_key):
+    """How well a document key covers the query key, from 0.0 to 1.0.
+
+    Each query word is scored against its closest document word by edit
+    distance and the scores are averaged.
+    """
+    query_words = query_key.split()
+    document_words = document_key.split()
+    if not query_words or not document_words:
+        return 0.0
+    total = 0.0
+    for query_word in query_words:
+        total += max(
+            1 - edit_distance(query_word, word) / max(len(query_word), len(word))
+            for word in document_words
+        )
+    return total / len(query_words)
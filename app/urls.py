@@ -11,6 +11,11 @@ urlpatterns = [
     path('services/', views.services_list, name='services_list'),
     path('map/', views.map_view, name='map_view'),
     path('api/map-data/', views.map_data_api, name='map_data_api'),
+    path('api/nearby/', views.nearby_api, name='nearby_api'),
+    path('api/export/needs/', views.export_needs, name='export_needs'),
+    path('api/sync/', views.sync_api, name='sync_api'),
+    path('api/live/', views.live_map_events, name='live_map_events'),
+    path('api/tiles/<int:z>/<int:x>/<int:y>/', views.map_tile_api, name='map_tile_api'),
     path('resources/', views.resources_list, name='resources_list'),
     path('resources/<int:resource_id>/', views.resource_detail, name='resource_detail'),
     path('disasters/', views.disasters_list, name='disasters_list'),
@@ -1,48 +1,96 @@
-from django.shortcuts import render, get_object_or_404
-from django.db.models import Q
-from django.core.paginator import Paginator
-from django.http import JsonResponse
-from .models import Need, Resource, Category, Disaster, Field
-import json
+import asyncio
+import math
 
+from asgiref.sync import sync_to_async
+from django.shortcuts import render
+from django.db.models import Prefetch, Q
+from django.core.handlers.asgi import ASGIRequest
+from django.conf import settings
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.crypto import constant_time_compare
+from django.utils import timezone
+from .models import Need, Resource, Category, Disaster, Field, Photo
+from .pagination import KeysetPaginator
+from .cache import cache_public_page, conditional_page, data_watermark, newest, untracked_sources, watermark_etag
+from .clusters import cluster_needs
+from .serializers import feature_collection, need_feature, photo_dict
+from . import counters, export, geo, live, metrics, search, sync
 
-def home(request):
+# Keyset orderings for the paginated lists; each ends in the unique id
+RECENT_ORDERING = ('-created_at', '-id')
+SEARCH_ORDERING = ('search_rank', '-created_at', '-id')
+
+
+# Helpers for the async views. Independent queries are awaited together with
+# asyncio.gather(); template rendering runs in a worker thread because context
+# processors and templates may still touch the database.
+
+async def _alist(queryset):
+    return [obj async for obj in queryset]
+
+
+async def _aget_or_404(queryset, **kwargs):
+    try:
+        return await queryset.aget(**kwargs)
+    except queryset.model.DoesNotExist:
+        raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+
+
+async def _arender(request, template_name, context):
+    return await sync_to_async(render)(request, template_name, context)
+
+
+@conditional_page(data_watermark)
+@cache_public_page
+async def home(request):
     """Homepage with overview of recent problems and services"""
     # Recent problems (things that need fixing)
     recent_problems = Need.objects.filter(
         status='open', 
-        category__category_type='problem'
+        category_type='problem'
     ).select_related('category', 'disaster').order_by('-created_at')[:4]
     
     # Recent services (solutions being offered)  
     recent_services = Need.objects.filter(
         status='open',
-        category__category_type='service'
+        category_type='service'
     ).select_related('category', 'disaster').order_by('-created_at')[:4]
     
-    recent_resources = Resource.objects.filter(status='offered').select_related('need__category').order_by('-created_at')[:6]
+    recent_resources = Resource.objects.filter(status='offered').select_related(
+        'need__category', 'provider_user', 'provider_organization',
+    ).order_by('-created_at')[:6]
     active_disasters = Disaster.objects.filter(end_date__isnull=True).order_by('-start_date')[:3]
     
+    recent_problems, recent_services, recent_resources, active_disasters, counts, resource_counts = await asyncio.gather(
+        _alist(recent_problems),
+        _alist(recent_services),
+        _alist(recent_resources),
+        _alist(active_disasters),
+        sync_to_async(counters.need_counts)(),
+        sync_to_async(counters.resource_counts)(),
+    )
     context = {
         'recent_problems': recent_problems,
         'recent_services': recent_services, 
         'recent_resources': recent_resources,
         'active_disasters': active_disasters,
-        'total_problems': Need.objects.filter(status='open', category__category_type='problem').count(),
-        'total_services': Need.objects.filter(status='open', category__category_type='service').count(),
-        'total_resources': Resource.objects.filter(status='offered').count(),
+        'total_problems': counts.count(status='open', category_type='problem'),
+        'total_services': counts.count(status='open', category_type='service'),
+        'total_resources': resource_counts.get('offered', 0),
     }
-    return render(request, 'app/home.html', context)
+    return await _arender(request, 'app/home.html', context)
 
 
-def needs_list(request):
+@conditional_page(data_watermark)
+@cache_public_page
+async def needs_list(request):
     """List all needs with filtering by type (problems/services) and other criteria"""
     needs = Need.objects.filter(status='open').select_related('category', 'disaster', 'reported_by')
     
     # Filter by entry type (problems, services, information)
     entry_type = request.GET.get('type', 'all')
     if entry_type in ['problem', 'service', 'information']:
-        needs = needs.filter(category__category_type=entry_type)
+        needs = needs.filter(category_type=entry_type)
     
     # Filter by category
     category_id = request.GET.get('category')
@@ -54,19 +102,13 @@ def needs_list(request):
     if disaster_id:
         needs = needs.filter(disaster_id=disaster_id)
     
-    # Search functionality
+    # Search functionality, ranked by relevance
     search_query = request.GET.get('search')
     if search_query:
-        needs = needs.filter(
-            Q(title__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(location__icontains=search_query)
-        )
-    
-    # Pagination
-    paginator = Paginator(needs.order_by('-created_at'), 12)
-    page_number = request.GET.get('page')
-    needs_page = paginator.get_page(page_number)
+        needs = await sync_to_async(search.search_needs)(needs, search_query)
+        ordering = SEARCH_ORDERING
+    else:
+        ordering = RECENT_ORDERING
     
     # Get categories filtered by type for the dropdown
     if entry_type in ['problem', 'service', 'information']:
@@ -74,34 +116,56 @@ def needs_list(request):
     else:
         categories = Category.objects.all()
     
+    # Pagination
+    paginator = KeysetPaginator(needs, 12, ordering)
+    needs_page, categories, disasters, counts = await asyncio.gather(
+        paginator.aget_page(request.GET.get('cursor')),
+        _alist(categories),
+        _alist(Disaster.objects.filter(end_date__isnull=True)),
+        sync_to_async(counters.need_counts)(),
+    )
+    
+    if search_query or category_id:
+        result_count = None
+    else:
+        result_count = counts.count(
+            status='open',
+            category_type=entry_type if entry_type in ['problem', 'service', 'information'] else None,
+            disaster_id=int(disaster_id) if disaster_id and disaster_id.isdigit() else None,
+        )
     context = {
         'needs': needs_page,
+        'result_count': result_count,
         'categories': categories,
-        'disasters': Disaster.objects.filter(end_date__isnull=True),
+        'disasters': disasters,
         'current_category': category_id,
         'current_disaster': disaster_id,
         'current_type': entry_type,
         'search_query': search_query,
-        'problem_count': Need.objects.filter(status='open', category__category_type='problem').count(),
-        'service_count': Need.objects.filter(status='open', category__category_type='service').count(),
-        'info_count': Need.objects.filter(status='open', category__category_type='information').count(),
+        'problem_count': counts.count(status='open', category_type='problem'),
+        'service_count': counts.count(status='open', category_type='service'),
+        'info_count': counts.count(status='open', category_type='information'),
     }
-    return render(request, 'app/needs_list.html', context)
+    return await _arender(request, 'app/needs_list.html', context)
 
 
-def need_detail(request, need_id):
+async def need_detail(request, need_id):
     """Detailed view of a specific need"""
-    need = get_object_or_404(Need.objects.select_related('category', 'disaster', 'reported_by', 'verified_by'), id=need_id)
-    info_fields = Field.objects.filter(need=need)
+    need, info_fields, photos = await asyncio.gather(
+        _aget_or_404(Need.objects.select_related('category', 'disaster', 'reported_by', 'verified_by'), id=need_id),
+        _alist(Field.objects.filter(need_id=need_id)),
+        _alist(Photo.objects.filter(need_id=need_id).order_by('uploaded_at', 'id')),
+    )
     
     context = {
         'need': need,
         'info_fields': info_fields,
+        'photos': photos,
     }
-    return render(request, 'app/need_detail.html', context)
+    return await _arender(request, 'app/need_detail.html', context)
 
 
-def resources_list(request):
+async def resources_list(request):
     """List all available resources with filtering"""
     resources = Resource.objects.filter(status='offered').select_related('need__category', 'provider_user', 'provider_organization')
     
@@ -118,33 +182,37 @@ def resources_list(request):
         else:
             resources = resources.filter(provider_organization__isnull=False)
     
-    # Search functionality
+    # Search functionality, ranked by relevance
     search_query = request.GET.get('search')
     if search_query:
-        resources = resources.filter(
-            Q(description__icontains=search_query) |
-            Q(need__title__icontains=search_query) |
-            Q(need__location__icontains=search_query)
-        )
+        resources = await sync_to_async(search.search_resources)(resources, search_query)
+        ordering = SEARCH_ORDERING
+    else:
+        ordering = RECENT_ORDERING
     
     # Pagination
-    paginator = Paginator(resources.order_by('-created_at'), 12)
-    page_number = request.GET.get('page')
-    resources_page = paginator.get_page(page_number)
+    paginator = KeysetPaginator(resources, 12, ordering)
+    resources_page, categories, resource_counts = await asyncio.gather(
+        paginator.aget_page(request.GET.get('cursor')),
+        _alist(Category.objects.all()),
+        sync_to_async(counters.resource_counts)(),
+    )
     
+    filtered = search_query or category_id or resource_type in ['individual', 'organization']
     context = {
         'resources': resources_page,
-        'categories': Category.objects.all(),
+        'result_count': None if filtered else resource_counts.get('offered', 0),
+        'categories': categories,
         'current_category': category_id,
         'resource_type': resource_type,
         'search_query': search_query,
     }
-    return render(request, 'app/resources_list.html', context)
+    return await _arender(request, 'app/resources_list.html', context)
 
 
-def resource_detail(request, resource_id):
+async def resource_detail(request, resource_id):
     """Detailed view of a specific resource"""
-    resource = get_object_or_404(
+    resource = await _aget_or_404(
         Resource.objects.select_related('need__category', 'provider_user', 'provider_organization'),
         id=resource_id
     )
@@ -152,50 +220,66 @@ def resource_detail(request, resource_id):
     context = {
         'resource': resource,
     }
-    return render(request, 'app/resource_detail.html', context)
+    return await _arender(request, 'app/resource_detail.html', context)
 
 
-def disasters_list(request):
-    """List all disasters"""
+@conditional_page(data_watermark)
+@cache_public_page
+async def disasters_list(request):
+    """List all disasters, optionally searched by name or affected area"""
     disasters = Disaster.objects.all().order_by('-start_date')
     
+    # Affected areas are matched fuzzily, across Urdu and Roman Urdu spellings
+    search_query = request.GET.get('search')
+    if search_query:
+        fuzzy = await sync_to_async(search.fuzzy_matches)(Disaster, search_query)
+        disasters = disasters.filter(Q(name__icontains=search_query) | Q(pk__in=list(fuzzy)))
+    
     context = {
-        'disasters': disasters,
+        'disasters': await _alist(disasters),
+        'search_query': search_query,
     }
-    return render(request, 'app/disasters_list.html', context)
+    return await _arender(request, 'app/disasters_list.html', context)
 
 
-def disaster_detail(request, disaster_slug):
+@conditional_page(data_watermark)
+@cache_public_page
+async def disaster_detail(request, disaster_slug):
     """Detailed view of a specific disaster with related needs and resources"""
-    disaster = get_object_or_404(Disaster, slug=disaster_slug)
+    disaster = await _aget_or_404(Disaster.objects.all(), slug=disaster_slug)
     
     # Separate problems and services
     problems = Need.objects.filter(
         disaster=disaster, 
-        category__category_type='problem'
+        category_type='problem'
     ).select_related('category')[:10]
     
     services = Need.objects.filter(
         disaster=disaster,
-        category__category_type='service' 
+        category_type='service' 
     ).select_related('category')[:10]
     
+    problems, services, counts = await asyncio.gather(
+        _alist(problems),
+        _alist(services),
+        sync_to_async(counters.need_counts)(),
+    )
     context = {
         'disaster': disaster,
         'problems': problems,
         'services': services,
-        'problems_count': Need.objects.filter(disaster=disaster, category__category_type='problem').count(),
-        'services_count': Need.objects.filter(disaster=disaster, category__category_type='service').count(),
-        'total_needs': Need.objects.filter(disaster=disaster).count(),
+        'problems_count': counts.count(disaster_id=disaster.id, category_type='problem'),
+        'services_count': counts.count(disaster_id=disaster.id, category_type='service'),
+        'total_needs': counts.count(disaster_id=disaster.id),
     }
-    return render(request, 'app/disaster_detail.html', context)
+    return await _arender(request, 'app/disaster_detail.html', context)
 
 
-def problems_list(request):
+async def problems_list(request):
     """List all problems/issues that need resolution"""
     problems = Need.objects.filter(
         status='open',
-        category__category_type='problem'
+        category_type='problem'
     ).select_related('category', 'disaster', 'reported_by')
     
     # Filter by category
@@ -213,38 +297,43 @@ def problems_list(request):
     if priority:
         problems = problems.filter(priority=priority)
     
-    # Search functionality
+    # Search functionality, ranked by relevance
     search_query = request.GET.get('search')
     if search_query:
-        problems = problems.filter(
-            Q(title__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(location__icontains=search_query)
-        )
+        problems = await sync_to_async(search.search_needs)(problems, search_query)
+        ordering = SEARCH_ORDERING
+    else:
+        ordering = ('-priority', *RECENT_ORDERING)
     
     # Pagination
-    paginator = Paginator(problems.order_by('-priority', '-created_at'), 12)
-    page_number = request.GET.get('page')
-    problems_page = paginator.get_page(page_number)
+    paginator = KeysetPaginator(problems, 12, ordering)
+    problems_page, categories, disasters, counts = await asyncio.gather(
+        paginator.aget_page(request.GET.get('cursor')),
+        _alist(Category.objects.filter(category_type='problem')),
+        _alist(Disaster.objects.filter(end_date__isnull=True)),
+        sync_to_async(counters.need_counts)(),
+    )
     
+    filtered = search_query or category_id or disaster_id or priority
     context = {
         'problems': problems_page,
-        'categories': Category.objects.filter(category_type='problem'),
-        'disasters': Disaster.objects.filter(end_date__isnull=True),
+        'result_count': None if filtered else counts.count(status='open', category_type='problem'),
+        'categories': categories,
+        'disasters': disasters,
         'current_category': category_id,
         'current_disaster': disaster_id,
         'current_priority': priority,
         'search_query': search_query,
         'priority_choices': Need._meta.get_field('priority').choices,
     }
-    return render(request, 'app/problems_list.html', context)
+    return await _arender(request, 'app/problems_list.html', context)
 
 
-def services_list(request):
+async def services_list(request):
     """List all services/solutions being provided"""
     services = Need.objects.filter(
         status='open',
-        category__category_type='service'
+        category_type='service'
     ).select_related('category', 'disaster', 'reported_by')
     
     # Filter by category
@@ -257,118 +346,298 @@ def services_list(request):
     if disaster_id:
         services = services.filter(disaster_id=disaster_id)
     
-    # Search functionality
+    # Search functionality, ranked by relevance
     search_query = request.GET.get('search')
     if search_query:
-        services = services.filter(
-            Q(title__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(location__icontains=search_query)
-        )
+        services = await sync_to_async(search.search_needs)(services, search_query)
+        ordering = SEARCH_ORDERING
+    else:
+        ordering = RECENT_ORDERING
     
     # Pagination  
-    paginator = Paginator(services.order_by('-created_at'), 12)
-    page_number = request.GET.get('page')
-    services_page = paginator.get_page(page_number)
+    paginator = KeysetPaginator(services, 12, ordering)
+    services_page, categories, disasters, counts = await asyncio.gather(
+        paginator.aget_page(request.GET.get('cursor')),
+        _alist(Category.objects.filter(category_type='service')),
+        _alist(Disaster.objects.filter(end_date__isnull=True)),
+        sync_to_async(counters.need_counts)(),
+    )
     
+    filtered = search_query or category_id or disaster_id
     context = {
         'services': services_page,
-        'categories': Category.objects.filter(category_type='service'),
-        'disasters': Disaster.objects.filter(end_date__isnull=True),
+        'result_count': None if filtered else counts.count(status='open', category_type='service'),
+        'categories': categories,
+        'disasters': disasters,
         'current_category': category_id,
         'current_disaster': disaster_id,
         'search_query': search_query,
     }
-    return render(request, 'app/services_list.html', context)
+    return await _arender(request, 'app/services_list.html', context)
 
 
-def map_view(request):
+async def map_view(request):
     """Interactive map showing all problems and services"""
-    # Get all needs with coordinates
-    needs = Need.objects.filter(
-        latitude__isnull=False, 
-        longitude__isnull=False
-    ).select_related('category', 'disaster')
-    
-    # Filter by type if specified
+    # The needs themselves are fetched by the page from map_data_api
     entry_type = request.GET.get('type', 'all')
-    if entry_type in ['problem', 'service', 'information']:
-        needs = needs.filter(category__category_type=entry_type)
-    
-    # Filter by disaster if specified
     disaster_id = request.GET.get('disaster')
-    if disaster_id:
-        needs = needs.filter(disaster_id=disaster_id)
     
+    disasters, counts = await asyncio.gather(
+        _alist(Disaster.objects.filter(end_date__isnull=True)),
+        sync_to_async(counters.need_counts)(),
+    )
     context = {
-        'needs': needs,
-        'disasters': Disaster.objects.filter(end_date__isnull=True),
+        'disasters': disasters,
         'current_type': entry_type,
         'current_disaster': disaster_id,
-        'problem_count': Need.objects.filter(
-            category__category_type='problem',
-            latitude__isnull=False, 
-            longitude__isnull=False
-        ).count(),
-        'service_count': Need.objects.filter(
-            category__category_type='service',
-            latitude__isnull=False, 
-            longitude__isnull=False
-        ).count(),
+        'problem_count': counts.count(category_type='problem', geolocated=True),
+        'service_count': counts.count(category_type='service', geolocated=True),
     }
-    return render(request, 'app/map_view.html', context)
+    return await _arender(request, 'app/map_view.html', context)
 
 
-def map_data_api(request):
-    """API endpoint to get map data as JSON"""
-    # Get all needs with coordinates
-    needs = Need.objects.filter(
-        latitude__isnull=False, 
-        longitude__isnull=False
-    ).select_related('category', 'disaster')
+MAP_PAGE_SIZE = 500
+MAP_MAX_PAGE_SIZE = 2000
+
+
+def _map_needs(request):
+    """Geolocated needs narrowed by the map's type and disaster filters"""
+    needs = Need.objects.geolocated().select_related('category', 'disaster')
     
     # Filter by type if specified
     entry_type = request.GET.get('type', 'all')
     if entry_type in ['problem', 'service', 'information']:
-        needs = needs.filter(category__category_type=entry_type)
+        needs = needs.filter(category_type=entry_type)
     
     # Filter by disaster if specified
     disaster_id = request.GET.get('disaster')
     if disaster_id:
         needs = needs.filter(disaster_id=disaster_id)
     
-    # Convert to GeoJSON format
+    return needs
+
+
+def _map_watermark(request, *args, **kwargs):
+    """Newest need write in the requested disaster, plus untracked changes.
+
+    Writes to other disasters leave the watermark alone, so their clients
+    keep getting 304s. One query of index lookups, on (disaster, updated_at)
+    for the needs.
+    """
+    needs = Need.objects.all()
+    disaster_id = request.GET.get('disaster')
+    if disaster_id and disaster_id.isdigit():
+        needs = needs.filter(disaster_id=disaster_id)
+    times = newest((needs, 'updated_at'), *untracked_sources())
+    return watermark_etag('map', times), max(filter(None, times), default=None)
+
+
+async def _map_features(needs, zoom):
+    """Clusters below CLUSTER_MAX_ZOOM, individual needs past it"""
+    if zoom is not None and zoom < geo.CLUSTER_MAX_ZOOM:
+        return await sync_to_async(cluster_needs)(needs, zoom)
+    return [need_feature(need) async for need in needs]
+
+
+@conditional_page(_map_watermark)
+@cache_public_page
+async def map_data_api(request):
+    """API endpoint to get map data as GeoJSON, optionally limited to a viewport.
+
+    Pass ``bbox=west,south,east,north`` (Leaflet's ``toBBoxString()``) to only
+    receive the needs visible on screen, and ``zoom`` to receive clusters
+    instead of individual needs when zoomed out.
+    
+    Passing ``limit`` and/or ``cursor`` pages through individual needs, newest
+    first; each page carries the ``next_cursor`` to request the following one.
+    """
+    needs = _map_needs(request)
+    
+    try:
+        zoom = geo.parse_zoom(request.GET.get('zoom'))
+        bbox = request.GET.get('bbox')
+        if bbox:
+            needs = needs.in_bbox(geo.parse_bbox(bbox))
+        
+        cursor = request.GET.get('cursor')
+        limit = request.GET.get('limit')
+        if cursor is not None or limit is not None:
+            limit = min(max(int(limit or MAP_PAGE_SIZE), 1), MAP_MAX_PAGE_SIZE)
+            page = await KeysetPaginator(needs, limit, RECENT_ORDERING).apage(cursor)
+            collection = feature_collection(need_feature(need) for need in page)
+            collection['next_cursor'] = page.next_cursor
+            return JsonResponse(collection)
+    except ValueError as e:
+        return JsonResponse({'error': str(e) or 'invalid cursor'}, status=400)
+    
+    return JsonResponse(feature_collection(await _map_features(needs, zoom)))
+
+
+@conditional_page(_map_watermark)
+@cache_public_page
+async def map_tile_api(request, z, x, y):
+    """GeoJSON for the needs inside slippy-map tile z/x/y, clustered when zoomed out"""
+    try:
+        bbox = geo.tile_bbox(z, x, y)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    needs = _map_needs(request).in_bbox(bbox)
+    return JsonResponse(feature_collection(await _map_features(needs, z)))
+
+
+NEARBY_DEFAULT_RADIUS_KM = 10
+NEARBY_MAX_RADIUS_KM = 200
+NEARBY_DEFAULT_LIMIT = 20
+NEARBY_MAX_LIMIT = 100
+
+
+def nearby_api(request):
+    """The k nearest open needs and services to a point, ranked by distance.
+
+    Query parameters: ``lat`` and ``lng`` (required), ``radius`` in km,
+    ``limit``, ``type`` (category type), ``category`` and ``service_type``.
+    Each need lists its photos with the URL of every stored size.
+    """
+    try:
+        latitude = float(request.GET['lat'])
+        longitude = float(request.GET['lng'])
+        radius = float(request.GET.get('radius', NEARBY_DEFAULT_RADIUS_KM))
+        limit = int(request.GET.get('limit', NEARBY_DEFAULT_LIMIT))
+    except KeyError as e:
+        return JsonResponse({'error': f'missing parameter {e}'}, status=400)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if not all(math.isfinite(v) for v in (latitude, longitude, radius)):
+        return JsonResponse({'error': 'lat, lng and radius must be finite numbers'}, status=400)
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return JsonResponse({'error': 'lat/lng out of range'}, status=400)
+    radius = min(max(radius, 0), NEARBY_MAX_RADIUS_KM)
+    limit = min(max(limit, 1), NEARBY_MAX_LIMIT)
+    
+    # Services that have already ended are no longer "open"
+    today = timezone.localdate()
+    needs = Need.objects.near(latitude, longitude, radius).filter(
+        Q(service_details__end_date__isnull=True) | Q(service_details__end_date__gte=today),
+        status='open',
+    ).select_related('category', 'disaster', 'service_details').prefetch_related(
+        Prefetch('photos', queryset=Photo.objects.order_by('uploaded_at', 'id')),
+    )
+    
+    entry_type = request.GET.get('type')
+    if entry_type in ['problem', 'service', 'information']:
+        needs = needs.filter(category_type=entry_type)
+    
+    category_id = request.GET.get('category')
+    if category_id:
+        needs = needs.filter(category_id=category_id)
+    
+    service_type = request.GET.get('service_type')
+    if service_type:
+        needs = needs.filter(service_details__service_type=service_type)
+    
     features = []
-    for need in needs:
-        feature = {
-            'type': 'Feature',
-            'geometry': {
-                'type': 'Point',
-                'coordinates': [float(need.longitude), float(need.latitude)]
-            },
-            'properties': {
-                'id': need.id,
-                'title': need.title,
-                'description': need.description[:200] + '...' if len(need.description) > 200 else need.description,
-                'category': need.category.name if need.category else 'Unknown',
-                'category_type': need.category.category_type if need.category else 'unknown',
-                'disaster': need.disaster.name,
-                'location': need.location,
-                'city': need.city,
-                'status': need.status,
-                'priority': need.priority,
-                'is_verified': need.is_verified,
-                'contact_person': need.contact_person,
-                'contact_phone': need.contact_phone,
-                'created_at': need.created_at.isoformat(),
-                'url': f'/needs/{need.id}/'
-            }
-        }
+    for need in needs.order_by_distance(latitude, longitude)[:limit]:
+        distance = geo.haversine_km(latitude, longitude, need.latitude, need.longitude)
+        # The bounding box's corners lie outside the requested circle
+        if distance > radius:
+            continue
+        feature = need_feature(need)
+        feature['properties']['distance_km'] = round(distance, 3)
+        service = getattr(need, 'service_details', None)
+        if service is not None:
+            feature['properties']['service_type'] = service.service_type
+        feature['properties']['photos'] = [photo_dict(photo) for photo in need.photos.all()]
         features.append(feature)
     
-    geojson = {
-        'type': 'FeatureCollection',
-        'features': features
-    }
-    
-    return JsonResponse(geojson)
+    return JsonResponse(feature_collection(features))
+
+
+def export_needs(request):
+    """Stream every need as GeoJSON, NDJSON or CSV for partner GIS tools.
+
+    ``format`` is one of ``geojson`` (default), ``ndjson`` or ``csv``;
+    ``type``, ``disaster`` and ``status`` narrow the export.
+    """
+    fmt = request.GET.get('format', 'geojson')
+    if fmt not in export.FORMATS:
+        return JsonResponse({'error': f"format must be one of {', '.join(export.FORMATS)}"}, status=400)
+    export_format = export.FORMATS[fmt]
+    
+    # Bad filters must fail here: once streaming starts the status is sent
+    disaster_id = request.GET.get('disaster')
+    if disaster_id and not disaster_id.isdigit():
+        return JsonResponse({'error': 'disaster must be an id'}, status=400)
+    
+    entry_type = request.GET.get('type')
+    needs = export.export_needs(
+        entry_type=entry_type if entry_type in ['problem', 'service', 'information'] else None,
+        disaster_id=disaster_id or None,
+        status=request.GET.get('status') or None,
+    )
+    if isinstance(request, ASGIRequest):
+        # A synchronous iterator would be read to the end before sending
+        content = export.achunks(export_format, needs)
+    else:
+        content = export.chunks(export_format, needs)
+    response = StreamingHttpResponse(content, content_type=export_format.content_type)
+    filename = f"needs-{timezone.now():%Y%m%d}.{export_format.extension}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def sync_api(request):
+    """Needs, resources and services changed since a client's last sync.
+
+    Pass the ``next_since`` of the previous response as ``since`` (omit it for
+    a first, full sync) and keep calling while ``complete`` is false. See
+    app.sync for the guarantees.
+    """
+    try:
+        since = request.GET.get('since')
+        since = sync.parse_cursor(since) if since else None
+        limit = min(max(int(request.GET.get('limit') or sync.SYNC_LIMIT), 1), sync.SYNC_MAX_LIMIT)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    return JsonResponse(sync.changes_since(since, limit))
+
+
+async def live_map_events(request):
+    """Server-Sent Events stream of need changes for the live map.
+
+    Accepts the map's ``type`` and ``disaster`` filters. See app.live.
+    """
+    entry_type = request.GET.get('type')
+    disaster_id = request.GET.get('disaster')
+    subscription = live.Subscription(
+        disaster_id=int(disaster_id) if disaster_id and disaster_id.isdigit() else None,
+        entry_type=entry_type if entry_type in ['problem', 'service', 'information'] else None,
+    )
+    last_event_id = request.headers.get('Last-Event-ID')
+    if isinstance(request, ASGIRequest):
+        stream = live.event_stream(subscription, last_event_id)
+    else:
+        # A WSGI worker cannot hold the stream open, so send the catch-up and
+        # let the browser reconnect after RETRY_SECONDS
+        stream = await sync_to_async(live.opening_messages)(subscription, last_event_id)
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx-style proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def prometheus_metrics(request):
+    """Request metrics of this process in the Prometheus text format.
+
+    Needs ``Authorization: Bearer <METRICS_TOKEN>``; without a token set it
+    is only served with DEBUG on. See app.metrics.
+    """
+    token = settings.METRICS_TOKEN
+    if not token and not settings.DEBUG:
+        raise Http404
+    if token and not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse('Unauthorized', status=401, headers={'WWW-Authenticate': 'Bearer'})
+    
+    return HttpResponse(metrics.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
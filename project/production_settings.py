@@ -8,6 +8,8 @@ from .settings import *
 
 # Security Settings
 DEBUG = config('DEBUG', default=False, cast=bool)
+QUERY_BUDGETS = config('QUERY_BUDGETS', default=DEBUG, cast=bool)
+TASKS_EAGER = config('TASKS_EAGER', default=DEBUG, cast=bool)
 SECRET_KEY = config('SECRET_KEY', default='django-insecure-change-this-in-production')
 
 # Allowed Hosts
@@ -63,10 +65,19 @@ X_FRAME_OPTIONS = 'DENY'
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'json': {
+            '()': 'app.metrics.JSONFormatter',
+        },
+    },
     'handlers': {
         'console': {
             'class': 'logging.StreamHandler',
         },
+        'json_console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'json',
+        },
     },
     'root': {
         'handlers': ['console'],
@@ -77,6 +88,11 @@ LOGGING = {
             'level': config('DJANGO_LOG_LEVEL', default='INFO'),
             'propagate': False,
         },
+        'app.requests': {
+            'handlers': ['json_console'],
+            'level': config('REQUEST_LOG_LEVEL', default='INFO'),
+            'propagate': False,
+        },
     },
 }
 
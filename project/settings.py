@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import tempfile
 from pathlib import Path
 from decouple import config, Csv
 import dj_database_url
@@ -45,12 +46,15 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'app.middleware.RequestMetricsMiddleware',
+    'app.middleware.ProfilingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'app.middleware.QueryBudgetMiddleware',
 ]
 
 ROOT_URLCONF = 'project.urls'
@@ -89,6 +93,57 @@ if DATABASE_URL:
     DATABASES['default'] = dj_database_url.parse(DATABASE_URL)
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Local memory by default; set CACHE_DIR to share the cache between worker
+# processes on one machine. production_settings.py switches to Redis when
+# REDIS_URL is set.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'floodlight',
+    }
+}
+
+CACHE_DIR = config('CACHE_DIR', default=None)
+if CACHE_DIR:
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': CACHE_DIR,
+    }
+
+# Seconds a rendered public page may be served from the cache. Writes
+# invalidate pages immediately on a shared cache; with the per-process
+# local-memory cache other workers can lag by up to this long.
+PAGE_CACHE_TIMEOUT = config('PAGE_CACHE_TIMEOUT', default=60, cast=int)
+
+# Log requests that make more queries than app.budgets allows their route
+QUERY_BUDGETS = config('QUERY_BUDGETS', default=DEBUG, cast=bool)
+
+# Share of requests whose database use is measured and that are logged as
+# JSON to app.requests. The other request metrics cover every request.
+METRICS_SAMPLE_RATE = config('METRICS_SAMPLE_RATE', default=0.1, cast=float)
+# Bearer token /metrics requires; without one it is only served with DEBUG on
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Request profiling (see app.profiling) of these view names, e.g.
+# app:needs_list,app:map_data_api. The profiling configuration in the admin
+# switches it at runtime and, once saved, takes precedence.
+PROFILE_ROUTES = config('PROFILE_ROUTES', default='', cast=Csv())
+PROFILE_SAMPLE_EVERY = config('PROFILE_SAMPLE_EVERY', default=10, cast=int)
+PROFILE_SLOW_QUERY_MS = config('PROFILE_SLOW_QUERY_MS', default=100, cast=int)
+PROFILE_DIR = config('PROFILE_DIR', default=str(Path(tempfile.gettempdir()) / 'floodlight-profiles'))
+
+# More gazetteer CSV files (e.g. union councils and villages) for geocoding
+# needs without coordinates, with the columns of app/data/gazetteer.csv
+GAZETTEER_FILES = config('GAZETTEER_FILES', default='', cast=Csv())
+
+# Run background tasks (see app.tasks) inline instead of queueing them for
+# `manage.py run_worker`
+TASKS_EAGER = config('TASKS_EAGER', default=DEBUG, cast=bool)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -156,11 +211,20 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'json': {
+            '()': 'app.metrics.JSONFormatter',
+        },
+    },
     'handlers': {
         'console': {
             'class': 'logging.StreamHandler',
             'level': 'WARNING',
         },
+        'json_console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'json',
+        },
     },
     'root': {
         'handlers': ['console'],
@@ -182,5 +246,11 @@ LOGGING = {
             'level': 'ERROR',
             'propagate': False,
         },
+        'app.requests': {
+            'handlers': ['json_console'],
+            # runserver logs every request already; set INFO to see the samples
+            'level': config('REQUEST_LOG_LEVEL', default='WARNING'),
+            'propagate': False,
+        },
     },
 }